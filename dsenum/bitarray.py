@@ -0,0 +1,82 @@
+from typing import Union
+
+import numpy as np
+
+
+class BitArray:
+    """
+    Fixed-size array of flags packed in bits
+
+    Parameters
+    ----------
+    size: int
+        the number of flags
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._data = np.zeros((size + 7) // 8, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index: int) -> bool:
+        return bool((self._data[index >> 3] >> (index & 7)) & 1)
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+    @property
+    def data(self) -> np.ndarray:
+        """
+        underlying uint8 buffer, flag i is (data[i >> 3] >> (i & 7)) & 1
+        """
+        return self._data
+
+    def get(self, indices: np.ndarray) -> np.ndarray:
+        """
+        return flags of `indices` as bool array
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        return ((self._data[indices >> 3] >> (indices & 7).astype(np.uint8)) & 1).astype(bool)
+
+    def set(self, indices: Union[int, np.ndarray]) -> None:
+        """
+        turn on flags of `indices`. `indices` may contain duplicates
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        masks = np.left_shift(1, indices & 7).astype(np.uint8)
+        np.bitwise_or.at(self._data, indices >> 3, masks)
+
+    def find_unset(self, start: int = 0, block_size: int = 4096) -> int:
+        """
+        return the smallest index >= `start` whose flag is off, or len(self) if all are on.
+        Bytes are scanned `block_size` at a time.
+        """
+        index = start
+        while index < self._size:
+            begin = index >> 3
+            block = self._data[begin : begin + block_size]
+            # flags before `index` in the first byte are regarded as on
+            first = block[0] | np.uint8((1 << (index & 7)) - 1)
+            if first != 0xFF:
+                found = (begin << 3) + _lowest_unset_bit(int(first))
+                return min(found, self._size)
+            not_full = np.nonzero(block[1:] != 0xFF)[0]
+            if len(not_full) > 0:
+                byte = begin + 1 + int(not_full[0])
+                found = (byte << 3) + _lowest_unset_bit(int(self._data[byte]))
+                return min(found, self._size)
+            index = (begin + len(block)) << 3
+        return self._size
+
+    def count(self) -> int:
+        """
+        return the number of turned-on flags
+        """
+        return int(np.unpackbits(self._data).sum())
+
+
+def _lowest_unset_bit(byte: int) -> int:
+    return ((~byte) & (byte + 1)).bit_length() - 1
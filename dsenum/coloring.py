@@ -1,11 +1,36 @@
 from abc import ABCMeta, abstractmethod
-from itertools import permutations
+from itertools import combinations, islice, permutations
+from math import factorial
 from multiprocessing import Pool, cpu_count
-from typing import cast, List, Tuple
+from typing import cast, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import numpy as np
+
+from dsenum.bitarray import BitArray
 from dsenum.permutation_group import DerivativeStructurePermutation
-from dsenum.coloring_generator import BaseColoringGenerator
-from dsenum.core import hash_in_all_configuration, act_permutation  # type: ignore
+from dsenum.stabilizer_chain import StabilizerChain
+from dsenum.translation_group import TranslationGroup
+from dsenum.coloring_generator import (
+    BaseColoringGenerator,
+    ColoringGenerator,
+    FixedConcentrationColoringGenerator,
+    ListBasedColoringGenerator,
+    SublatticeColoringGenerator,
+    get_composition_meeting_permutations,
+    get_composition_preserving_permutations,
+    get_site_color_index,
+)
+from dsenum.core import (  # type: ignore
+    hash_in_all_configuration,
+    act_permutation,
+    act_permutations_batch,
+    direct_enumerate_gray_code,
+    get_composition_batch,
+    is_champion_batch,
+    is_champion_relabeled_batch,
+    relabel_colorings_batch,
+    search_champion_colorings,
+)
 
 
 class AbstractEnumerator(metaclass=ABCMeta):
@@ -18,10 +43,37 @@ class DirectColoringEnumerator(AbstractEnumerator):
     """
     Parameters
     ----------
-    permutation_group: list of permutation
+    permutation_group: list of permutation, or integer array (G, N)
     num_color: int
     cl_generator: BaseColoringGenerator
     color_exchange: bool
+    vectorize: bool
+        if true, store permutation group as (G, N) array and walk each orbit with one gather.
+        Visited colorings are tracked in a bit array indexed by `cl_generator.rank_colorings`
+        while colorings are streamed from `cl_generator.yield_coloring`.
+        Otherwise, apply permutations one by one on colorings from `generate_all_colorings`.
+    gray_code: bool
+        if true, visit colorings of ColoringGenerator in reflected Gray code order, where
+        consecutive colorings differ at one site, and update ranks of all images of the current
+        coloring incrementally. Representatives are the first visited colorings in this order.
+        Only used when vectorize is true.
+    translation_indices: (Optional) array
+        indices of nontrivial translations in `permutation_group`. If given, representatives
+        fixed by one of them, superperiodic colorings, are discarded after their orbits are
+        walked.
+    color_permutations: (Optional) array, (E, num_color)
+        permutations of colors identified with color_exchange, whose first row is identity.
+        By default, `get_color_permutations(cl_generator, num_color)`.
+    n_jobs: int
+        when n_jobs > 1, colorings of ColoringGenerator are split by their compositions, which
+        are kept by permutations of sites, and each composition class is walked in a worker
+        process with its own visited flags. Compositions related by permutations of colors
+        are walked once. Only used when vectorize is true and gray_code is false.
+
+    With color_exchange, colorings of ColoringGenerator without site constraints are identified
+    by relabeling colors by order of first occurrence instead of applying all num_color!
+    permutations of colors. Then only relabeled colorings are marked as visited. This is not
+    used with gray_code, whose incremental update needs all images.
     """
 
     def __init__(
@@ -30,17 +82,74 @@ class DirectColoringEnumerator(AbstractEnumerator):
         num_color: int,
         cl_generator: BaseColoringGenerator,
         color_exchange: bool = True,
+        vectorize: bool = True,
+        gray_code: bool = False,
+        translation_indices: Optional[np.ndarray] = None,
+        color_permutations: Optional[np.ndarray] = None,
+        n_jobs: int = 1,
     ):
         self.permutation_group = permutation_group
         self.num_color = num_color
         self.cl_generator = cl_generator
         self.color_exchange = color_exchange
+        self.vectorize = vectorize
+        self.gray_code = gray_code
+        if n_jobs == -1:
+            self.n_jobs = cpu_count()
+        else:
+            self.n_jobs = n_jobs
+        if translation_indices is not None:
+            self.translation_permutations = get_permutation_array(self.permutation_group)[
+                translation_indices
+            ]
+        else:
+            self.translation_permutations = None
 
-        self.list_colorings, self.flags = self.cl_generator.generate_all_colorings()
+        if self.gray_code and not isinstance(self.cl_generator, ColoringGenerator):
+            raise ValueError("gray_code requires ColoringGenerator")
+
+        if not self.color_exchange:
+            self.color_permutations = np.arange(self.num_color, dtype=np.int8)[np.newaxis, :]
+        elif color_permutations is not None:
+            self.color_permutations = np.ascontiguousarray(color_permutations, dtype=np.int8)
+        else:
+            self.color_permutations = get_color_permutations(self.cl_generator, self.num_color)
+        # coloring space of `cl_generator` is closed under all permutations of colors
+        self.relabel_colors = (
+            self.color_exchange
+            and isinstance(self.cl_generator, ColoringGenerator)
+            and not self.cl_generator.site_constraints
+            and not self.gray_code
+            and len(self.color_permutations) == factorial(self.num_color)
+        )
+
+        if self.vectorize:
+            self.permutation_array = get_permutation_array(self.permutation_group)
+        else:
+            self.list_colorings, self.flags = self.cl_generator.generate_all_colorings()
 
     def _hash(self, coloring: List[int]) -> int:
         return hash_in_all_configuration(coloring, self.num_color)
 
+    def _get_orbit(self, coloring: np.ndarray) -> np.ndarray:
+        coloring = coloring.astype(np.int8)
+        if self.relabel_colors:
+            # (G, N)
+            acted_colorings = act_permutations_batch(
+                self.permutation_array, coloring[np.newaxis, :]
+            )[0]
+            return relabel_colorings_batch(acted_colorings, self.num_color)
+        if self.color_exchange:
+            # (E, N)
+            colorings = self.color_permutations[:, coloring]
+        else:
+            colorings = coloring[np.newaxis, :]
+        # (E or 1, G, N)
+        acted_colorings = act_permutations_batch(
+            self.permutation_array, np.ascontiguousarray(colorings)
+        )
+        return acted_colorings.reshape(-1, len(coloring))
+
     def _walk_orbit(self, coloring: List[int], include_identity: bool = False) -> None:
         offset = 0 if include_identity else 1
         # assume self.permutation_group[0] is identity
@@ -50,6 +159,17 @@ class DirectColoringEnumerator(AbstractEnumerator):
             self.flags[acted_cl_hash] = False
 
     def coset_enumerate(self) -> List[List[int]]:
+        if self.vectorize and self.gray_code:
+            return self._coset_enumerate_gray_code()
+        elif (
+            self.vectorize
+            and self.n_jobs != 1
+            and isinstance(self.cl_generator, ColoringGenerator)
+        ):
+            return self._coset_enumerate_by_composition()
+        elif self.vectorize:
+            return self._coset_enumerate_vectorized()
+
         colorings = []
 
         for cl in self.list_colorings:
@@ -62,14 +182,123 @@ class DirectColoringEnumerator(AbstractEnumerator):
             self._walk_orbit(cl, include_identity=False)
 
             if self.color_exchange:
-                for cl_prm in permutations(range(self.num_color)):
+                for cl_prm in self.color_permutations.tolist():
                     exchanged_cl = [cl_prm[c] for c in cl]
                     exchanged_cl_hash = self._hash(exchanged_cl)
                     if exchanged_cl_hash == cl_hash:
                         continue
                     self._walk_orbit(exchanged_cl, include_identity=True)
 
-        return colorings
+        return self._remove_superperiodic(colorings)
+
+    def _coset_enumerate_vectorized(self) -> List[List[int]]:
+        visited = BitArray(self.cl_generator.num_colorings)
+        colorings = []
+
+        if self.relabel_colors:
+            # the other colorings are visited as permutations of colors of these
+            cl_generator = cast(ColoringGenerator, self.cl_generator)
+            colorings_with_rank = cl_generator.yield_relabeled_coloring_with_rank()
+        else:
+            colorings_with_rank = self.cl_generator.yield_coloring_with_rank()
+
+        for cl, cl_rank in colorings_with_rank:
+            # avoid already-visited coloring
+            if visited[cl_rank]:
+                continue
+            colorings.append(cl)
+
+            acted_ranks = self.cl_generator.rank_colorings(self._get_orbit(np.asarray(cl)))
+            # ignore colorings out of `cl_generator`
+            visited.set(acted_ranks[acted_ranks != -1])
+
+        return self._remove_superperiodic(colorings)
+
+    def _coset_enumerate_by_composition(self) -> List[List[int]]:
+        """
+        walk composition classes in parallel. Each worker returns the representatives of orbits
+        meeting its class, which are the same as those in `_coset_enumerate_vectorized`
+        because they are chosen among whole orbits. An orbit meeting several classes is
+        reported by each of them, and duplicates are dropped by their ranks.
+        """
+        cl_generator = cast(ColoringGenerator, self.cl_generator)
+        if self.color_exchange:
+            color_permutations = self.color_permutations
+        else:
+            color_permutations = self.color_permutations[:1]
+        compositions = get_composition_classes(cl_generator, color_permutations)
+
+        representatives = {}  # type: Dict[int, List[int]]
+        with Pool(
+            self.n_jobs,
+            initializer=_initialize_direct_worker,
+            initargs=(
+                self.permutation_array,
+                color_permutations,
+                cl_generator,
+                self.relabel_colors,
+            ),
+        ) as pool:
+            for shard in pool.imap_unordered(_walk_composition_class_in_worker, compositions):
+                representatives.update(shard)
+
+        colorings = [representatives[rank] for rank in sorted(representatives)]
+        return self._remove_superperiodic(colorings)
+
+    def _coset_enumerate_gray_code(self) -> List[List[int]]:
+        cl_generator = cast(ColoringGenerator, self.cl_generator)
+        rank_weights = cl_generator.rank_weights
+        if rank_weights.dtype == object:
+            raise ValueError("Too many colorings to rank with int64")
+
+        site_colors = cl_generator.get_site_colors()
+        radices = np.array([len(sc) for sc in site_colors], dtype=np.int64)
+        site_colors_array = np.zeros((len(site_colors), max(radices)), dtype=np.int8)
+        for i, sc in enumerate(site_colors):
+            site_colors_array[i, : len(sc)] = sc
+
+        inverse_permutations = np.argsort(self.permutation_array, axis=1)
+        if self.color_exchange:
+            color_permutations = self.color_permutations
+        else:
+            color_permutations = self.color_permutations[:1]
+
+        visited = BitArray(cl_generator.num_colorings)
+        colorings = direct_enumerate_gray_code(
+            np.ascontiguousarray(inverse_permutations, dtype=np.intp),
+            color_permutations,
+            site_colors_array,
+            radices,
+            np.ascontiguousarray(cl_generator.get_rank_digit_table(), dtype=np.int64),
+            rank_weights,
+            visited.data,
+        )
+        colorings = colorings[~self._is_superperiodic(colorings)]
+        if cl_generator.use_all_colors:
+            # Gray code visits all colorings, and orbits of incomplete ones stay incomplete
+            colorings = colorings[get_valid_coloring_mask(colorings, self.num_color)]
+        return colorings.astype(int).tolist()
+
+    def _remove_superperiodic(self, colorings: List[List[int]]) -> List[List[int]]:
+        """
+        drop representatives fixed by one of `self.translation_permutations`.
+        Their orbits are already walked, so the other colorings in them are never visited.
+        """
+        if self.translation_permutations is None or len(colorings) == 0:
+            return colorings
+        superperiodic = self._is_superperiodic(np.array(colorings, dtype=np.int8))
+        return [cl for cl, sp in zip(colorings, superperiodic) if not sp]
+
+    def _is_superperiodic(self, colorings: np.ndarray) -> np.ndarray:
+        """
+        return whether each coloring is fixed by one of `self.translation_permutations`
+        """
+        if self.translation_permutations is None or len(colorings) == 0:
+            return np.zeros(len(colorings), dtype=bool)
+        superperiodic = np.zeros(len(colorings), dtype=bool)
+        for translation in self.translation_permutations:
+            superperiodic |= np.all(colorings[:, translation] == colorings, axis=1)
+        return superperiodic
 
 
 class LexicographicColoringEnumerator(AbstractEnumerator):
@@ -78,12 +307,27 @@ class LexicographicColoringEnumerator(AbstractEnumerator):
 
     Parameters
     ----------
-    permutation_group: list of permutation
+    permutation_group: list of permutation, or integer array (G, N)
     num_color: int
     cl_generator: BaseColoringGenerator
     color_exchange: bool
     n_jobs: int
-        when n_jobs > 1, use multiprocessing but it seems slower than signle core......
+        when n_jobs > 1, test colorings in parallel. The permutation group and `cl_generator`
+        are sent to each worker process once, and each worker generates colorings in a
+        contiguous range of ranks of `cl_generator`, or relabeled colorings with a common
+        prefix, by itself.
+    chunk_size: int
+        the number of colorings tested at once. With n_jobs > 1, also the largest number of
+        colorings generated by each worker at once
+    stabilizer_chain: (Optional) StabilizerChain
+        if given, test colorings by depth-first search over basic transversals of the group
+        instead of its all elements
+    translation_group: (Optional) TranslationGroup
+        if given, colorings which are not smallest among their translations are rejected by
+        cyclic shifts before tested with the whole group
+    color_permutations: (Optional) array, (E, num_color)
+        permutations of colors identified with color_exchange, whose first row is identity.
+        By default, `get_color_permutations(cl_generator, num_color)`.
     """
 
     def __init__(
@@ -93,6 +337,10 @@ class LexicographicColoringEnumerator(AbstractEnumerator):
         cl_generator: BaseColoringGenerator,
         color_exchange: bool = True,
         n_jobs: int = 1,
+        chunk_size: int = 1024,
+        stabilizer_chain: Optional[StabilizerChain] = None,
+        translation_group: Optional[TranslationGroup] = None,
+        color_permutations: Optional[np.ndarray] = None,
     ):
         self.permutation_group = permutation_group
         self.num_color = num_color
@@ -102,50 +350,1144 @@ class LexicographicColoringEnumerator(AbstractEnumerator):
             self.n_jobs = cpu_count()
         else:
             self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.stabilizer_chain = stabilizer_chain
+        self.translation_group = translation_group
+
+        self.permutation_array = get_permutation_array(self.permutation_group)
+        if not self.color_exchange:
+            self.color_permutations = np.arange(self.num_color, dtype=np.int8)[np.newaxis, :]
+        elif color_permutations is not None:
+            self.color_permutations = np.ascontiguousarray(color_permutations, dtype=np.int8)
+        else:
+            self.color_permutations = get_color_permutations(self.cl_generator, self.num_color)
+        num_color_permutations = len(self.color_permutations)
+        # images out of the coloring space never reject colorings
+        self.color_permutations, self.pair_mask, self.unsure_pairs = get_image_pairs(
+            self.permutation_array, self.cl_generator, self.num_color, self.color_permutations
+        )
+        if self.pair_mask is not None:
+            # the stabilizer chain compares prefixes of images regardless of the coloring space
+            self.stabilizer_chain = None
+            if self.translation_group is not None and not self._keeps_site_constraints(
+                self.translation_group
+            ):
+                self.translation_group = None
+        # compare relabeled images instead of applying num_color! permutations of colors
+        self.relabel_colors = (
+            self.color_exchange
+            and num_color_permutations == factorial(self.num_color)
+            and self.pair_mask is None
+            and self.stabilizer_chain is None
+        )
 
     def _hash(self, coloring: List[int]) -> int:
         return hash_in_all_configuration(coloring, self.num_color)
 
+    def _keeps_site_constraints(self, translation_group: TranslationGroup) -> bool:
+        """
+        return whether translations map site constraints of `cl_generator` to themselves, so
+        that translated colorings are compared in advance
+        """
+        if isinstance(self.cl_generator, ListBasedColoringGenerator):
+            # translations may move listed colorings out of the list
+            return False
+        labels = get_site_constraint_labels(self.cl_generator, self.num_color)
+        if labels is None:
+            return True
+        label_ids = {}  # type: Dict[Tuple, int]
+        classes = np.array([[label_ids.setdefault(label, len(label_ids)) for label in labels]])
+        return all(
+            np.array_equal(translation_group.act(classes, translation), classes)
+            for translation in translation_group.translations[1:]
+        )
+
     def _is_champion_coloring(self, coloring: List[int]) -> bool:
         cl_hash = self._hash(coloring)
 
-        if self.color_exchange:
-            for cl_prm in permutations(range(self.num_color)):
-                exchanged_cl = [cl_prm[c] for c in coloring]
-                for prm in self.permutation_group:
-                    acted_cl = act_permutation(prm, exchanged_cl)
-                    acted_cl_hash = self._hash(acted_cl)
-                    if acted_cl_hash < cl_hash:
-                        return False
-        else:
+        if self.relabel_colors:
+            # relabeled coloring is the smallest among all permutations of colors
             for prm in self.permutation_group:
-                acted_cl = act_permutation(prm, coloring)
+                acted_cl = relabel_coloring(act_permutation(prm, coloring))
                 acted_cl_hash = self._hash(acted_cl)
                 if acted_cl_hash < cl_hash:
                     return False
+        else:
+            for e, cl_prm in enumerate(self.color_permutations.tolist()):
+                exchanged_cl = [cl_prm[c] for c in coloring]
+                for g, prm in enumerate(self.permutation_group):
+                    acted_cl = act_permutation(prm, exchanged_cl)
+                    acted_cl_hash = self._hash(acted_cl)
+                    if acted_cl_hash < cl_hash and self._is_in_coloring_space(e, g, acted_cl):
+                        return False
         return True
 
-    def _is_champion_coloring_parallel(self, coloring: List[int]) -> Tuple[List[int], bool]:
-        return coloring, self._is_champion_coloring(coloring)
+    def _is_in_coloring_space(self, e: int, g: int, acted_cl: List[int]) -> bool:
+        if self.pair_mask is None or self.pair_mask[e, g]:
+            return True
+        return self.cl_generator.rank_colorings(np.array([acted_cl]))[0] != -1
 
     def coset_enumerate(self) -> List[List[int]]:
+        relabeled_only = (
+            self.relabel_colors
+            and isinstance(self.cl_generator, ColoringGenerator)
+            and not self.cl_generator.site_constraints
+        )
+        colorings = []
         if self.n_jobs != 1:
-            with Pool(self.n_jobs) as pool:
-                colorings = [
-                    cl
-                    for cl, keep in pool.map(
-                        self._is_champion_coloring_parallel, self.cl_generator.yield_coloring()
-                    )
-                    if keep
-                ]
-        else:
-            colorings = []
-            for cl in self.cl_generator.yield_coloring():
-                if self._is_champion_coloring(cl):
-                    colorings.append(cl)
+            if relabeled_only:
+                # relabeled colorings are split by their prefixes, each of which has at most
+                # chunk_size colorings following it
+                num_elements = self.cl_generator.num_elements
+                prefix_length = num_elements
+                while (
+                    prefix_length > 1
+                    and self.num_color ** (num_elements - prefix_length + 1) <= self.chunk_size
+                ):
+                    prefix_length -= 1
+                prefix_generator = ColoringGenerator(prefix_length, self.num_color)
+                tasks = (
+                    prefix for prefix, _ in prefix_generator.yield_relabeled_coloring_with_rank()
+                )  # type: Iterable
+                worker = _filter_relabeled_champion_colorings_in_worker
+            else:
+                num_colorings = self.cl_generator.num_colorings
+                tasks = (
+                    (start, min(start + self.chunk_size, num_colorings))
+                    for start in range(0, num_colorings, self.chunk_size)
+                )
+                worker = _filter_champion_colorings_in_worker
+            with Pool(
+                self.n_jobs,
+                initializer=_initialize_champion_worker,
+                initargs=(
+                    self.permutation_array,
+                    None if self.relabel_colors else self.color_permutations,
+                    self.stabilizer_chain,
+                    self.translation_group,
+                    self.pair_mask,
+                    self.unsure_pairs,
+                    self.cl_generator,
+                ),
+            ) as pool:
+                # imap consumes tasks lazily and returns results in order of ranks
+                for champions in pool.imap(worker, tasks):
+                    colorings.extend(champions)
+            return colorings
+
+        if relabeled_only:
+            # champions are already smallest among permutations of colors
+            cl_generator = cast(ColoringGenerator, self.cl_generator)
+            candidates = (cl for cl, _ in cl_generator.yield_relabeled_coloring_with_rank())
+        else:
+            candidates = self.cl_generator.yield_coloring()
+        for chunk in yield_chunks(candidates, self.chunk_size):
+            colorings.extend(
+                filter_champion_colorings(
+                    chunk,
+                    self.permutation_array,
+                    None if self.relabel_colors else self.color_permutations,
+                    self.stabilizer_chain,
+                    self.translation_group,
+                    self.pair_mask,
+                    self.unsure_pairs,
+                    self.cl_generator,
+                )
+            )
         return colorings
 
 
+class TreeColoringEnumerator(AbstractEnumerator):
+    """
+    Orderly generation: assign colors to sites 0, 1, ... in depth-first order and prune a
+    partial coloring as soon as some symmetry operation maps its prefix to a lexicographically
+    smaller one. The result is the same as LexicographicColoringEnumerator, but colorings
+    sharing a non-minimal prefix are never generated.
+
+    Parameters
+    ----------
+    permutation_group: list of permutation, or integer array (G, N)
+    num_color: int
+    cl_generator: ColoringGenerator or FixedConcentrationColoringGenerator
+        only site constraints and composition of `cl_generator` are used
+    color_exchange: bool
+    translation_indices: (Optional) array
+        indices of nontrivial translations in `permutation_group`. If given, champions fixed by
+        one of them, superperiodic colorings, are discarded at leaves of the search, where
+        their images are already compared.
+    color_permutations: (Optional) array, (E, num_color)
+        permutations of colors identified with color_exchange, whose first row is identity.
+        By default, `get_color_permutations(cl_generator, num_color)`.
+    """
+
+    def __init__(
+        self,
+        permutation_group: List[List[int]],
+        num_color: int,
+        cl_generator: BaseColoringGenerator,
+        color_exchange: bool = True,
+        translation_indices: Optional[np.ndarray] = None,
+        color_permutations: Optional[np.ndarray] = None,
+    ):
+        self.permutation_group = permutation_group
+        self.num_color = num_color
+        self.cl_generator = cl_generator
+        self.color_exchange = color_exchange
+        if translation_indices is not None:
+            self.translation_indices = np.ascontiguousarray(translation_indices, dtype=np.int64)
+        else:
+            self.translation_indices = None
+
+        self.permutation_array = get_permutation_array(self.permutation_group)
+        if not self.color_exchange:
+            self.color_permutations = np.arange(self.num_color, dtype=np.int8)[np.newaxis, :]
+        elif color_permutations is not None:
+            self.color_permutations = np.ascontiguousarray(color_permutations, dtype=np.int8)
+        else:
+            self.color_permutations = get_color_permutations(self.cl_generator, self.num_color)
+        num_color_permutations = len(self.color_permutations)
+        # prefixes are pruned only by pairs keeping site constraints, and the others are
+        # compared at leaves if their images are in the coloring space
+        self.color_permutations, self.pair_mask, self.unsure_pairs = get_image_pairs(
+            self.permutation_array, self.cl_generator, self.num_color, self.color_permutations
+        )
+        self.relabel_colors = (
+            self.color_exchange
+            and num_color_permutations == factorial(self.num_color)
+            and self.pair_mask is None
+        )
+
+        self._search_constraints = get_search_constraints(self.cl_generator, self.num_color)
+
+    def coset_enumerate(self) -> List[List[int]]:
+        # with color exchange, images are relabeled instead of applying color_permutations
+        colorings = search_champion_colorings(
+            self.permutation_array,
+            self.color_permutations,
+            *self._search_constraints,
+            relabel_colors=self.relabel_colors,
+            use_all_colors=getattr(self.cl_generator, "use_all_colors", False),
+            translation_indices=self.translation_indices,
+            pair_mask=self.pair_mask,
+        )
+        if self.unsure_pairs is not None and len(colorings) > 0:
+            colorings = colorings[
+                is_champion_in_coloring_space(
+                    colorings,
+                    self.permutation_array,
+                    self.color_permutations,
+                    self.unsure_pairs,
+                    self.cl_generator,
+                )
+            ]
+        return colorings.astype(int).tolist()
+
+
+class FactorizedColoringEnumerator(AbstractEnumerator):
+    """
+    Enumerate colorings whose sites are split into independent factors with disjoint sets of
+    allowed colors, e.g. cation and anion sublattices. The coloring space is the Cartesian
+    product of colorings of each factor, and its orbits are enumerated as orbits of orbits:
+    for each representative of the first factor under the group, the orbits of the next
+    factor are enumerated under the stabilizer of the representative, and so on.
+    Colorings of each factor are walked with a bit array as DirectColoringEnumerator, so the
+    whole product is never generated. When a stabilizer is trivial, all colorings of the
+    remaining factors are representatives without walking their orbits.
+    Factors are acted by pairs of symmetry operations and permutations of colors which keep
+    site constraints and each factor. If other pairs map some colorings into the coloring
+    space, representatives in the same orbit under the whole group are merged afterward by the
+    smallest rank of their images in the coloring space.
+
+    Parameters
+    ----------
+    permutation_group: list of permutation, or integer array (G, N)
+    num_color: int
+    cl_generator: ColoringGenerator or FixedConcentrationColoringGenerator
+        only site constraints and composition of `cl_generator` are used
+    color_exchange: bool
+    color_permutations: (Optional) array, (E, num_color)
+        permutations of colors identified with color_exchange, whose first row is identity.
+        By default, `get_color_permutations(cl_generator, num_color)`.
+
+    Attributes
+    ----------
+    factors: list of list of int
+        sites of each factor, ordered by the number of its colorings
+    factor_generators: list of BaseColoringGenerator
+        generators of colorings of each factor
+    merge_orbits: bool
+        whether representatives are merged by pairs which do not keep site constraints or
+        factors
+    """
+
+    def __init__(
+        self,
+        permutation_group: List[List[int]],
+        num_color: int,
+        cl_generator: BaseColoringGenerator,
+        color_exchange: bool = True,
+        color_permutations: Optional[np.ndarray] = None,
+    ):
+        self.permutation_group = permutation_group
+        self.num_color = num_color
+        self.cl_generator = cl_generator
+        self.color_exchange = color_exchange
+
+        self.permutation_array = get_permutation_array(self.permutation_group)
+        if not self.color_exchange:
+            self.color_permutations = np.arange(self.num_color, dtype=np.int8)[np.newaxis, :]
+        elif color_permutations is not None:
+            self.color_permutations = np.ascontiguousarray(color_permutations, dtype=np.int8)
+        else:
+            self.color_permutations = get_color_permutations(self.cl_generator, self.num_color)
+
+        factors, self.factor_generators = get_factor_generators(self.cl_generator, num_color)
+        self.factors = factors
+        num_elements = self.permutation_array.shape[1]
+
+        # pairs of a permutation of sites and one of colors mapping colorings to colorings
+        self.color_permutations, pair_mask, unsure_pairs = get_image_pairs(
+            self.permutation_array, self.cl_generator, num_color, self.color_permutations
+        )
+        if pair_mask is None:
+            pair_mask = np.ones(
+                (len(self.color_permutations), len(self.permutation_array)), dtype=np.uint8
+            )
+        # pairs also keeping each factor form a subgroup acting on each factor
+        keeps_factors = np.ones(len(self.permutation_array), dtype=bool)
+        for sites in self.factors:
+            keeps_factors &= np.all(np.isin(self.permutation_array[:, sites], sites), axis=1)
+        factor_mask = pair_mask.astype(bool) & keeps_factors
+        self._color_indices, self._site_indices = np.nonzero(factor_mask)
+        # the other pairs may map colorings into the coloring space and merge orbits
+        self.merge_orbits = unsure_pairs is not None or not np.array_equal(
+            factor_mask, pair_mask.astype(bool)
+        )
+
+        # permutations of sites of each factor in local indices
+        local_indices = np.zeros(num_elements, dtype=np.int64)
+        self._factor_permutations = []
+        for sites in self.factors:
+            local_indices[sites] = np.arange(len(sites))
+            acted = self.permutation_array[self._site_indices][:, sites]
+            self._factor_permutations.append(local_indices[acted])
+
+        # orbits of each factor under a subgroup, keyed by the factor and the subgroup
+        self._orbits_cache = (
+            {}
+        )  # type: Dict[Tuple[int, bytes], List[Tuple[List[int], np.ndarray]]]
+
+    def coset_enumerate(self) -> List[List[int]]:
+        colorings = []
+        coloring = [0 for _ in range(self.permutation_array.shape[1])]
+        elements = np.arange(len(self._site_indices))
+        self._enumerate_factor(0, elements, coloring, colorings)
+        if not self.merge_orbits:
+            return colorings
+
+        merged = []
+        orbit_keys = set()
+        for cl in colorings:
+            key = self._get_orbit_key(cl)
+            if key not in orbit_keys:
+                orbit_keys.add(key)
+                merged.append(cl)
+        return merged
+
+    def _get_orbit_key(self, coloring: List[int]) -> int:
+        """
+        return the smallest rank of images of `coloring` in the coloring space by the whole
+        group, which is the same over each orbit
+        """
+        num_elements = self.permutation_array.shape[1]
+        cl_array = np.array(coloring, dtype=np.int8)
+        images = self.color_permutations[:, cl_array[self.permutation_array]]
+        ranks = self.cl_generator.rank_colorings(images.reshape(-1, num_elements))
+        return min(ranks[ranks != -1].tolist())
+
+    def _enumerate_factor(
+        self, level: int, elements: np.ndarray, coloring: List[int], colorings: List[List[int]]
+    ) -> None:
+        if level == len(self.factors):
+            colorings.append(list(coloring))
+            return
+
+        sites = self.factors[level]
+        if len(elements) == 1:
+            # only identity is left, so every coloring of the remaining factors is distinct
+            for factor_coloring in self.factor_generators[level].yield_coloring():
+                for i, color in zip(sites, factor_coloring):
+                    coloring[i] = color
+                self._enumerate_factor(level + 1, elements, coloring, colorings)
+            return
+
+        for factor_coloring, stabilizer in self._get_factor_orbits(level, elements):
+            for i, color in zip(sites, factor_coloring):
+                coloring[i] = color
+            self._enumerate_factor(level + 1, stabilizer, coloring, colorings)
+
+    def _get_factor_orbits(
+        self, level: int, elements: np.ndarray
+    ) -> List[Tuple[List[int], np.ndarray]]:
+        """
+        return representatives of orbits of colorings of the `level`-th factor under
+        `elements`, indices of pairs of permutations, and stabilizer of each representative
+        """
+        key = (level, elements.tobytes())
+        if key in self._orbits_cache:
+            return self._orbits_cache[key]
+
+        factor_generator = self.factor_generators[level]
+        site_permutations = self._factor_permutations[level][elements]
+        color_permutations = self.color_permutations[self._color_indices[elements]]
+        visited = BitArray(factor_generator.num_colorings)
+        orbits = []
+        for cl, cl_rank in factor_generator.yield_coloring_with_rank():
+            if visited[cl_rank]:
+                continue
+            cl_array = np.asarray(cl)
+            images = np.take_along_axis(color_permutations, cl_array[site_permutations], axis=1)
+            acted_ranks = factor_generator.rank_colorings(images)
+            visited.set(acted_ranks[acted_ranks != -1])
+            stabilizer = elements[np.all(images == cl_array, axis=1)]
+            orbits.append((cl, stabilizer))
+
+        self._orbits_cache[key] = orbits
+        return orbits
+
+
+def get_factor_generators(
+    cl_generator: BaseColoringGenerator, num_color: int
+) -> Tuple[List[List[int]], List[BaseColoringGenerator]]:
+    """
+    split sites of `cl_generator` into factors whose allowed colors are disjoint, and return
+    sites of each factor and a generator of its colorings. Factors are ordered by the number of
+    their colorings.
+    """
+    if isinstance(cl_generator, FixedConcentrationColoringGenerator):
+        counts = cl_generator.num_elements_each_color  # type: Optional[List[int]]
+    elif isinstance(cl_generator, ColoringGenerator):
+        counts = None
+    else:
+        raise ValueError("Unsupported coloring generator for factorization: ", type(cl_generator))
+    num_elements = cl_generator.num_elements
+    site_constraints = cl_generator.site_constraints or [
+        list(range(num_color)) for _ in range(num_elements)
+    ]
+
+    factors = []
+    factor_generators = []  # type: List[BaseColoringGenerator]
+    for sites, colors in get_independent_factors(site_constraints, num_color):
+        factor_site_constraints = [site_constraints[i] for i in sites]
+        if counts is None:
+            factor_generator = ColoringGenerator(
+                len(sites), num_color, site_constraints=factor_site_constraints
+            )  # type: BaseColoringGenerator
+        else:
+            factor_counts = [cnt if c in colors else 0 for c, cnt in enumerate(counts)]
+            if sum(factor_counts) != len(sites):
+                # no coloring has the composition
+                factor_generator = ListBasedColoringGenerator(num_color, [])
+            else:
+                factor_generator = FixedConcentrationColoringGenerator(
+                    len(sites), num_color, factor_counts, site_constraints=factor_site_constraints
+                )
+        factors.append(sites)
+        factor_generators.append(factor_generator)
+
+    order = sorted(range(len(factors)), key=lambda j: factor_generators[j].num_colorings)
+    return [factors[j] for j in order], [factor_generators[j] for j in order]
+
+
+def get_independent_factors(site_constraints, num_color: int) -> List[Tuple[List[int], List[int]]]:
+    """
+    return pairs of sites and their colors s.t. two sites sharing an allowed color belong to the
+    same pair. The coloring space with `site_constraints` is the product of colorings of each
+    pair.
+    """
+    # union-find over colors
+    parents = list(range(num_color))
+
+    def find(c):
+        while parents[c] != c:
+            parents[c] = parents[parents[c]]
+            c = parents[c]
+        return c
+
+    for sc in site_constraints:
+        for c in sc[1:]:
+            parents[find(c)] = find(sc[0])
+
+    factor_sites = {}  # type: Dict[int, List[int]]
+    for i, sc in enumerate(site_constraints):
+        factor_sites.setdefault(find(sc[0]), []).append(i)
+    return [
+        (sites, [c for c in range(num_color) if find(c) == root])
+        for root, sites in factor_sites.items()
+    ]
+
+
+def get_search_constraints(
+    cl_generator: BaseColoringGenerator, num_color: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    return arguments of `search_champion_colorings` describing the coloring space of
+    `cl_generator`: allowed colors of each site, composition, feasibility table of remaining
+    compositions, and strides of the table. Unused ones are empty.
+    """
+    if isinstance(cl_generator, FixedConcentrationColoringGenerator):
+        num_elements = cl_generator.num_elements
+        site_constraints = cl_generator.site_constraints
+        counts = np.array(cl_generator.num_elements_each_color, dtype=np.int64)
+        if cl_generator._count_table is not None:
+            feasible = (cl_generator._count_table > 0).astype(np.uint8)
+            strides = np.ascontiguousarray(cl_generator._state_strides, dtype=np.int64)
+        else:
+            feasible = np.zeros((0, 0), dtype=np.uint8)
+            strides = np.zeros(0, dtype=np.int64)
+    elif isinstance(cl_generator, ColoringGenerator):
+        num_elements = cl_generator.num_elements
+        site_constraints = cl_generator.site_constraints
+        counts = np.zeros(0, dtype=np.int64)
+        feasible = np.zeros((0, 0), dtype=np.uint8)
+        strides = np.zeros(0, dtype=np.int64)
+    else:
+        raise ValueError("Unsupported coloring generator for tree search: ", type(cl_generator))
+
+    if site_constraints:
+        allowed = get_site_color_index(site_constraints, num_color) != -1
+    else:
+        allowed = np.ones((num_elements, num_color), dtype=bool)
+    return allowed.astype(np.uint8), counts, feasible, strides
+
+
+def get_color_permutations(cl_generator: BaseColoringGenerator, num_color: int) -> np.ndarray:
+    """
+    return permutations of colors which can map a coloring of `cl_generator` to another one, as
+    (E, num_color) int8 array whose first row is identity. Permutations of colors act on
+    compositions, so they should preserve the set of compositions of `cl_generator`. For fixed
+    composition with distinct counts, only identity is left. Listed colorings may have
+    compositions which are not related to each other, so permutations mapping some of them to
+    another are kept.
+    """
+    if isinstance(cl_generator, FixedConcentrationColoringGenerator):
+        compositions = np.array([cl_generator.num_elements_each_color], dtype=np.int64)
+    elif isinstance(cl_generator, ListBasedColoringGenerator) and cl_generator.list_colorings:
+        compositions = np.unique(
+            get_composition_batch(np.array(cl_generator.list_colorings, dtype=np.int8), num_color),
+            axis=0,
+        )
+        return get_composition_meeting_permutations(compositions)
+    elif isinstance(cl_generator, SublatticeColoringGenerator) and all(
+        composition is not None for composition in cl_generator.compositions
+    ):
+        # operations may exchange sublattices, so only the total composition is kept
+        compositions = np.sum(cl_generator.compositions, axis=0, keepdims=True)
+    else:
+        return np.array(list(permutations(range(num_color))), dtype=np.int8)
+    return get_composition_preserving_permutations(compositions)
+
+
+def get_composition_classes(
+    cl_generator: ColoringGenerator, color_permutations: np.ndarray
+) -> List[List[int]]:
+    """
+    return compositions of colorings of `cl_generator`, one for each class of compositions
+    related by permutations of colors in `color_permutations`. Only permutations of colors
+    keeping allowed colors of every site are used, so that each orbit of colorings meets one
+    of the returned compositions.
+
+    Parameters
+    ----------
+    cl_generator: ColoringGenerator
+    color_permutations: array, (E, num_color)
+
+    Returns
+    -------
+    compositions: list of list of int, counts of each color
+    """
+    num_elements = cl_generator.num_elements
+    num_color = cl_generator.num_color
+    if cl_generator.site_constraints:
+        allowed_sets = set(frozenset(sc) for sc in cl_generator.site_constraints)
+        color_permutations = np.array(
+            [
+                cl_prm
+                for cl_prm in color_permutations.tolist()
+                if all(
+                    frozenset(cl_prm[c] for c in allowed) == allowed for allowed in allowed_sets
+                )
+            ]
+        )
+    min_count = 1 if cl_generator.use_all_colors else 0
+
+    compositions = []
+    for bars in combinations(range(num_elements + num_color - 1), num_color - 1):
+        # stars and bars
+        bounds = (-1,) + bars + (num_elements + num_color - 1,)
+        composition = [bounds[c + 1] - bounds[c] - 1 for c in range(num_color)]
+        if min(composition) < min_count:
+            continue
+        # composition of coloring acted by cl_prm, permuted[cl_prm[c]] = composition[c]
+        permuted = np.zeros((len(color_permutations), num_color), dtype=int)
+        np.put_along_axis(permuted, color_permutations, np.array(composition), axis=1)
+        if min(map(tuple, permuted.tolist())) == tuple(composition):
+            compositions.append(composition)
+    return compositions
+
+
+def walk_composition_class(
+    composition: List[int],
+    permutation_array: np.ndarray,
+    color_permutations: np.ndarray,
+    cl_generator: ColoringGenerator,
+    relabel_colors: bool = False,
+    chunk_size: int = 256,
+) -> Dict[int, List[int]]:
+    """
+    walk orbits meeting colorings of `cl_generator` with `composition`, and return the
+    representative of each orbit, its image with the smallest rank in `cl_generator`.
+    Visited colorings are flagged by ranks in the class, so the flags are as large as the
+    class.
+
+    Parameters
+    ----------
+    composition: list of int
+    permutation_array: array, (G, N)
+    color_permutations: array, (E, num_color)
+    cl_generator: ColoringGenerator
+    relabel_colors: bool
+        if true, `color_permutations` are all permutations of colors and `cl_generator` has no
+        site constraints, and images are compared after relabeling colors
+    chunk_size: int
+        the number of unvisited colorings whose images are ranked at once
+
+    Returns
+    -------
+    representatives: dict from rank in `cl_generator` to coloring
+    """
+    class_generator = FixedConcentrationColoringGenerator(
+        cl_generator.num_elements,
+        cl_generator.num_color,
+        composition,
+        site_constraints=cl_generator.site_constraints,
+    )
+    num_colorings = class_generator.num_colorings
+    if num_colorings == 0:
+        return {}
+    num_elements = cl_generator.num_elements
+    # permutations of colors keeping the composition never move colorings out of the class
+    stabilizer = color_permutations[
+        np.all(np.array(composition)[color_permutations] == composition, axis=1)
+    ]
+
+    visited = BitArray(num_colorings)
+    representatives = {}
+    # jump to unvisited colorings instead of streaming all colorings in the class
+    cl_rank = visited.find_unset()
+    while cl_rank < num_colorings:
+        chunk_ranks = []
+        while cl_rank < num_colorings and len(chunk_ranks) < chunk_size:
+            chunk_ranks.append(cl_rank)
+            cl_rank = visited.find_unset(cl_rank + 1)
+        chunk = class_generator.unrank_colorings(np.array(chunk_ranks)).astype(np.int8)
+        # (B, G, N)
+        acted_colorings = act_permutations_batch(permutation_array, chunk)
+        # (B, E', G, N)
+        class_images = stabilizer[:, acted_colorings].swapaxes(0, 1)
+        acted_ranks = class_generator.rank_colorings(
+            class_images.reshape(-1, num_elements)
+        ).reshape(len(chunk), -1)
+
+        # colorings in the chunk may share orbits, so they are checked one by one
+        walked = []
+        for b, rank in enumerate(chunk_ranks):
+            if visited[rank]:
+                continue
+            walked.append(b)
+            visited.set(acted_ranks[b][acted_ranks[b] != -1])
+
+        if relabel_colors:
+            images = relabel_colorings_batch(
+                acted_colorings[walked].reshape(-1, num_elements), cl_generator.num_color
+            )
+        else:
+            images = color_permutations[:, acted_colorings[walked]].swapaxes(0, 1)
+        images = images.reshape(len(walked), -1, num_elements)
+        ranks = cl_generator.rank_colorings(images.reshape(-1, num_elements))
+        # images out of `cl_generator` are never representatives
+        ranks = np.where(ranks == -1, cl_generator.num_colorings, ranks).reshape(len(walked), -1)
+        first = np.argmin(ranks, axis=1)
+        for b, image_index in enumerate(first.tolist()):
+            representatives[int(ranks[b, image_index])] = (
+                images[b, image_index].astype(int).tolist()
+            )
+        cl_rank = visited.find_unset(chunk_ranks[-1] + 1)
+    return representatives
+
+
+def get_constraint_preserving_pairs(
+    permutation_array: np.ndarray,
+    cl_generator: BaseColoringGenerator,
+    num_color: int,
+    color_permutations: np.ndarray,
+) -> np.ndarray:
+    """
+    return whether color_permutations[e] maps site constraints of `cl_generator` at site
+    permutation_array[g][i] to those at site i for all i, as (E, G) bool array
+    """
+    labels = get_site_constraint_labels(cl_generator, num_color)
+    if labels is None or len(set(labels)) == 1:
+        return np.ones((len(color_permutations), len(permutation_array)), dtype=bool)
+
+    distinct_labels = sorted(set(labels))
+    label_ids = {label: i for i, label in enumerate(distinct_labels)}
+    classes = np.array([label_ids[label] for label in labels])
+
+    # permutations of label ids induced by permutations of colors
+    preserving = np.zeros((len(color_permutations), len(permutation_array)), dtype=bool)
+    acted_classes = classes[permutation_array]
+    induced = {}  # type: Dict[Tuple[int, ...], np.ndarray]
+    for e, cl_prm in enumerate(color_permutations.tolist()):
+        mapped = [_permute_label_colors(label, cl_prm) for label in distinct_labels]
+        if not all(label in label_ids for label in mapped):
+            continue
+        ids = tuple(label_ids[label] for label in mapped)
+        if ids not in induced:
+            induced[ids] = np.all(np.array(ids)[acted_classes] == classes, axis=1)
+        preserving[e] = induced[ids]
+    return preserving
+
+
+def get_compatible_pairs(
+    permutation_array: np.ndarray,
+    cl_generator: BaseColoringGenerator,
+    num_color: int,
+    color_permutations: np.ndarray,
+) -> np.ndarray:
+    """
+    return whether color_permutations[e] maps allowed colors at site permutation_array[g][i] to
+    colors some of which are allowed at site i for all i, as (E, G) bool array. The other
+    pairs never map a coloring of `cl_generator` to another one.
+    """
+    site_constraints = getattr(cl_generator, "site_constraints", None)
+    compatible = np.ones((len(color_permutations), len(permutation_array)), dtype=bool)
+    if not site_constraints:
+        return compatible
+
+    allowed = (get_site_color_index(site_constraints, num_color) != -1).astype(np.int64)
+    distinct_allowed, classes = np.unique(allowed, axis=0, return_inverse=True)
+    classes = classes.reshape(-1)
+    acted_classes = classes[permutation_array]
+    for e, cl_prm in enumerate(color_permutations.tolist()):
+        permuted = np.zeros_like(distinct_allowed)
+        permuted[:, cl_prm] = distinct_allowed
+        # meets[d, d']: colors of class d permuted by cl_prm meet colors of class d'
+        meets = np.dot(permuted, distinct_allowed.T) > 0
+        compatible[e] = np.all(meets[acted_classes, classes], axis=1)
+    return compatible
+
+
+def get_list_preserving_pairs(
+    permutation_array: np.ndarray,
+    cl_generator: ListBasedColoringGenerator,
+    color_permutations: np.ndarray,
+    chunk_size: int = 64,
+) -> np.ndarray:
+    """
+    return whether color_permutations[e] and permutation_array[g] map every coloring listed in
+    `cl_generator` to a listed one, as (E, G) bool array. Listed colorings are not assumed to
+    be closed under the group nor permutations of colors.
+    """
+    preserving = np.ones((len(color_permutations), len(permutation_array)), dtype=bool)
+    colorings = np.array(cl_generator.list_colorings, dtype=np.int8)
+    for start in range(0, len(colorings), chunk_size):
+        chunk = np.ascontiguousarray(colorings[start : start + chunk_size])
+        # (E, B, G, N)
+        images = color_permutations[:, act_permutations_batch(permutation_array, chunk)]
+        ranks = cl_generator.rank_colorings(images.reshape(-1, colorings.shape[1]))
+        preserving &= np.all(ranks.reshape(images.shape[:3]) != -1, axis=1)
+    return preserving
+
+
+def get_image_pairs(
+    permutation_array: np.ndarray,
+    cl_generator: BaseColoringGenerator,
+    num_color: int,
+    color_permutations: np.ndarray,
+) -> Tuple[np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    classify pairs of color_permutations[e] and permutation_array[g] by whether they map
+    colorings of `cl_generator` to colorings of `cl_generator`.
+
+    Returns
+    -------
+    color_permutations: array, (E', num_color)
+        color permutations which may map some coloring to a coloring of `cl_generator`
+    pair_mask: uint8 array (E', G), or None
+        whether pair (e, g) always maps colorings of `cl_generator` to its colorings.
+        None if all pairs do so.
+    unsure_pairs: int array (P, 2), or None
+        pairs (e, g) which map some colorings of `cl_generator` out of it, and may map others
+        into it. None if all pairs are in `pair_mask`.
+    """
+    preserving = get_constraint_preserving_pairs(
+        permutation_array, cl_generator, num_color, color_permutations
+    )
+    if isinstance(cl_generator, ListBasedColoringGenerator):
+        preserving &= get_list_preserving_pairs(
+            permutation_array, cl_generator, color_permutations
+        )
+    if np.all(preserving):
+        return color_permutations, None, None
+    compatible = get_compatible_pairs(
+        permutation_array, cl_generator, num_color, color_permutations
+    )
+    # identity is kept as the first row
+    kept = np.any(compatible, axis=1)
+    unsure_pairs = np.argwhere(compatible[kept] & ~preserving[kept])
+    return (
+        np.ascontiguousarray(color_permutations[kept]),
+        preserving[kept].astype(np.uint8),
+        unsure_pairs if len(unsure_pairs) > 0 else None,
+    )
+
+
+def is_champion_in_coloring_space(
+    colorings: np.ndarray,
+    permutation_array: np.ndarray,
+    color_permutations: np.ndarray,
+    pairs: np.ndarray,
+    cl_generator: BaseColoringGenerator,
+) -> np.ndarray:
+    """
+    return whether each coloring is lexicographically smaller than or equal to its images
+    color_permutations[e][coloring[permutation_array[g]]] for (e, g) in `pairs` which are
+    colorings of `cl_generator`. Images out of `cl_generator` are skipped.
+
+    Parameters
+    ----------
+    colorings: int8 array, (B, N)
+    permutation_array: array, (G, N)
+    color_permutations: array, (E, num_color)
+    pairs: int array, (P, 2)
+    cl_generator: BaseColoringGenerator
+
+    Returns
+    -------
+    is_champion: bool array, (B, )
+    """
+    is_champion = np.ones(len(colorings), dtype=bool)
+    acted_sites = permutation_array[pairs[:, 1]]
+    rows = np.arange(len(pairs))
+    for b, coloring in enumerate(colorings):
+        # (P, N)
+        images = color_permutations[pairs[:, 0:1], coloring[acted_sites]]
+        differ = images != coloring
+        first = np.argmax(differ, axis=1)
+        smaller = differ[rows, first] & (images[rows, first] < coloring[first])
+        if np.any(smaller):
+            is_champion[b] = np.all(cl_generator.rank_colorings(images[smaller]) == -1)
+    return is_champion
+
+
+def get_site_constraint_labels(cl_generator: BaseColoringGenerator, num_color: int):
+    """
+    return label of each site, (allowed colors, composition of its sublattice), or None if
+    sites are not constrained individually
+    """
+    site_constraints = getattr(cl_generator, "site_constraints", None)
+    if isinstance(cl_generator, SublatticeColoringGenerator):
+        num_elements = cl_generator.num_elements
+        compositions = [()] * num_elements  # type: List[Tuple[int, ...]]
+        for sites, composition in zip(cl_generator.sublattices, cl_generator.compositions):
+            for i in sites:
+                compositions[i] = tuple(composition) if composition is not None else ()
+    elif site_constraints:
+        num_elements = len(site_constraints)
+        compositions = [()] * num_elements
+    else:
+        return None
+
+    labels = []
+    for i in range(num_elements):
+        allowed = (
+            tuple(sorted(site_constraints[i])) if site_constraints else tuple(range(num_color))
+        )
+        labels.append((allowed, compositions[i]))
+    return labels
+
+
+def _permute_label_colors(label, cl_prm: List[int]):
+    allowed, composition = label
+    permuted_allowed = tuple(sorted(cl_prm[c] for c in allowed))
+    if composition:
+        permuted = [0 for _ in composition]
+        for c, count in enumerate(composition):
+            permuted[cl_prm[c]] = count
+        return permuted_allowed, tuple(permuted)
+    return permuted_allowed, composition
+
+
+def get_permutation_array(permutation_group) -> np.ndarray:
+    """
+    return permutation group as C-contiguous (G, N) integer array. An integer array, such as
+    `DerivativeStructurePermutation.get_symmetry_operation_permutations_array`, is used without
+    conversion
+    """
+    if isinstance(permutation_group, np.ndarray) and permutation_group.dtype in (
+        np.int16,
+        np.int32,
+        np.int64,
+    ):
+        return np.ascontiguousarray(permutation_group)
+    return np.array(permutation_group, dtype=np.intp)
+
+
+def relabel_coloring(coloring: List[int]) -> List[int]:
+    """
+    rename colors by order of first occurrence. The relabeled coloring is the lexicographically
+    smallest among all permutations of colors of `coloring`.
+    """
+    labels = {}  # type: Dict[int, int]
+    return [labels.setdefault(c, len(labels)) for c in coloring]
+
+
+def filter_champion_colorings(
+    colorings: List[List[int]],
+    permutation_array: np.ndarray,
+    color_permutations: Optional[np.ndarray],
+    stabilizer_chain: Optional[StabilizerChain] = None,
+    translation_group: Optional[TranslationGroup] = None,
+    pair_mask: Optional[np.ndarray] = None,
+    unsure_pairs: Optional[np.ndarray] = None,
+    cl_generator: Optional[BaseColoringGenerator] = None,
+) -> List[List[int]]:
+    """
+    return colorings which are lexicographically smallest in their orbits
+
+    Parameters
+    ----------
+    colorings: list of coloring
+    permutation_array: array, (G, N)
+    color_permutations: int8 array, (E, num_color), or None
+        permutations of colors to be identified, including identity. If None, all permutations
+        of colors are identified by comparing images relabeled by order of first occurrence.
+    stabilizer_chain: (Optional) StabilizerChain
+        stabilizer chain of the group of `permutation_array`, used instead of it if given.
+        Requires `color_permutations`.
+    translation_group: (Optional) TranslationGroup
+        translation subgroup of `permutation_array`, used to reject colorings in advance
+    pair_mask: (Optional) uint8 array, (E, G)
+        if given, only images by pairs (e, g) in the mask are compared as usual.
+        Requires `color_permutations`, and `stabilizer_chain` is not used.
+    unsure_pairs: (Optional) int array, (P, 2)
+        pairs (e, g) out of `pair_mask` whose images are compared only if they are colorings
+        of `cl_generator`
+    cl_generator: (Optional) BaseColoringGenerator
+        coloring space of `colorings`, required with `unsure_pairs`
+    """
+    if len(colorings) == 0:
+        return []
+    colorings_array = np.array(colorings, dtype=np.int8)
+    keep = np.ones(len(colorings), dtype=bool)
+    if translation_group is not None:
+        keep = translation_group.is_translation_champions(colorings_array)
+    candidates = np.nonzero(keep)[0]
+    if len(candidates) > 0:
+        if pair_mask is not None:
+            keep[candidates] = is_champion_batch(
+                permutation_array, colorings_array[candidates], color_permutations, pair_mask
+            )
+            candidates = np.nonzero(keep)[0]
+            if unsure_pairs is not None and len(candidates) > 0:
+                keep[candidates] = is_champion_in_coloring_space(
+                    colorings_array[candidates],
+                    permutation_array,
+                    color_permutations,
+                    unsure_pairs,
+                    cast(BaseColoringGenerator, cl_generator),
+                )
+        elif stabilizer_chain is not None:
+            keep[candidates] = stabilizer_chain.is_champion_colorings(
+                colorings_array[candidates], color_permutations
+            )
+        elif color_permutations is None:
+            keep[candidates] = is_champion_relabeled_batch(
+                permutation_array, colorings_array[candidates], int(colorings_array.max()) + 1
+            )
+        else:
+            keep[candidates] = is_champion_batch(
+                permutation_array, colorings_array[candidates], color_permutations
+            )
+    return [cl for cl, kp in zip(colorings, keep) if kp]
+
+
+def get_valid_coloring_mask(
+    colorings: np.ndarray,
+    num_color: int,
+    translation_group: Optional[TranslationGroup] = None,
+    remove_incomplete: bool = True,
+    used_colors: Optional[List[int]] = None,
+) -> np.ndarray:
+    """
+    return whether each coloring is left by the post-filters
+
+    Parameters
+    ----------
+    colorings: int8 array, (num, N)
+    num_color: int
+    translation_group: (Optional) TranslationGroup
+        if given, reject colorings fixed by some nontrivial translation
+    remove_incomplete: bool
+        if true, reject colorings which do not use all colors
+    used_colors: (Optional) list of int
+        colors regarded as used in every coloring
+
+    Returns
+    -------
+    keep: bool array, (num, )
+    """
+    keep = np.ones(len(colorings), dtype=bool)
+    if len(colorings) == 0:
+        return keep
+    if remove_incomplete:
+        composition = get_composition_batch(colorings, num_color)
+        if used_colors:
+            composition[:, used_colors] += 1
+        keep = np.all(composition > 0, axis=1)
+    if translation_group is not None:
+        # only colorings left are shifted
+        candidates = np.nonzero(keep)[0]
+        keep[candidates] = ~translation_group.is_superperiodic(colorings[candidates])
+    return keep
+
+
+def yield_chunks(iterable, chunk_size: int):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# arguments of `filter_champion_colorings` in each worker process, and the coloring space
+_champion_worker_args = None
+
+
+def _initialize_champion_worker(
+    permutation_array: np.ndarray,
+    color_permutations: Optional[np.ndarray],
+    stabilizer_chain: Optional[StabilizerChain],
+    translation_group: Optional[TranslationGroup],
+    pair_mask: Optional[np.ndarray],
+    unsure_pairs: Optional[np.ndarray],
+    cl_generator: BaseColoringGenerator,
+):
+    global _champion_worker_args
+    _champion_worker_args = (
+        permutation_array,
+        color_permutations,
+        stabilizer_chain,
+        translation_group,
+        pair_mask,
+        unsure_pairs,
+        cl_generator,
+    )
+
+
+def _filter_champion_colorings_in_worker(rank_range: Tuple[int, int]) -> List[List[int]]:
+    cl_generator = _champion_worker_args[-1]
+    colorings = get_colorings_in_rank_range(cl_generator, *rank_range)
+    return _filter_champion_colorings_by_worker(colorings)
+
+
+def _filter_relabeled_champion_colorings_in_worker(prefix: List[int]) -> List[List[int]]:
+    cl_generator = cast(ColoringGenerator, _champion_worker_args[-1])
+    colorings = [cl for cl, _ in cl_generator.yield_relabeled_coloring_with_rank(prefix)]
+    return _filter_champion_colorings_by_worker(colorings)
+
+
+def _filter_champion_colorings_by_worker(colorings: List[List[int]]) -> List[List[int]]:
+    (
+        permutation_array,
+        color_permutations,
+        stabilizer_chain,
+        translation_group,
+        pair_mask,
+        unsure_pairs,
+        cl_generator,
+    ) = cast(
+        Tuple[
+            np.ndarray,
+            Optional[np.ndarray],
+            Optional[StabilizerChain],
+            Optional[TranslationGroup],
+            Optional[np.ndarray],
+            Optional[np.ndarray],
+            BaseColoringGenerator,
+        ],
+        _champion_worker_args,
+    )
+    return filter_champion_colorings(
+        colorings,
+        permutation_array,
+        color_permutations,
+        stabilizer_chain,
+        translation_group,
+        pair_mask,
+        unsure_pairs,
+        cl_generator,
+    )
+
+
+def get_colorings_in_rank_range(
+    cl_generator: BaseColoringGenerator, start: int, stop: int
+) -> List[List[int]]:
+    """
+    return colorings of `cl_generator.yield_coloring` with ranks in [start, stop), in the same
+    order
+    """
+    if stop - 1 <= np.iinfo(np.int64).max:
+        ranks = np.arange(start, stop, dtype=np.int64)
+    else:
+        # keep ranks exact with arbitrary-precision integers
+        ranks = np.array(range(start, stop), dtype=object)
+    colorings = cl_generator.unrank_colorings(ranks)
+    num_color = cl_generator.num_color
+    if len(colorings) > 0 and getattr(cl_generator, "use_all_colors", False):
+        # colorings skipped by `yield_coloring`
+        uses_all = np.all(
+            np.any(colorings[:, :, np.newaxis] == np.arange(num_color), axis=1), axis=1
+        )
+        colorings = colorings[uses_all]
+    return colorings.tolist()
+
+
+# arguments of `walk_composition_class` in each worker process
+_direct_worker_args = None
+
+
+def _initialize_direct_worker(
+    permutation_array: np.ndarray,
+    color_permutations: np.ndarray,
+    cl_generator: ColoringGenerator,
+    relabel_colors: bool,
+):
+    global _direct_worker_args
+    _direct_worker_args = (permutation_array, color_permutations, cl_generator, relabel_colors)
+
+
+def _walk_composition_class_in_worker(composition: List[int]) -> Dict[int, List[int]]:
+    permutation_array, color_permutations, cl_generator, relabel_colors = cast(
+        Tuple[np.ndarray, np.ndarray, ColoringGenerator, bool], _direct_worker_args
+    )
+    return walk_composition_class(
+        composition, permutation_array, color_permutations, cl_generator, relabel_colors
+    )
+
+
 class SiteColoringEnumerator(object):
     """
     Parameters
@@ -154,8 +1496,14 @@ class SiteColoringEnumerator(object):
     num_color: int
     color_exchange: bool
     remove_superperiodic: bool
-    method: "direct" or "lexicographic", so far
-    n_jobs: int, use only when method is "lexicographic"
+    method: "direct", "lexicographic", "tree", or "factorized"
+    n_jobs: int, use only when method is "direct" or "lexicographic"
+    use_stabilizer_chain: bool, use only when method is "lexicographic"
+        if true, test colorings with a stabilizer chain of the permutation group
+    fixed_colors: (Optional) list of int
+        colors of sites left out of `ds_permutation`, e.g. sites allowed only one color.
+        They are regarded as used for `remove_incomplete`, and are not exchanged with other
+        colors.
     """
 
     def __init__(
@@ -168,6 +1516,8 @@ class SiteColoringEnumerator(object):
         remove_incomplete: bool = True,
         method: str = "direct",
         n_jobs: int = 1,
+        use_stabilizer_chain: bool = False,
+        fixed_colors: Optional[List[int]] = None,
     ):
         self.num_color = num_color
         self.ds_permutation = ds_permutation
@@ -177,8 +1527,31 @@ class SiteColoringEnumerator(object):
         self.remove_incomplete = remove_incomplete
         self.method = method
         self.n_jobs = n_jobs
+        self.fixed_colors = sorted(set(fixed_colors)) if fixed_colors else []
 
-        self.permutation_group = self.ds_permutation.get_symmetry_operation_permutations()
+        if self.fixed_colors and self.color_exchange:
+            color_permutations = get_color_permutations(self.cl_generator, self.num_color)
+            color_permutations = color_permutations[
+                np.all(color_permutations[:, self.fixed_colors] == self.fixed_colors, axis=1)
+            ]
+        else:
+            color_permutations = None
+
+        # the whole group is kept even with site constraints: an operation moving them may
+        # still map a coloring to another one, and each method skips images out of the space
+        self.permutation_group = self.ds_permutation.get_symmetry_operation_permutations_array()
+        self.translation_group = self.ds_permutation.get_translation_group()
+        if self.remove_superperiodic:
+            # permutation_group is ordered by translations and then rigid operations
+            num_rigid = len(self.ds_permutation.prm_rigid_array)
+            translation_indices = np.arange(1, self.translation_group.order) * num_rigid
+        else:
+            translation_indices = None
+        # direct and tree methods discard superperiodic colorings in their search
+        self._superperiodic_removed = self.remove_superperiodic and self.method in (
+            "direct",
+            "tree",
+        )
 
         # typing.cast causes no runtime effect
         if self.method == "direct":
@@ -189,6 +1562,9 @@ class SiteColoringEnumerator(object):
                     self.num_color,
                     self.cl_generator,
                     color_exchange=color_exchange,
+                    translation_indices=translation_indices,
+                    color_permutations=color_permutations,
+                    n_jobs=self.n_jobs,
                 ),
             )
         elif self.method == "lexicographic":
@@ -200,45 +1576,75 @@ class SiteColoringEnumerator(object):
                     self.cl_generator,
                     color_exchange=color_exchange,
                     n_jobs=self.n_jobs,
+                    stabilizer_chain=(
+                        self.ds_permutation.get_stabilizer_chain()
+                        if use_stabilizer_chain
+                        else None
+                    ),
+                    color_permutations=color_permutations,
+                ),
+            )
+        elif self.method == "tree":
+            self.clenum = cast(
+                AbstractEnumerator,
+                TreeColoringEnumerator(
+                    self.permutation_group,
+                    self.num_color,
+                    self.cl_generator,
+                    color_exchange=color_exchange,
+                    translation_indices=translation_indices,
+                    color_permutations=color_permutations,
+                ),
+            )
+        elif self.method == "factorized":
+            self.clenum = cast(
+                AbstractEnumerator,
+                FactorizedColoringEnumerator(
+                    self.permutation_group,
+                    self.num_color,
+                    self.cl_generator,
+                    color_exchange=color_exchange,
+                    color_permutations=color_permutations,
                 ),
             )
         else:
             raise ValueError("Unknown method: ", self.method)
 
     @property
-    def translation_permutations(self) -> List[List[int]]:
-        return self.ds_permutation.prm_t
+    def translation_permutations(self) -> np.ndarray:
+        return self.ds_permutation.prm_t_array
 
     def _hash(self, coloring: List[int]) -> int:
         return hash_in_all_configuration(coloring, self.num_color)
 
     def unique_colorings(self) -> List[List[int]]:
         symmetry_uniqued_coloring = self.clenum.coset_enumerate()
-        colorings = []
-
-        for cl in symmetry_uniqued_coloring:
-            if self.remove_incomplete and (not self._has_all_colors(cl)):
-                continue
-            if self.remove_superperiodic and self._is_superperiodic(cl):
-                continue
-            colorings.append(cl)
-
-        return colorings
-
-    def _has_all_colors(self, coloring: List[int]) -> bool:
-        if len(set(coloring)) == self.num_color:
-            return True
-        else:
-            return False
+        return list(
+            self.yield_filtered_colorings(
+                symmetry_uniqued_coloring, check_superperiodic=not self._superperiodic_removed
+            )
+        )
 
-    def _is_superperiodic(self, coloring: List[int]) -> bool:
-        # assume self.translation_permutations[0] is identity
-        if any(
-            [
-                self._hash(act_permutation(prm, coloring)) == self._hash(coloring)
-                for prm in self.translation_permutations[1:]
-            ]
-        ):
-            return True
-        else:
-            return False
+    def yield_filtered_colorings(
+        self,
+        colorings: Iterable[List[int]],
+        chunk_size: int = 65536,
+        check_superperiodic: bool = True,
+    ) -> Iterator[List[int]]:
+        """
+        yield colorings left by `remove_incomplete` and `remove_superperiodic` in order.
+        Colorings are consumed lazily and tested in chunks of `chunk_size`.
+        If check_superperiodic is false, superperiodic colorings are assumed to be removed.
+        """
+        use_translations = self.remove_superperiodic and check_superperiodic
+        for chunk in yield_chunks(colorings, chunk_size):
+            keep = get_valid_coloring_mask(
+                np.array(chunk, dtype=np.int8),
+                self.num_color,
+                self.translation_group if use_translations else None,
+                self.remove_incomplete,
+                self.fixed_colors,
+            )
+            for cl, kp in zip(chunk, keep):
+                if kp:
+                    yield cl
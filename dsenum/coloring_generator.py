@@ -1,11 +1,22 @@
 from abc import ABCMeta, abstractmethod
-from itertools import product
-from typing import List
+from itertools import accumulate, permutations, product
+from math import factorial
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 from sympy.utilities.iterables import multiset_permutations
 
-from dsenum.core import get_composition, hash_in_all_configuration  # type: ignore
+from dsenum.core import (  # type: ignore
+    get_composition,
+    hash_in_all_configuration,
+    hash_colorings_batch,
+)
+
+# the largest number of entries in a table used for ranking fixed-concentration colorings
+MAX_COUNT_TABLE_SIZE = 1 << 22
+
+# hashes wider than 64 bits are stored as two words, compared in (high, low) order
+HASH128_DTYPE = np.dtype([("high", np.uint64), ("low", np.uint64)])
 
 
 class BaseColoringGenerator(metaclass=ABCMeta):
@@ -17,9 +28,57 @@ class BaseColoringGenerator(metaclass=ABCMeta):
     def yield_coloring(self):
         raise NotImplementedError
 
+    @property
+    @abstractmethod
+    def num_colorings(self) -> int:
+        """
+        size of index space returned by `rank_colorings`
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def rank_colorings(self, colorings: np.ndarray) -> np.ndarray:
+        """
+        Parameters
+        ----------
+        colorings: array, (num, num_elements)
+
+        Returns
+        -------
+        ranks: array, (num, )
+            index of each coloring in [0, self.num_colorings), or -1 if a coloring is out of
+            this coloring space
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def unrank_coloring(self, rank: int) -> List[int]:
+        """
+        inverse of `rank_colorings`
+        """
+        raise NotImplementedError
+
+    def unrank_colorings(self, ranks: np.ndarray) -> np.ndarray:
+        """
+        inverse of `rank_colorings` for each of `ranks`, (num, num_elements)
+        """
+        colorings = [self.unrank_coloring(rank) for rank in np.asarray(ranks).tolist()]
+        if not colorings:
+            return np.zeros((0, 0), dtype=int)
+        return np.array(colorings, dtype=int)
+
+    def yield_coloring_with_rank(self):
+        """
+        yield pairs of coloring and its rank in the order of `yield_coloring`
+        """
+        for cl in self.yield_coloring():
+            yield cl, self.rank_colorings(np.array([cl]))[0]
+
 
 class ColoringGenerator(BaseColoringGenerator):
-    def __init__(self, num_elements: int, num_color: int, site_constraints=None):
+    def __init__(
+        self, num_elements: int, num_color: int, site_constraints=None, use_all_colors=False
+    ):
         """
         Parameters
         ----------
@@ -29,24 +88,86 @@ class ColoringGenerator(BaseColoringGenerator):
             the number of color
         site_constraints: list of list of int, optional
             the length of this list should be equal to `num_elements`
+        use_all_colors: bool, optional
+            if true, skip colorings which do not use all colors. Such colorings are mapped to
+            each other by symmetry operations and permutations of colors. Ranks are the same as
+            use_all_colors=False, and `yield_minimal_change_coloring` still visits all colorings.
         """
         self.num_elements = num_elements
         self.num_color = num_color
+        self.use_all_colors = use_all_colors
 
         if site_constraints is not None:
             assert len(site_constraints) == self.num_elements
         self.site_constraints = site_constraints
 
+        if self.site_constraints:
+            radices = [len(sc) for sc in self.site_constraints]
+            self._site_color_index = get_site_color_index(self.site_constraints, self.num_color)
+        else:
+            radices = [self.num_color] * self.num_elements
+        self._num_colorings = int(np.prod(radices, dtype=object))
+        self._rank_weights = get_mixed_radix_weights(radices)
+
+    @property
+    def num_colorings(self) -> int:
+        return self._num_colorings
+
+    def rank_colorings(self, colorings: np.ndarray) -> np.ndarray:
+        colorings = np.asarray(colorings)
+        if self.site_constraints:
+            compressed = self._site_color_index[np.arange(self.num_elements), colorings]
+            ranks = np.dot(compressed.astype(self._rank_weights.dtype), self._rank_weights)
+            ranks[np.any(compressed == -1, axis=1)] = -1
+        else:
+            ranks = np.dot(colorings.astype(self._rank_weights.dtype), self._rank_weights)
+        return ranks
+
+    def yield_coloring_with_rank(self):
+        # `_yield_all_colorings` is in increasing order of ranks
+        for cl, rank in enumerate_with_rank(self._yield_all_colorings()):
+            if self._uses_all_colors(cl):
+                yield cl, rank
+
+    def unrank_coloring(self, rank: int) -> List[int]:
+        coloring = []
+        for i, weight in enumerate(self._rank_weights.tolist()):
+            digit, rank = divmod(rank, weight)
+            if self.site_constraints:
+                coloring.append(self.site_constraints[i][digit])
+            else:
+                coloring.append(digit)
+        return coloring
+
+    def unrank_colorings(self, ranks: np.ndarray) -> np.ndarray:
+        ranks = np.asarray(ranks).astype(self._rank_weights.dtype)
+        site_colors = self.get_site_colors()
+        radices = np.array([len(sc) for sc in site_colors])
+        # digits of mixed-radix numbers, the first one is the most significant
+        digits = ((ranks[:, np.newaxis] // self._rank_weights) % radices).astype(np.int64)
+        if not self.site_constraints:
+            return digits
+        colorings = np.empty_like(digits)
+        for i, sc in enumerate(site_colors):
+            colorings[:, i] = np.array(sc)[digits[:, i]]
+        return colorings
+
     def generate_all_colorings(self):
         if self.site_constraints:
             list_colorings = []
             flags = dict()
             for cl_compressed in product(*[range(len(sc)) for sc in self.site_constraints]):
                 cl = [self.site_constraints[i][idx] for i, idx in enumerate(cl_compressed)]
+                if not self._uses_all_colors(cl):
+                    continue
                 list_colorings.append(cl)
                 flags[hash_in_all_configuration(cl, self.num_color)] = True
         else:
-            list_colorings = list(product(range(self.num_color), repeat=self.num_elements))
+            list_colorings = [
+                cl
+                for cl in product(range(self.num_color), repeat=self.num_elements)
+                if self._uses_all_colors(cl)
+            ]
             flags = {
                 hash_in_all_configuration(list(coloring), self.num_color): True
                 for coloring in list_colorings
@@ -55,6 +176,14 @@ class ColoringGenerator(BaseColoringGenerator):
         return list_colorings, flags
 
     def yield_coloring(self):
+        for cl in self._yield_all_colorings():
+            if self._uses_all_colors(cl):
+                yield cl
+
+    def _uses_all_colors(self, coloring) -> bool:
+        return (not self.use_all_colors) or len(set(coloring)) == self.num_color
+
+    def _yield_all_colorings(self):
         if self.site_constraints:
             for cl_compressed in product(*[range(len(sc)) for sc in self.site_constraints]):
                 cl = [self.site_constraints[i][idx] for i, idx in enumerate(cl_compressed)]
@@ -63,6 +192,108 @@ class ColoringGenerator(BaseColoringGenerator):
             for cl in product(range(self.num_color), repeat=self.num_elements):
                 yield list(cl)
 
+    def yield_relabeled_coloring_with_rank(self, prefix: Optional[List[int]] = None):
+        """
+        yield pairs of coloring and its rank for colorings whose colors first occur in the order
+        of 0, 1, ..., in the order of `yield_coloring`. Each coloring is mapped to exactly one of
+        them by permutations of colors. Only available without site constraints.
+
+        Parameters
+        ----------
+        prefix: (Optional) list of int
+            if given, yield only colorings starting with `prefix`, whose colors should also
+            first occur in the order of 0, 1, ...
+        """
+        assert not self.site_constraints
+        if self.num_elements == 0:
+            if self._uses_all_colors([]):
+                yield [], 0
+            return
+
+        weights = self._rank_weights.tolist()
+        # coloring[0] is always 0
+        num_fixed = len(prefix) if prefix else 1
+        coloring = (list(prefix) if prefix else [0]) + [0] * (self.num_elements - num_fixed)
+        # largest[i] = max(coloring[:i + 1])
+        largest = list(accumulate(coloring, max))
+        rank = sum(c * w for c, w in zip(coloring, weights))
+        if self._uses_all_colors(coloring):
+            yield list(coloring), rank
+
+        while True:
+            # coloring[i] <= largest[i - 1] + 1, and sites in the prefix are kept
+            site = self.num_elements - 1
+            while site >= num_fixed:
+                if coloring[site] < min(largest[site - 1] + 1, self.num_color - 1):
+                    break
+                site -= 1
+            if site < num_fixed:
+                return
+
+            for j in range(site + 1, self.num_elements):
+                rank -= coloring[j] * weights[j]
+                coloring[j] = 0
+            coloring[site] += 1
+            rank += weights[site]
+            largest[site] = max(largest[site - 1], coloring[site])
+            for j in range(site + 1, self.num_elements):
+                largest[j] = largest[site]
+            if self.use_all_colors and largest[-1] != self.num_color - 1:
+                continue
+            yield list(coloring), rank
+
+    def yield_minimal_change_coloring(self):
+        """
+        yield pairs of coloring and the site changed from the previous coloring in reflected
+        mixed-radix Gray code order, where consecutive colorings differ at exactly one site.
+        The changed site of the first coloring is -1.
+        """
+        site_colors = self.get_site_colors()
+        digits = [0 for _ in range(self.num_elements)]
+        directions = [1 for _ in range(self.num_elements)]
+        coloring = [sc[0] for sc in site_colors]
+        yield list(coloring), -1
+
+        while True:
+            # the last site changes most frequently as `yield_coloring`
+            site = self.num_elements - 1
+            while site >= 0:
+                digit = digits[site] + directions[site]
+                if 0 <= digit < len(site_colors[site]):
+                    break
+                directions[site] = -directions[site]
+                site -= 1
+            if site < 0:
+                return
+
+            digits[site] = digit
+            coloring[site] = site_colors[site][digit]
+            yield list(coloring), site
+
+    def get_site_colors(self) -> List[List[int]]:
+        """
+        return allowed colors of each site in the order of digits of ranks
+        """
+        if self.site_constraints:
+            return [list(sc) for sc in self.site_constraints]
+        else:
+            return [list(range(self.num_color)) for _ in range(self.num_elements)]
+
+    def get_rank_digit_table(self) -> np.ndarray:
+        """
+        return table (num_elements, num_color) s.t. rank of a coloring is
+        sum_i table[i, coloring[i]] * weights[i], where weights is `self.rank_weights`.
+        Entries for disallowed colors are -1.
+        """
+        if self.site_constraints:
+            return self._site_color_index
+        else:
+            return np.tile(np.arange(self.num_color, dtype=np.int64), (self.num_elements, 1))
+
+    @property
+    def rank_weights(self) -> np.ndarray:
+        return self._rank_weights
+
 
 class ListBasedColoringGenerator(BaseColoringGenerator):
     """
@@ -75,6 +306,33 @@ class ListBasedColoringGenerator(BaseColoringGenerator):
     def __init__(self, num_color, list_colorings):
         self.num_color = num_color
         self.list_colorings = list_colorings
+        self._hasher = None
+        self._rank_table = None
+
+    @property
+    def num_colorings(self) -> int:
+        return len(self.list_colorings)
+
+    def rank_colorings(self, colorings: np.ndarray) -> np.ndarray:
+        colorings = np.asarray(colorings)
+        if self._rank_table is None:
+            # sorted hashes and index of their first occurrence in self.list_colorings
+            self._hasher = ColoringHasher(colorings.shape[1], self.num_color)
+            self._rank_table = np.unique(
+                self._hasher.hash_colorings(np.array(self.list_colorings)), return_index=True
+            )
+
+        sorted_hashes, first_indices = self._rank_table
+        if len(sorted_hashes) == 0:
+            return -np.ones(colorings.shape[0], dtype=np.int64)
+        hashes = self._hasher.hash_colorings(colorings)
+        pos = np.minimum(np.searchsorted(sorted_hashes, hashes), len(sorted_hashes) - 1)
+        found = sorted_hashes[pos] == hashes
+        ranks = np.where(found, first_indices[pos], -1).astype(np.int64)
+        return ranks
+
+    def unrank_coloring(self, rank: int) -> List[int]:
+        return list(self.list_colorings[rank])
 
     def generate_all_colorings(self):
         flags = {
@@ -99,13 +357,21 @@ class FixedConcentrationColoringGenerator(BaseColoringGenerator):
         num_elements % sum(color_ratio) == 0
     site_constraints: (Optional), list (num_elements, num_color)
         e.g. site_constraints[2] = [0, 3, 4] means color of site-2 must be 0, 3, or 4.
+    use_all_colors: (Optional) bool
+        if true, generate no coloring when the composition has a zero count
     """
 
     def __init__(
-        self, num_elements: int, num_color: int, color_ratio: List[float], site_constraints=None
+        self,
+        num_elements: int,
+        num_color: int,
+        color_ratio: List[float],
+        site_constraints=None,
+        use_all_colors=False,
     ):
         self.num_elements = num_elements
         self.num_color = num_color
+        self.use_all_colors = use_all_colors
 
         self.site_constraints = site_constraints
 
@@ -117,45 +383,660 @@ class FixedConcentrationColoringGenerator(BaseColoringGenerator):
         factor = num_elements // ratio_sum
         self.num_elements_each_color = [int(np.around(factor * cr)) for cr in self.color_ratio]
 
-    def generate_all_colorings(self):
-        if self.site_constraints:
-            list_colorings = []
-            flags = dict()
-            # Apply site_constraints first
-            for cl_compressed in product(*[range(len(sc)) for sc in self.site_constraints]):
-                cl = [self.site_constraints[i][idx] for i, idx in enumerate(cl_compressed)]
-                if get_composition(cl, self.num_color) == self.num_elements_each_color:
-                    list_colorings.append(cl)
-                    flags[hash_in_all_configuration(cl, self.num_color)] = True
+        # ranking with a table of completion counts takes fewer numpy calls than ranking with
+        # multinomial coefficients, but the size of the table grows as prod(n_i + 1)
+        num_states = int(np.prod([cnt + 1 for cnt in self.num_elements_each_color]))
+        if self.site_constraints or num_states * (num_elements + 1) <= MAX_COUNT_TABLE_SIZE:
+            table_site_constraints = self.site_constraints or [
+                list(range(self.num_color)) for _ in range(self.num_elements)
+            ]
+            self._count_table, self._state_strides = get_completion_count_table(
+                table_site_constraints, self.num_elements_each_color
+            )
+            # a color with zero count shares its stride with another color, so it is excluded
+            # here rather than by the encoded composition
+            self._allowed = (
+                get_site_color_index(table_site_constraints, self.num_color) != -1
+            ) & (np.array(self.num_elements_each_color) > 0)
+            self._num_colorings = int(self._count_table[0, -1])
         else:
-            first_coloring = []
-            for i in range(self.num_color):
-                first_coloring.extend([i for _ in range(self.num_elements_each_color[i])])
+            self._count_table = None
+            self._num_colorings = get_multinomial(self.num_elements_each_color)
 
-            # TODO: inefficient to cast to list
-            list_colorings = list(multiset_permutations(first_coloring))
-            flags = {
-                hash_in_all_configuration(coloring, self.num_color): True
-                for coloring in list_colorings
-            }
+    @property
+    def num_colorings(self) -> int:
+        return self._num_colorings
+
+    def rank_colorings(self, colorings: np.ndarray) -> np.ndarray:
+        """
+        rank colorings in lexicographic order of colorings with the fixed composition, which is
+        the same order as `yield_coloring`
+        """
+        if self._count_table is not None:
+            return rank_site_constrained_colorings(
+                colorings, self._allowed, self._count_table, self._state_strides
+            )
+        else:
+            return rank_multiset_permutations(colorings, self.num_elements_each_color)
+
+    def yield_coloring_with_rank(self):
+        # `yield_coloring` is in increasing order of ranks
+        return enumerate_with_rank(self.yield_coloring())
+
+    def unrank_coloring(self, rank: int) -> List[int]:
+        if self._count_table is not None:
+            return unrank_site_constrained_coloring(
+                rank, self._allowed, self._count_table, self._state_strides
+            )
+        else:
+            return unrank_multiset_permutation(rank, self.num_elements_each_color)
+
+    def unrank_colorings(self, ranks: np.ndarray) -> np.ndarray:
+        """
+        inverse of `rank_colorings`, (num, num_elements)
+        """
+        if self._count_table is not None:
+            return unrank_site_constrained_colorings(
+                ranks, self._allowed, self._count_table, self._state_strides
+            )
+        else:
+            return np.array(
+                [
+                    unrank_multiset_permutation(rank, self.num_elements_each_color)
+                    for rank in ranks
+                ],
+                dtype=int,
+            ).reshape(-1, self.num_elements)
+
+    def generate_all_colorings(self):
+        if self._lacks_colors():
+            return [], dict()
+        list_colorings = list(self.yield_coloring())
+        flags = {
+            hash_in_all_configuration(coloring, self.num_color): True
+            for coloring in list_colorings
+        }
         return list_colorings, flags
 
     def yield_coloring(self):
+        if self._lacks_colors():
+            return
+        if self.site_constraints:
+            # only branches completed with the remaining composition are visited
+            yield from yield_site_constrained_colorings(
+                self._allowed, self._count_table, self._state_strides
+            )
+            return
+
         # create one of colorings to use multiset_permutations
         first_coloring = []
         for i in range(self.num_color):
             first_coloring.extend([i for _ in range(self.num_elements_each_color[i])])
+        for cl in multiset_permutations(first_coloring):
+            yield cl
 
-        if self.site_constraints:
-            for cl in multiset_permutations(first_coloring):
-                # TODO: more efficient way to adopt site_constraints
-                if satisfy_site_constraints(self.site_constraints, cl):
-                    yield cl
-        else:
-            for cl in multiset_permutations(first_coloring):
+    def _lacks_colors(self) -> bool:
+        return self.use_all_colors and (min(self.num_elements_each_color) == 0)
+
+
+class SublatticeColoringGenerator(BaseColoringGenerator):
+    """
+    Colorings with a composition fixed on each sublattice. The coloring space is the Cartesian
+    product of colorings of each sublattice, and colorings are yielded and ranked in the order
+    of the product, where the first sublattice is the most significant.
+
+    Parameters
+    ----------
+    num_elements: int
+    num_color: int
+    sublattices: list of list of int
+        indices of sites in each sublattice. Sublattices should partition range(num_elements)
+    compositions: list of (list of int or None), (num_sublattices, num_color)
+        compositions[j][c] is the number of sites colored with c in sublattices[j].
+        If compositions[j] is None, sites in sublattices[j] are freely colored.
+    site_constraints: (Optional), list (num_elements, num_color)
+        e.g. site_constraints[2] = [0, 3, 4] means color of site-2 must be 0, 3, or 4.
+    use_all_colors: (Optional) bool
+        if true, skip colorings which do not use all colors. Ranks are unchanged.
+
+    Attributes
+    ----------
+    factors: list of ColoringGenerator or FixedConcentrationColoringGenerator
+        generator of colorings of each sublattice
+    """
+
+    def __init__(
+        self,
+        num_elements: int,
+        num_color: int,
+        sublattices: List[List[int]],
+        compositions: List[Optional[List[int]]],
+        site_constraints=None,
+        use_all_colors=False,
+    ):
+        self.num_elements = num_elements
+        self.num_color = num_color
+        self.use_all_colors = use_all_colors
+        self.site_constraints = site_constraints
+
+        if len(sublattices) != len(compositions):
+            raise ValueError("compositions must be given for each sublattice")
+        if sorted(i for sites in sublattices for i in sites) != list(range(num_elements)):
+            raise ValueError("sublattices must partition sites")
+        self.sublattices = [list(sites) for sites in sublattices]
+        self.compositions = compositions
+
+        self.factors = []  # type: List[BaseColoringGenerator]
+        for sites, composition in zip(self.sublattices, self.compositions):
+            if site_constraints:
+                factor_site_constraints = [site_constraints[i] for i in sites]
+            else:
+                factor_site_constraints = None
+
+            if composition is None:
+                factor = ColoringGenerator(
+                    len(sites), num_color, site_constraints=factor_site_constraints
+                )  # type: BaseColoringGenerator
+            else:
+                if len(composition) != num_color or sum(composition) != len(sites):
+                    raise ValueError("composition does not match sublattice: ", composition)
+                factor = FixedConcentrationColoringGenerator(
+                    len(sites), num_color, composition, site_constraints=factor_site_constraints
+                )
+            self.factors.append(factor)
+
+        radices = [factor.num_colorings for factor in self.factors]
+        self._num_colorings = int(np.prod(radices, dtype=object))
+        self._rank_weights = get_mixed_radix_weights(radices)
+
+    @property
+    def num_colorings(self) -> int:
+        return self._num_colorings
+
+    def rank_colorings(self, colorings: np.ndarray) -> np.ndarray:
+        colorings = np.asarray(colorings)
+        ranks = np.zeros(colorings.shape[0], dtype=self._rank_weights.dtype)
+        valid = np.ones(colorings.shape[0], dtype=bool)
+        for sites, factor, weight in zip(self.sublattices, self.factors, self._rank_weights):
+            factor_ranks = factor.rank_colorings(colorings[:, sites])
+            valid &= factor_ranks != -1
+            ranks += factor_ranks.astype(self._rank_weights.dtype) * weight
+        ranks[~valid] = -1
+        return ranks
+
+    def unrank_coloring(self, rank: int) -> List[int]:
+        coloring = [0 for _ in range(self.num_elements)]
+        for sites, factor, weight in zip(
+            self.sublattices, self.factors, self._rank_weights.tolist()
+        ):
+            factor_rank, rank = divmod(rank, weight)
+            for i, color in zip(sites, factor.unrank_coloring(factor_rank)):
+                coloring[i] = color
+        return coloring
+
+    def generate_all_colorings(self):
+        list_colorings = list(self.yield_coloring())
+        flags = {
+            hash_in_all_configuration(coloring, self.num_color): True
+            for coloring in list_colorings
+        }
+        return list_colorings, flags
+
+    def yield_coloring(self):
+        for cl, _ in self.yield_coloring_with_rank():
+            yield cl
+
+    def yield_coloring_with_rank(self):
+        # the product is in increasing order of ranks
+        for cl, rank in enumerate_with_rank(self._yield_product(0)):
+            if (not self.use_all_colors) or (len(set(cl)) == self.num_color):
+                yield cl, rank
+
+    def _yield_product(self, j: int):
+        """
+        yield colorings of sublattices j, j + 1, ... combined in one list, whose other sites are
+        filled later
+        """
+        if j == len(self.factors):
+            yield [0 for _ in range(self.num_elements)]
+            return
+        for cl_j in self.factors[j].yield_coloring():
+            for cl in self._yield_product(j + 1):
+                for i, color in zip(self.sublattices[j], cl_j):
+                    cl[i] = color
                 yield cl
 
 
+def enumerate_with_rank(colorings):
+    for rank, cl in enumerate(colorings):
+        yield cl, rank
+
+
+def get_multinomial(num_elements_each_color: List[int]) -> int:
+    """
+    return multinomial coefficient (sum(n_i); n_0, n_1, ...)
+    """
+    ret = factorial(sum(num_elements_each_color))
+    for cnt in num_elements_each_color:
+        ret //= factorial(cnt)
+    return ret
+
+
+def _get_rank_dtype(largest: int):
+    if largest <= np.iinfo(np.int64).max:
+        return np.int64
+    else:
+        return object
+
+
+def rank_multiset_permutations(
+    colorings: np.ndarray, num_elements_each_color: List[int]
+) -> np.ndarray:
+    """
+    rank colorings with a fixed composition in lexicographic order (combinatorial number system)
+
+    Parameters
+    ----------
+    colorings: array, (num, num_elements)
+    num_elements_each_color: list of int, (num_color, )
+
+    Returns
+    -------
+    ranks: array, (num, )
+        rank in [0, multinomial(num_elements; num_elements_each_color)), or -1 if a coloring
+        does not have the composition
+    """
+    colorings = np.asarray(colorings)
+    num, num_elements = colorings.shape
+    num_color = len(num_elements_each_color)
+    total = get_multinomial(num_elements_each_color)
+    dtype = _get_rank_dtype(total * max(num_elements, 1))
+
+    in_range = np.all((colorings >= 0) & (colorings < num_color), axis=1)
+    colorings = np.where(in_range[:, np.newaxis], colorings, 0)
+
+    # scan sites backward with counts of each color after the current site, so that
+    # intermediates are O(num * (num_elements + num_color))
+    # smaller[m, i]: the number of sites after i with smaller colors than site i
+    # same[m, i]: the number of sites after or at i with the same color as site i
+    rows = np.arange(num)
+    suffix_counts = np.zeros((num, num_color), dtype=np.int64)
+    smaller = np.zeros((num, num_elements), dtype=np.int64)
+    same = np.zeros((num, num_elements), dtype=np.int64)
+    for i in range(num_elements - 1, -1, -1):
+        colors = colorings[:, i]
+        smaller[:, i] = np.sum(
+            suffix_counts, axis=1, where=np.arange(num_color) < colors[:, np.newaxis]
+        )
+        suffix_counts[rows, colors] += 1
+        same[:, i] = suffix_counts[rows, colors]
+    valid = in_range & np.all(suffix_counts == np.array(num_elements_each_color), axis=1)
+
+    smaller = smaller[valid]
+    same = same[valid]
+    # multinomial coefficient of remaining sites
+    count = np.full(len(smaller), total, dtype=dtype)
+    valid_ranks = np.zeros(len(smaller), dtype=dtype)
+    for i in range(num_elements):
+        num_remaining = num_elements - i
+        valid_ranks += count * smaller[:, i] // num_remaining
+        count = count * same[:, i] // num_remaining
+
+    ranks = -np.ones(num, dtype=dtype)
+    ranks[valid] = valid_ranks
+    return ranks
+
+
+def unrank_multiset_permutation(rank: int, num_elements_each_color: List[int]) -> List[int]:
+    """
+    inverse of `rank_multiset_permutations`
+    """
+    remaining = list(num_elements_each_color)
+    num_remaining = sum(remaining)
+    count = get_multinomial(remaining)
+    coloring = []
+    for _ in range(sum(remaining)):
+        for c, rem in enumerate(remaining):
+            if rem == 0:
+                continue
+            count_c = count * rem // num_remaining
+            if rank < count_c:
+                coloring.append(c)
+                count = count_c
+                remaining[c] -= 1
+                num_remaining -= 1
+                break
+            rank -= count_c
+    return coloring
+
+
+def get_completion_count_table(
+    site_constraints, num_elements_each_color: List[int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    count colorings of suffixes with site constraints and a fixed composition.
+    A composition of remaining colors, `remaining`, is encoded as state
+    s = np.dot(remaining, strides), where strides is mixed-radix weights with radices
+    (num_elements_each_color[c] + 1).
+
+    Returns
+    -------
+    table: array, (num_elements + 1, num_states)
+        table[i, s] is the number of ways to color sites i, ..., num_elements - 1 satisfying
+        site constraints with remaining composition encoded as s.
+        table[0, -1] is the number of all colorings.
+    strides: array, (num_color, )
+    """
+    num_elements = len(site_constraints)
+    radices = [cnt + 1 for cnt in num_elements_each_color]
+    strides = get_mixed_radix_weights(radices).astype(np.int64)
+    num_states = int(np.prod(radices))
+    digits = (np.arange(num_states)[:, np.newaxis] // strides) % np.array(radices)
+
+    dtype = _get_rank_dtype(get_multinomial(num_elements_each_color) * max(num_elements, 1))
+    table = np.zeros((num_elements + 1, num_states), dtype=dtype)
+    table[num_elements, 0] = 1
+    for i in range(num_elements - 1, -1, -1):
+        for c in site_constraints[i]:
+            states = np.nonzero(digits[:, c] > 0)[0]
+            table[i, states] += table[i + 1, states - strides[c]]
+    return table, strides
+
+
+def rank_site_constrained_colorings(
+    colorings: np.ndarray, allowed: np.ndarray, table: np.ndarray, strides: np.ndarray
+) -> np.ndarray:
+    """
+    rank colorings with site constraints and a fixed composition in lexicographic order.
+    `allowed[i, c]` is true iff color c is allowed at site i.
+    `table` and `strides` are returned from `get_completion_count_table`.
+
+    Returns
+    -------
+    ranks: array, (num, )
+        -1 if a coloring does not satisfy site constraints or the composition
+    """
+    colorings = np.asarray(colorings)
+    num, num_elements = colorings.shape
+    num_color = len(strides)
+    num_states = table.shape[1]
+
+    valid = np.all(allowed[np.arange(num_elements), colorings], axis=1)
+    # states[m, i] encodes composition of sites i, ..., num_elements - 1
+    states = np.cumsum(strides[colorings][:, ::-1], axis=1)[:, ::-1]
+    valid &= states[:, 0] == num_states - 1
+
+    valid_colorings = colorings[valid]
+    valid_states = states[valid]
+    valid_ranks = np.zeros(len(valid_colorings), dtype=table.dtype)
+    next_sites = np.arange(1, num_elements + 1)
+    for c in range(num_color):
+        # count colorings with color c at site i and the same colors before site i
+        selected = (
+            (valid_colorings > c)
+            & allowed[:, c]
+            & (_get_state_digit(valid_states, strides, c) > 0)
+        )
+        counts = table[next_sites, np.where(selected, valid_states - strides[c], 0)]
+        valid_ranks += np.sum(np.where(selected, counts, 0), axis=1)
+
+    ranks = -np.ones(num, dtype=table.dtype)
+    ranks[valid] = valid_ranks
+    return ranks
+
+
+def unrank_site_constrained_coloring(
+    rank: int, allowed: np.ndarray, table: np.ndarray, strides: np.ndarray
+) -> List[int]:
+    """
+    inverse of `rank_site_constrained_colorings`
+    """
+    state = table.shape[1] - 1
+    coloring = []
+    for i in range(len(allowed)):
+        for c in np.nonzero(allowed[i])[0].tolist():
+            if _get_state_digit(state, strides, c) == 0:
+                continue
+            count_c = int(table[i + 1, state - strides[c]])
+            if rank < count_c:
+                coloring.append(c)
+                state -= strides[c]
+                break
+            rank -= count_c
+    return coloring
+
+
+def unrank_site_constrained_colorings(
+    ranks: np.ndarray, allowed: np.ndarray, table: np.ndarray, strides: np.ndarray
+) -> np.ndarray:
+    """
+    vectorized `unrank_site_constrained_coloring`, (num, num_elements)
+    """
+    ranks = np.array(ranks, dtype=table.dtype).reshape(-1)
+    num_elements = len(allowed)
+    states = np.full(len(ranks), table.shape[1] - 1, dtype=np.int64)
+    colorings = np.zeros((len(ranks), num_elements), dtype=int)
+    for i in range(num_elements):
+        undecided = np.ones(len(ranks), dtype=bool)
+        for c in np.nonzero(allowed[i])[0].tolist():
+            has_c = undecided & (_get_state_digit(states, strides, c) > 0)
+            counts = np.where(has_c, table[i + 1, np.where(has_c, states - strides[c], 0)], 0)
+            chosen = has_c & (ranks < counts)
+            colorings[chosen, i] = c
+            states[chosen] -= strides[c]
+            ranks -= np.where(has_c & ~chosen, counts, 0)
+            undecided &= ~chosen
+    return colorings
+
+
+def yield_site_constrained_colorings(allowed: np.ndarray, table: np.ndarray, strides: np.ndarray):
+    """
+    yield colorings with site constraints and a fixed composition in lexicographic order, the
+    order of `rank_site_constrained_colorings`. A color is put on a site only if the remaining
+    sites can be completed, so no coloring is generated and discarded.
+    `table` and `strides` are returned from `get_completion_count_table`.
+    """
+    num_elements = len(allowed)
+    site_colors = [np.nonzero(allowed[i])[0].tolist() for i in range(num_elements)]
+    num_states = table.shape[1]
+    digits = _get_state_digit(
+        np.arange(num_states)[:, np.newaxis], strides, np.arange(len(strides))
+    )
+    # feasible[i, s]: sites i, ... can be colored with remaining composition s
+    feasible = np.asarray(table > 0, dtype=bool)
+    if not feasible[0, num_states - 1]:
+        return
+
+    strides_list = strides.tolist()
+    coloring = [0 for _ in range(num_elements)]
+    states = [num_states - 1 for _ in range(num_elements + 1)]
+    # next_choice[i]: index of the next color to try in site_colors[i]
+    next_choice = [0 for _ in range(num_elements + 1)]
+    i = 0
+    while i >= 0:
+        if i == num_elements:
+            yield list(coloring)
+            i -= 1
+            continue
+
+        state = states[i]
+        found = False
+        while next_choice[i] < len(site_colors[i]):
+            c = site_colors[i][next_choice[i]]
+            next_choice[i] += 1
+            if digits[state, c] > 0 and feasible[i + 1, state - strides_list[c]]:
+                coloring[i] = c
+                states[i + 1] = state - strides_list[c]
+                found = True
+                break
+
+        if found:
+            i += 1
+            next_choice[i] = 0
+        else:
+            i -= 1
+
+
+def _get_state_digit(states, strides: np.ndarray, color):
+    # states encode remaining composition with strides[c] for color c
+    num_states_upper = np.concatenate([[np.iinfo(np.int64).max], strides[:-1]])
+    return (states % num_states_upper[color]) // strides[color]
+
+
+def get_mixed_radix_weights(radices: List[int]) -> np.ndarray:
+    """
+    return weights w s.t. np.dot(digits, w) is the mixed-radix number of `digits`, where the
+    first digit is the most significant. Use arbitrary-precision integers only when the largest
+    number overflows int64
+    """
+    weights = [1 for _ in range(len(radices))]
+    for i in range(len(radices) - 2, -1, -1):
+        weights[i] = weights[i + 1] * radices[i + 1]
+
+    largest = weights[0] * radices[0] - 1 if radices else 0
+    if largest <= np.iinfo(np.int64).max:
+        return np.array(weights, dtype=np.int64)
+    else:
+        return np.array(weights, dtype=object)
+
+
+def get_hash_weights(num_elements: int, num_color: int) -> np.ndarray:
+    """
+    return weights w s.t. np.dot(coloring, w) == hash_in_all_configuration(coloring, num_color)
+    """
+    return get_mixed_radix_weights([num_color] * num_elements)
+
+
+class ColoringHasher:
+    """
+    Encode colorings by hash_in_all_configuration with the narrowest representation for
+    `num_color ** num_elements` hashes: uint64, two uint64 words (HASH128_DTYPE), or Python int.
+    The returned hashes keep the order of the integer hashes, so they can be sorted, searched,
+    and passed to numpy set routines.
+
+    Parameters
+    ----------
+    num_elements: int
+    num_color: int
+    """
+
+    def __init__(self, num_elements: int, num_color: int):
+        self.num_elements = num_elements
+        self.num_color = num_color
+
+        # the number of trailing sites packed into the low word
+        self._num_low = 0
+        while self._num_low < num_elements and num_color ** (self._num_low + 1) <= 1 << 64:
+            self._num_low += 1
+
+        if self._num_low == num_elements:
+            self.dtype = np.dtype(np.uint64)
+        elif num_color ** (num_elements - self._num_low) <= 1 << 64:
+            self.dtype = HASH128_DTYPE
+        else:
+            self.dtype = np.dtype(object)
+
+    def hash_colorings(self, colorings: np.ndarray) -> np.ndarray:
+        """
+        Parameters
+        ----------
+        colorings: array, (num, num_elements)
+
+        Returns
+        -------
+        hashes: array, (num, ) with self.dtype
+        """
+        colorings = np.asarray(colorings).reshape(-1, self.num_elements)
+        if self.dtype == object:
+            weights = get_hash_weights(self.num_elements, self.num_color)
+            return np.dot(colorings.astype(object), weights)
+
+        colorings = np.ascontiguousarray(colorings, dtype=np.int8)
+        if self.dtype == np.uint64:
+            return hash_colorings_batch(colorings, self.num_color)
+
+        split = self.num_elements - self._num_low
+        hashes = np.empty(colorings.shape[0], dtype=HASH128_DTYPE)
+        hashes["high"] = hash_colorings_batch(
+            np.ascontiguousarray(colorings[:, :split]), self.num_color
+        )
+        hashes["low"] = hash_colorings_batch(
+            np.ascontiguousarray(colorings[:, split:]), self.num_color
+        )
+        return hashes
+
+
+def get_composition_preserving_permutations(compositions: np.ndarray) -> np.ndarray:
+    """
+    return permutations of colors `perm` which map the set of compositions onto itself, where
+    `perm` maps composition x to y with y[perm[c]] = x[c]. Identity comes first.
+
+    Parameters
+    ----------
+    compositions: array, (num_compositions, num_color)
+    """
+    num_color = compositions.shape[1]
+    # `perm` maps color c to a color with the same counts among compositions
+    signatures = [tuple(sorted(compositions[:, c].tolist())) for c in range(num_color)]
+    blocks = {}  # type: Dict[Tuple[int, ...], List[int]]
+    for c, signature in enumerate(signatures):
+        blocks.setdefault(signature, []).append(c)
+
+    set_compositions = set(map(tuple, compositions.tolist()))
+    list_permutations = []
+    for images in product(*[permutations(block) for block in blocks.values()]):
+        perm = [0 for _ in range(num_color)]
+        for block, image in zip(blocks.values(), images):
+            for c, pc in zip(block, image):
+                perm[c] = pc
+        if len(set_compositions) > 1:
+            mapped = set()
+            for x in set_compositions:
+                y = [0 for _ in range(num_color)]
+                for c in range(num_color):
+                    y[perm[c]] = x[c]
+                mapped.add(tuple(y))
+            if mapped != set_compositions:
+                continue
+        list_permutations.append(perm)
+    # identity is the first in lexicographic order
+    return np.array(sorted(list_permutations), dtype=np.int8)
+
+
+def get_composition_meeting_permutations(compositions: np.ndarray) -> np.ndarray:
+    """
+    return permutations of colors `perm` which map some of compositions to one of them, where
+    `perm` maps composition x to y with y[perm[c]] = x[c]. Identity comes first. Unlike
+    `get_composition_preserving_permutations`, the set of compositions may not be mapped onto
+    itself.
+
+    Parameters
+    ----------
+    compositions: array, (num_compositions, num_color)
+    """
+    num_color = compositions.shape[1]
+    set_compositions = set(map(tuple, compositions.tolist()))
+    list_permutations = []
+    # identity is the first in lexicographic order
+    for perm in permutations(range(num_color)):
+        mapped = np.zeros_like(compositions)
+        mapped[:, list(perm)] = compositions
+        if any(y in set_compositions for y in map(tuple, mapped.tolist())):
+            list_permutations.append(perm)
+    return np.array(list_permutations, dtype=np.int8)
+
+
+def get_site_color_index(site_constraints, num_color: int) -> np.ndarray:
+    """
+    return table (num_elements, num_color) s.t. table[i, site_constraints[i][j]] == j and the
+    other entries are -1
+    """
+    table = -np.ones((len(site_constraints), num_color), dtype=np.int64)
+    for i, sc in enumerate(site_constraints):
+        table[i, sc] = np.arange(len(sc))
+    return table
+
+
 def satisfy_site_constraints(site_constraints, coloring):
     if all([(color in site_constraints[i]) for i, color in enumerate(coloring)]):
         return True
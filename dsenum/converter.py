@@ -109,6 +109,75 @@ class DerivativeMultiLatticeHash:
                 return csite
         return None
 
+    def hash_frac_coords_batch(self, frac_coords: np.ndarray) -> np.ndarray:
+        """
+        vectorized version of `ravel_canonical_site(hash_frac_coords(frac_coord))`
+
+        Parameters
+        ----------
+        frac_coords: array, (..., dim)
+
+        Returns
+        -------
+        indices: array, (..., )
+            raveled canonical site of each fractional coordinates, or -1 if it is not on sites
+        """
+        frac_coords = np.asarray(frac_coords)
+        # (..., num_site_base, dim)
+        jimages = cast_integer_matrix(frac_coords[..., np.newaxis, :] - self.displacement_set)
+        matched = np.all(
+            np.isclose(self.displacement_set + jimages, frac_coords[..., np.newaxis, :]), axis=-1
+        )
+        # take the first matched site as `hash_frac_coords`
+        site_indices = np.argmax(matched, axis=-1)
+        jimage = np.take_along_axis(jimages, site_indices[..., np.newaxis, np.newaxis], axis=-2)
+        factors = np.dot(jimage[..., 0, :], self.left.T)
+
+        indices = self.ravel_canonical_sites(site_indices, factors)
+        indices[~np.any(matched, axis=-1)] = -1
+        return indices
+
+    def ravel_canonical_sites(self, site_indices: np.ndarray, factors: np.ndarray) -> np.ndarray:
+        """
+        vectorized version of `ravel_canonical_site`. `factors` are reduced with modulus of
+        invariant factors.
+
+        Parameters
+        ----------
+        site_indices: array, (..., )
+        factors: array, (..., dim)
+
+        Returns
+        -------
+        indices: array, (..., )
+        """
+        factors = np.mod(factors, np.array(self.invariant_factors))
+        multi_index = (np.asarray(site_indices),) + tuple(np.moveaxis(factors, -1, 0))
+        return np.ravel_multi_index(multi_index, self.shape)
+
+    def get_canonical_sites_array(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        return site indices, (num_sites, ), and factors, (num_sites, dim), of canonical sites in
+        the order of `get_canonical_sites_list`
+        """
+        unraveled = np.unravel_index(np.arange(self.num_sites), self.shape)
+        return unraveled[0], np.stack(unraveled[1:], axis=-1)
+
+    def get_all_factors_array(self) -> np.ndarray:
+        """
+        return factors in the order of `get_all_factors`, (index, dim)
+        """
+        unraveled = np.unravel_index(np.arange(self.index), self.invariant_factors)
+        return np.stack(unraveled, axis=-1)
+
+    def get_frac_coords_array(self) -> np.ndarray:
+        """
+        return fractional coordinates of `get_distinct_derivative_sites_list`, (num_sites, dim)
+        """
+        site_indices, factors = self.get_canonical_sites_array()
+        jimages = cast_integer_matrix(np.dot(factors, self.left_inv.T))
+        return self.displacement_set[site_indices] + jimages
+
     def get_canonical_sites_list(self) -> List[CanonicalSite]:
         list_csites = []
         for site_index in range(len(self.displacement_set)):
@@ -199,3 +268,23 @@ def convert_site_constraints(
         for _ in range(index):
             site_constraints.append(sc)
     return site_constraints
+
+
+def convert_base_sublattices(base_sublattices: List[List[int]], index: int) -> List[List[int]]:
+    """
+    return indices of sites in each sublattice of a derivative structure, in the same order of
+    sites as `convert_site_constraints`
+
+    Parameters
+    ----------
+    base_sublattices: list of list of int
+        indices of sites in base structure belonging to each sublattice
+    index: int
+    """
+    sublattices = []
+    for base_sites in base_sublattices:
+        sites = []
+        for base_site in base_sites:
+            sites.extend(range(base_site * index, (base_site + 1) * index))
+        sublattices.append(sorted(sites))
+    return sublattices
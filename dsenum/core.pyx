@@ -1,4 +1,14 @@
+# cython: language_level=3
 cimport cython
+from libc.stdint cimport int16_t, int32_t, int64_t, uint64_t
+
+import numpy as np
+
+
+ctypedef fused index_t:
+    int16_t
+    int32_t
+    int64_t
 
 
 @cython.boundscheck(False)
@@ -25,3 +35,915 @@ def get_composition(coloring, num_color):
     for c in coloring:
         composition[c] += 1
     return composition
+
+
+# Batched kernels below take a permutation group as (G, N) integer array and colorings as
+# (B, N) int8 array, and release the GIL.
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def act_permutations_batch(
+    const index_t[:, ::1] permutations, const signed char[:, ::1] colorings
+):
+    """
+    return acted colorings, acted[b, g, i] = colorings[b, permutations[g, i]]
+    """
+    cdef Py_ssize_t num_colorings = colorings.shape[0]
+    cdef Py_ssize_t num_permutations = permutations.shape[0]
+    cdef Py_ssize_t num_elements = colorings.shape[1]
+    cdef Py_ssize_t b, g, i
+
+    acted = np.empty((num_colorings, num_permutations, num_elements), dtype=np.int8)
+    cdef signed char[:, :, ::1] acted_view = acted
+    with nogil:
+        for b in range(num_colorings):
+            for g in range(num_permutations):
+                for i in range(num_elements):
+                    acted_view[b, g, i] = colorings[b, permutations[g, i]]
+    return acted
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def hash_colorings_batch(const signed char[:, ::1] colorings, uint64_t num_color):
+    """
+    return hash_in_all_configuration of each coloring as uint64.
+    The caller should guarantee num_color ** N fits in uint64.
+    """
+    cdef Py_ssize_t num_colorings = colorings.shape[0]
+    cdef Py_ssize_t num_elements = colorings.shape[1]
+    cdef Py_ssize_t b, i
+    cdef uint64_t ret
+
+    hashes = np.empty(num_colorings, dtype=np.uint64)
+    cdef uint64_t[::1] hashes_view = hashes
+    with nogil:
+        for b in range(num_colorings):
+            ret = 0
+            for i in range(num_elements):
+                ret = ret * num_color + <uint64_t> colorings[b, i]
+            hashes_view[b] = ret
+    return hashes
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int _compare_image(
+    const index_t[:, ::1] permutations,
+    const signed char[:, ::1] colorings,
+    const signed char[:, ::1] color_permutations,
+    Py_ssize_t b,
+    Py_ssize_t g,
+    Py_ssize_t e,
+    Py_ssize_t b_other,
+    Py_ssize_t g_other,
+    Py_ssize_t e_other,
+) noexcept nogil:
+    """
+    compare image (g, e) of colorings[b] with image (g_other, e_other) of colorings[b_other]
+    lexicographically. g_other = -1 or e_other = -1 means identity.
+    return -1, 0, or 1
+    """
+    cdef Py_ssize_t i
+    cdef signed char lhs, rhs
+    for i in range(colorings.shape[1]):
+        lhs = color_permutations[e, colorings[b, permutations[g, i]]]
+        if g_other == -1:
+            rhs = colorings[b_other, i]
+        else:
+            rhs = colorings[b_other, permutations[g_other, i]]
+        if e_other != -1:
+            rhs = color_permutations[e_other, rhs]
+        if lhs < rhs:
+            return -1
+        elif lhs > rhs:
+            return 1
+    return 0
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def is_champion_batch(
+    const index_t[:, ::1] permutations,
+    const signed char[:, ::1] colorings,
+    const signed char[:, ::1] color_permutations,
+    const unsigned char[:, ::1] pair_mask=None,
+):
+    """
+    return whether each coloring is lexicographically smallest among images
+    color_permutations[e][colorings[b, permutations[g]]] for all e and g.
+    Each test stops at the first smaller image.
+    If pair_mask is given, only images with pair_mask[e, g] are compared.
+    """
+    cdef Py_ssize_t num_colorings = colorings.shape[0]
+    cdef Py_ssize_t num_permutations = permutations.shape[0]
+    cdef Py_ssize_t num_color_permutations = color_permutations.shape[0]
+    cdef bint use_mask = pair_mask is not None
+    cdef Py_ssize_t b, g, e
+    cdef bint champion
+
+    is_champion = np.empty(num_colorings, dtype=np.bool_)
+    cdef unsigned char[::1] is_champion_view = is_champion.view(np.uint8)
+    with nogil:
+        for b in range(num_colorings):
+            champion = True
+            for e in range(num_color_permutations):
+                for g in range(num_permutations):
+                    if use_mask and not pair_mask[e, g]:
+                        continue
+                    if _compare_image(
+                        permutations, colorings, color_permutations, b, g, e, b, -1, -1
+                    ) < 0:
+                        champion = False
+                        break
+                if not champion:
+                    break
+            is_champion_view[b] = champion
+    return is_champion
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def lexicographic_min_batch(
+    const index_t[:, ::1] permutations,
+    const signed char[:, ::1] colorings,
+    const signed char[:, ::1] color_permutations,
+):
+    """
+    return lexicographically smallest image of each coloring among
+    color_permutations[e][colorings[b, permutations[g]]] for all e and g
+    """
+    cdef Py_ssize_t num_colorings = colorings.shape[0]
+    cdef Py_ssize_t num_permutations = permutations.shape[0]
+    cdef Py_ssize_t num_color_permutations = color_permutations.shape[0]
+    cdef Py_ssize_t num_elements = colorings.shape[1]
+    cdef Py_ssize_t b, g, e, i, g_min, e_min
+
+    min_images = np.empty((num_colorings, num_elements), dtype=np.int8)
+    cdef signed char[:, ::1] min_images_view = min_images
+    with nogil:
+        for b in range(num_colorings):
+            g_min = 0
+            e_min = 0
+            for e in range(num_color_permutations):
+                for g in range(num_permutations):
+                    if _compare_image(
+                        permutations, colorings, color_permutations, b, g, e, b, g_min, e_min
+                    ) < 0:
+                        g_min = g
+                        e_min = e
+            for i in range(num_elements):
+                min_images_view[b, i] = color_permutations[
+                    e_min, colorings[b, permutations[g_min, i]]
+                ]
+    return min_images
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def get_composition_batch(const signed char[:, ::1] colorings, Py_ssize_t num_color):
+    """
+    return the number of each color in each coloring, (B, num_color)
+    """
+    cdef Py_ssize_t num_colorings = colorings.shape[0]
+    cdef Py_ssize_t num_elements = colorings.shape[1]
+    cdef Py_ssize_t b, i
+
+    composition = np.zeros((num_colorings, num_color), dtype=np.int64)
+    cdef int64_t[:, ::1] composition_view = composition
+    with nogil:
+        for b in range(num_colorings):
+            for i in range(num_elements):
+                composition_view[b, colorings[b, i]] += 1
+    return composition
+
+
+# With color exchange over all permutations of colors, the lexicographically smallest image among
+# color permutations is given by relabeling colors by order of first occurrence. Kernels below
+# compare relabeled images instead of iterating over num_color! color permutations.
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int _compare_relabeled_image(
+    const index_t[:, ::1] permutations,
+    const signed char[:, ::1] colorings,
+    Py_ssize_t b,
+    Py_ssize_t g,
+    const signed char[:, ::1] others,
+    Py_ssize_t b_other,
+    signed char[::1] labels,
+) noexcept nogil:
+    """
+    compare image g of colorings[b] relabeled by order of first occurrence with others[b_other]
+    lexicographically. labels is a buffer of size num_color.
+    return -1, 0, or 1
+    """
+    cdef Py_ssize_t i
+    cdef signed char c, next_label = 0
+    for i in range(labels.shape[0]):
+        labels[i] = -1
+    for i in range(colorings.shape[1]):
+        c = colorings[b, permutations[g, i]]
+        if labels[c] == -1:
+            labels[c] = next_label
+            next_label += 1
+        if labels[c] < others[b_other, i]:
+            return -1
+        elif labels[c] > others[b_other, i]:
+            return 1
+    return 0
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def relabel_colorings_batch(const signed char[:, ::1] colorings, Py_ssize_t num_color):
+    """
+    return colorings with colors renamed by order of first occurrence, which are the
+    lexicographically smallest among all permutations of colors
+    """
+    cdef Py_ssize_t num_colorings = colorings.shape[0]
+    cdef Py_ssize_t num_elements = colorings.shape[1]
+    cdef Py_ssize_t b, i
+    cdef signed char c, next_label
+
+    relabeled = np.empty((num_colorings, num_elements), dtype=np.int8)
+    cdef signed char[:, ::1] relabeled_view = relabeled
+    labels = np.empty(num_color, dtype=np.int8)
+    cdef signed char[::1] labels_view = labels
+    with nogil:
+        for b in range(num_colorings):
+            labels_view[:] = -1
+            next_label = 0
+            for i in range(num_elements):
+                c = colorings[b, i]
+                if labels_view[c] == -1:
+                    labels_view[c] = next_label
+                    next_label += 1
+                relabeled_view[b, i] = labels_view[c]
+    return relabeled
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def is_champion_relabeled_batch(
+    const index_t[:, ::1] permutations,
+    const signed char[:, ::1] colorings,
+    Py_ssize_t num_color,
+):
+    """
+    same as is_champion_batch with all permutations of colors, but each image of colorings[b]
+    is compared after relabeling. Each test stops at the first smaller image.
+    """
+    cdef Py_ssize_t num_colorings = colorings.shape[0]
+    cdef Py_ssize_t num_permutations = permutations.shape[0]
+    cdef Py_ssize_t b, g
+    cdef bint champion
+
+    is_champion = np.empty(num_colorings, dtype=np.bool_)
+    cdef unsigned char[::1] is_champion_view = is_champion.view(np.uint8)
+    labels = np.empty(num_color, dtype=np.int8)
+    cdef signed char[::1] labels_view = labels
+    with nogil:
+        for b in range(num_colorings):
+            champion = True
+            for g in range(num_permutations):
+                if _compare_relabeled_image(
+                    permutations, colorings, b, g, colorings, b, labels_view
+                ) < 0:
+                    champion = False
+                    break
+            is_champion_view[b] = champion
+    return is_champion
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def lexicographic_min_relabeled_batch(
+    const index_t[:, ::1] permutations,
+    const signed char[:, ::1] colorings,
+    Py_ssize_t num_color,
+):
+    """
+    same as lexicographic_min_batch with all permutations of colors, but each image is
+    relabeled by order of first occurrence
+    """
+    cdef Py_ssize_t num_colorings = colorings.shape[0]
+    cdef Py_ssize_t num_permutations = permutations.shape[0]
+    cdef Py_ssize_t num_elements = colorings.shape[1]
+    cdef Py_ssize_t b, g, i
+    cdef signed char c, next_label
+
+    min_images = np.empty((num_colorings, num_elements), dtype=np.int8)
+    cdef signed char[:, ::1] min_images_view = min_images
+    labels = np.empty(num_color, dtype=np.int8)
+    cdef signed char[::1] labels_view = labels
+    with nogil:
+        for b in range(num_colorings):
+            for g in range(num_permutations):
+                if g > 0 and _compare_relabeled_image(
+                    permutations, colorings, b, g, min_images_view, b, labels_view
+                ) >= 0:
+                    continue
+                labels_view[:] = -1
+                next_label = 0
+                for i in range(num_elements):
+                    c = colorings[b, permutations[g, i]]
+                    if labels_view[c] == -1:
+                        labels_view[c] = next_label
+                        next_label += 1
+                    min_images_view[b, i] = labels_view[c]
+    return min_images
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef bint _extend_prefix(
+    const index_t[:, ::1] permutations,
+    const signed char[:, ::1] color_permutations,
+    const signed char[::1] coloring,
+    int32_t[:, ::1] positions,
+    Py_ssize_t length,
+) noexcept nogil:
+    """
+    update positions[length] from positions[length - 1] after coloring[length - 1] is assigned.
+    positions[L, g * E + e] is the first site where image (g, e) of the prefix of length L may
+    differ from the prefix, or -1 if the image is already known to be larger.
+    return False if some image of the prefix is smaller than the prefix
+    """
+    cdef Py_ssize_t num_color_permutations = color_permutations.shape[0]
+    cdef Py_ssize_t idx, g, e, p, j
+    cdef signed char image
+    for idx in range(positions.shape[1]):
+        p = positions[length - 1, idx]
+        if p >= 0:
+            g = idx // num_color_permutations
+            e = idx % num_color_permutations
+            while p < length:
+                j = permutations[g, p]
+                if j >= length:
+                    break
+                image = color_permutations[e, coloring[j]]
+                if image < coloring[p]:
+                    return False
+                elif image > coloring[p]:
+                    p = -1
+                    break
+                p += 1
+        positions[length, idx] = p
+    return True
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef bint _extend_prefix_relabeled(
+    const index_t[:, ::1] permutations,
+    const signed char[::1] coloring,
+    int32_t[:, ::1] positions,
+    signed char[:, :, ::1] labels,
+    signed char[:, ::1] next_labels,
+    Py_ssize_t length,
+) noexcept nogil:
+    """
+    same as _extend_prefix for all permutations of colors, where image g of the prefix is
+    relabeled by order of first occurrence. labels[L, g] and next_labels[L, g] hold the
+    relabeling of the determined part of image g of the prefix of length L.
+    """
+    cdef Py_ssize_t num_color = labels.shape[2]
+    cdef Py_ssize_t g, p, j, c
+    cdef signed char image
+    for g in range(positions.shape[1]):
+        p = positions[length - 1, g]
+        if p >= 0:
+            for c in range(num_color):
+                labels[length, g, c] = labels[length - 1, g, c]
+            next_labels[length, g] = next_labels[length - 1, g]
+            while p < length:
+                j = permutations[g, p]
+                if j >= length:
+                    break
+                c = coloring[j]
+                if labels[length, g, c] == -1:
+                    labels[length, g, c] = next_labels[length, g]
+                    next_labels[length, g] += 1
+                image = labels[length, g, c]
+                if image < coloring[p]:
+                    return False
+                elif image > coloring[p]:
+                    p = -1
+                    break
+                p += 1
+        positions[length, g] = p
+    return True
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef bint _is_fixed_by_translations(
+    const index_t[:, ::1] permutations,
+    const signed char[::1] coloring,
+    const int32_t[:, ::1] positions,
+    const int64_t[::1] translation_indices,
+    Py_ssize_t num_color_permutations,
+    bint relabel_colors,
+) noexcept nogil:
+    """
+    return whether a complete coloring is fixed by one of permutations[translation_indices],
+    using that its image (g, identity) is equal to it iff positions[N, g * E] == N.
+    Images left out of the search, positions[0, g * E] == -1, are compared directly.
+    """
+    cdef Py_ssize_t num_elements = coloring.shape[0]
+    cdef Py_ssize_t k, g, i, idx
+    for k in range(translation_indices.shape[0]):
+        g = translation_indices[k]
+        idx = g * num_color_permutations
+        if positions[0, idx] >= 0:
+            if positions[num_elements, idx] != num_elements:
+                continue
+            if not relabel_colors:
+                return True
+        # relabeled image may be equal to the coloring with other colors
+        for i in range(num_elements):
+            if coloring[permutations[g, i]] != coloring[i]:
+                break
+        else:
+            return True
+    return False
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def search_champion_colorings(
+    const index_t[:, ::1] permutations,
+    const signed char[:, ::1] color_permutations,
+    const unsigned char[:, ::1] allowed,
+    const int64_t[::1] counts,
+    const unsigned char[:, ::1] feasible,
+    const int64_t[::1] strides,
+    bint relabel_colors=False,
+    bint use_all_colors=False,
+    const int64_t[::1] translation_indices=None,
+    const unsigned char[:, ::1] pair_mask=None,
+):
+    """
+    return colorings which are lexicographically smallest among images
+    color_permutations[e][coloring[permutations[g]]] by depth-first search over prefixes.
+    A prefix is pruned as soon as one of its images is determined to be smaller.
+    If relabel_colors is true, color_permutations is ignored and images are compared after
+    relabeling, which is equivalent to all permutations of colors.
+
+    allowed[i, c] is whether site-i can be colored with c.
+    If counts is not empty, counts[c] is the number of sites colored with c.
+    If feasible is not empty, feasible[i, s] is whether sites i, ... can be colored with remaining
+    composition s = dot(remaining, strides).
+    If use_all_colors is true, prefixes which cannot use all colors are pruned.
+    If translation_indices is given, champions fixed by permutations[translation_indices] are
+    discarded, where color_permutations[0] should be identity.
+    If pair_mask is given, only images with pair_mask[e, g] are compared, and relabel_colors
+    should be false.
+    Returned colorings are sorted lexicographically.
+    """
+    cdef Py_ssize_t num_elements = allowed.shape[0]
+    cdef Py_ssize_t num_color = allowed.shape[1]
+    cdef Py_ssize_t num_images = permutations.shape[0]
+    if not relabel_colors:
+        num_images *= color_permutations.shape[0]
+    cdef bint use_counts = counts.shape[0] > 0
+    cdef bint use_feasible = feasible.shape[0] > 0
+    cdef bint use_translations = translation_indices is not None
+    cdef Py_ssize_t num_color_permutations = 1 if relabel_colors else color_permutations.shape[0]
+    cdef Py_ssize_t depth, c, idx
+    cdef int64_t state = 0
+    cdef Py_ssize_t num_used = 0
+
+    coloring = np.full(num_elements, -1, dtype=np.int8)
+    cdef signed char[::1] coloring_view = coloring
+    positions = np.zeros((num_elements + 1, num_images), dtype=np.int32)
+    cdef int32_t[:, ::1] positions_view = positions
+    if pair_mask is not None and not relabel_colors:
+        # images out of the mask are regarded as larger from the beginning
+        for idx in range(num_images):
+            if not pair_mask[idx % num_color_permutations, idx // num_color_permutations]:
+                positions_view[0, idx] = -1
+    remaining = np.zeros(num_color, dtype=np.int64)
+    cdef int64_t[::1] remaining_view = remaining
+    # used[c] is the number of sites colored with c in the prefix
+    used = np.zeros(num_color, dtype=np.int64)
+    cdef int64_t[::1] used_view = used
+    labels = np.full(
+        (num_elements + 1, num_images if relabel_colors else 0, num_color), -1, dtype=np.int8
+    )
+    cdef signed char[:, :, ::1] labels_view = labels
+    next_labels = np.zeros((num_elements + 1, num_images if relabel_colors else 0), dtype=np.int8)
+    cdef signed char[:, ::1] next_labels_view = next_labels
+    cdef bint extended
+    if use_counts:
+        for c in range(num_color):
+            remaining_view[c] = counts[c]
+            if use_feasible:
+                state += counts[c] * strides[c]
+
+    results = []
+    depth = 0
+    while num_elements > 0 and depth >= 0:
+        # take back the previous color at this depth
+        c = coloring_view[depth]
+        if c >= 0 and use_counts:
+            remaining_view[c] += 1
+            if use_feasible:
+                state += strides[c]
+        if c >= 0 and use_all_colors:
+            used_view[c] -= 1
+            if used_view[c] == 0:
+                num_used -= 1
+
+        c += 1
+        while c < num_color:
+            if use_all_colors and (
+                num_color - num_used - (used_view[c] == 0) > num_elements - depth - 1
+            ):
+                # too few sites left for unused colors
+                c += 1
+                continue
+            if allowed[depth, c] and (not use_counts or remaining_view[c] > 0):
+                if not use_feasible or feasible[depth + 1, state - strides[c]]:
+                    coloring_view[depth] = c
+                    if relabel_colors:
+                        extended = _extend_prefix_relabeled(
+                            permutations,
+                            coloring_view,
+                            positions_view,
+                            labels_view,
+                            next_labels_view,
+                            depth + 1,
+                        )
+                    else:
+                        extended = _extend_prefix(
+                            permutations,
+                            color_permutations,
+                            coloring_view,
+                            positions_view,
+                            depth + 1,
+                        )
+                    if extended:
+                        break
+            c += 1
+
+        if c == num_color:
+            coloring_view[depth] = -1
+            depth -= 1
+            continue
+
+        if use_counts:
+            remaining_view[c] -= 1
+            if use_feasible:
+                state -= strides[c]
+        if use_all_colors:
+            if used_view[c] == 0:
+                num_used += 1
+            used_view[c] += 1
+        if depth + 1 == num_elements:
+            if not use_translations or not _is_fixed_by_translations(
+                permutations,
+                coloring_view,
+                positions_view,
+                translation_indices,
+                num_color_permutations,
+                relabel_colors,
+            ):
+                results.append(coloring.tobytes())
+        else:
+            depth += 1
+
+    return np.frombuffer(b"".join(results), dtype=np.int8).reshape(-1, num_elements).copy()
+
+
+# Kernels below take a stabilizer chain as basic transversals concatenated into
+# (sum of orbit sizes, N) array, offsets of each level, and bounds of sites determined at each
+# level, bounds = [0] + base + [N]. A product u_0 ... u_{depth - 1} is represented by indices of
+# the chosen transversal elements.
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline Py_ssize_t _chain_point(
+    const index_t[:, ::1] transversals,
+    const Py_ssize_t[::1] choices,
+    Py_ssize_t depth,
+    Py_ssize_t i,
+) noexcept nogil:
+    """
+    return (u_0 ... u_{depth - 1})[i]
+    """
+    cdef Py_ssize_t level
+    for level in range(depth - 1, -1, -1):
+        i = transversals[choices[level], i]
+    return i
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int _compare_chain_segment(
+    const index_t[:, ::1] transversals,
+    const Py_ssize_t[::1] choices,
+    Py_ssize_t depth,
+    const signed char[:, ::1] colorings,
+    Py_ssize_t b,
+    const signed char[:, ::1] color_permutations,
+    Py_ssize_t e,
+    const signed char[::1] reference,
+    Py_ssize_t start,
+    Py_ssize_t end,
+) noexcept nogil:
+    cdef Py_ssize_t i
+    cdef signed char image
+    for i in range(start, end):
+        image = color_permutations[
+            e, colorings[b, _chain_point(transversals, choices, depth, i)]
+        ]
+        if image < reference[i]:
+            return -1
+        elif image > reference[i]:
+            return 1
+    return 0
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef bint _has_same_chain_image(
+    const index_t[:, ::1] transversals,
+    const Py_ssize_t[::1] choices,
+    Py_ssize_t depth,
+    const signed char[:, ::1] colorings,
+    Py_ssize_t b,
+    Py_ssize_t start,
+) noexcept nogil:
+    """
+    return whether u_0 ... u_{depth - 1} and u_0 ... u_{depth - 2} give the same image
+    """
+    cdef Py_ssize_t i
+    for i in range(start, colorings.shape[1]):
+        if (
+            colorings[b, _chain_point(transversals, choices, depth, i)]
+            != colorings[b, _chain_point(transversals, choices, depth - 1, i)]
+        ):
+            return False
+    return True
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef bint _search_chain(
+    const index_t[:, ::1] transversals,
+    const Py_ssize_t[::1] offsets,
+    const Py_ssize_t[::1] bounds,
+    const signed char[:, ::1] colorings,
+    Py_ssize_t b,
+    const signed char[:, ::1] color_permutations,
+    Py_ssize_t e,
+    signed char[::1] reference,
+    bint find_min,
+    Py_ssize_t[::1] choices,
+) noexcept nogil:
+    """
+    depth-first search over u_0 u_1 ... u_{m-1} comparing images with `reference` segment by
+    segment, where u_j fixes sites before bounds[j + 1].
+    If find_min, overwrite `reference` by a smaller image when found and return True.
+    Otherwise, return False as soon as a smaller image is found.
+    """
+    cdef Py_ssize_t num_levels = offsets.shape[0] - 1
+    cdef Py_ssize_t num_elements = colorings.shape[1]
+    cdef Py_ssize_t depth = 0
+    cdef Py_ssize_t i
+    cdef int order
+
+    while True:
+        # compare the node u_0 ... u_{depth - 1}
+        order = _compare_chain_segment(
+            transversals,
+            choices,
+            depth,
+            colorings,
+            b,
+            color_permutations,
+            e,
+            reference,
+            bounds[depth],
+            bounds[depth + 1],
+        )
+        if order < 0:
+            if not find_min:
+                return False
+            for i in range(bounds[depth], num_elements):
+                reference[i] = color_permutations[
+                    e, colorings[b, _chain_point(transversals, choices, depth, i)]
+                ]
+        elif order == 0 and depth > 0 and choices[depth - 1] != offsets[depth - 1]:
+            # the same image as the parent has the same descendants as the identity sibling
+            if _has_same_chain_image(
+                transversals, choices, depth, colorings, b, bounds[depth]
+            ):
+                order = 1
+
+        if order <= 0 and depth < num_levels:
+            choices[depth] = offsets[depth]
+            depth += 1
+            continue
+
+        # move to the next sibling, or backtrack
+        while depth > 0:
+            choices[depth - 1] += 1
+            if choices[depth - 1] < offsets[depth]:
+                break
+            depth -= 1
+        if depth == 0:
+            return True
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def is_champion_with_chain_batch(
+    const index_t[:, ::1] transversals,
+    const Py_ssize_t[::1] offsets,
+    const Py_ssize_t[::1] bounds,
+    const signed char[:, ::1] colorings,
+    const signed char[:, ::1] color_permutations,
+):
+    """
+    return whether each coloring is lexicographically smallest among images
+    color_permutations[e][colorings[b, g]] for all e and g in a group given by stabilizer chain
+    """
+    cdef Py_ssize_t num_colorings = colorings.shape[0]
+    cdef Py_ssize_t num_elements = colorings.shape[1]
+    cdef Py_ssize_t num_levels = offsets.shape[0] - 1
+    cdef Py_ssize_t b, e, i
+    cdef bint champion
+
+    is_champion = np.empty(num_colorings, dtype=np.bool_)
+    cdef unsigned char[::1] is_champion_view = is_champion.view(np.uint8)
+    reference = np.empty(num_elements, dtype=np.int8)
+    cdef signed char[::1] reference_view = reference
+    cdef Py_ssize_t[::1] choices = np.empty(max(num_levels, 1), dtype=np.intp)
+    with nogil:
+        for b in range(num_colorings):
+            for i in range(num_elements):
+                reference_view[i] = colorings[b, i]
+            champion = True
+            for e in range(color_permutations.shape[0]):
+                if not _search_chain(
+                    transversals,
+                    offsets,
+                    bounds,
+                    colorings,
+                    b,
+                    color_permutations,
+                    e,
+                    reference_view,
+                    False,
+                    choices,
+                ):
+                    champion = False
+                    break
+            is_champion_view[b] = champion
+    return is_champion
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def lexicographic_min_with_chain_batch(
+    const index_t[:, ::1] transversals,
+    const Py_ssize_t[::1] offsets,
+    const Py_ssize_t[::1] bounds,
+    const signed char[:, ::1] colorings,
+    const signed char[:, ::1] color_permutations,
+):
+    """
+    return lexicographically smallest image of each coloring among
+    color_permutations[e][colorings[b, g]] for all e and g in a group given by stabilizer chain
+    """
+    cdef Py_ssize_t num_colorings = colorings.shape[0]
+    cdef Py_ssize_t num_elements = colorings.shape[1]
+    cdef Py_ssize_t num_levels = offsets.shape[0] - 1
+    cdef Py_ssize_t b, e, i
+
+    min_images = np.empty((num_colorings, num_elements), dtype=np.int8)
+    cdef signed char[:, ::1] min_images_view = min_images
+    cdef Py_ssize_t[::1] choices = np.empty(max(num_levels, 1), dtype=np.intp)
+    with nogil:
+        for b in range(num_colorings):
+            for i in range(num_elements):
+                min_images_view[b, i] = color_permutations[0, colorings[b, i]]
+            for e in range(color_permutations.shape[0]):
+                _search_chain(
+                    transversals,
+                    offsets,
+                    bounds,
+                    colorings,
+                    b,
+                    color_permutations,
+                    e,
+                    min_images_view[b],
+                    True,
+                    choices,
+                )
+    return min_images
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def direct_enumerate_gray_code(
+    const index_t[:, ::1] inverse_permutations,
+    const signed char[:, ::1] color_permutations,
+    const signed char[:, ::1] site_colors,
+    const int64_t[::1] radices,
+    const int64_t[:, ::1] rank_digits,
+    const int64_t[::1] rank_weights,
+    unsigned char[::1] visited,
+):
+    """
+    enumerate colorings in reflected mixed-radix Gray code order, and return colorings whose
+    ranks are not visited yet, marking ranks of their images as visited.
+    Ranks of images color_permutations[e][coloring[permutations[g]]] are updated in O(G E)
+    when a site is changed.
+
+    inverse_permutations[g, j] is the site which site-j moves to by permutation g, and
+    inverse_permutations[0] should be identity. color_permutations[0] should be identity.
+    site_colors[i, d] is the d-th allowed color of site-i for d < radices[i].
+    Rank of a coloring is sum_i rank_digits[i, coloring[i]] * rank_weights[i], and images with
+    rank_digits == -1 at some site are out of the coloring space.
+    visited is bit array of ranks.
+    """
+    cdef Py_ssize_t num_permutations = inverse_permutations.shape[0]
+    cdef Py_ssize_t num_color_permutations = color_permutations.shape[0]
+    cdef Py_ssize_t num_images = num_permutations * num_color_permutations
+    cdef Py_ssize_t num_elements = site_colors.shape[0]
+    cdef Py_ssize_t idx, g, e, i, j, site
+    cdef int64_t digit, old_value, new_value, rank
+    cdef signed char old_color, new_color
+
+    coloring = np.empty(num_elements, dtype=np.int8)
+    cdef signed char[::1] coloring_view = coloring
+    cdef int64_t[::1] digits = np.zeros(num_elements, dtype=np.int64)
+    cdef int64_t[::1] directions = np.ones(num_elements, dtype=np.int64)
+    cdef int64_t[::1] ranks = np.zeros(num_images, dtype=np.int64)
+    cdef int64_t[::1] num_invalid = np.zeros(num_images, dtype=np.int64)
+
+    for j in range(num_elements):
+        coloring_view[j] = site_colors[j, 0]
+    for idx in range(num_images):
+        g = idx // num_color_permutations
+        e = idx % num_color_permutations
+        for j in range(num_elements):
+            i = inverse_permutations[g, j]
+            new_value = rank_digits[i, color_permutations[e, coloring_view[j]]]
+            if new_value < 0:
+                num_invalid[idx] += 1
+            else:
+                ranks[idx] += new_value * rank_weights[i]
+
+    results = []
+    while num_elements > 0:
+        rank = ranks[0]
+        if not (visited[rank >> 3] >> (rank & 7)) & 1:
+            results.append(coloring.tobytes())
+            for idx in range(num_images):
+                if num_invalid[idx] == 0:
+                    rank = ranks[idx]
+                    visited[rank >> 3] |= 1 << (rank & 7)
+
+        # next coloring in Gray code order
+        site = num_elements - 1
+        while site >= 0:
+            digit = digits[site] + directions[site]
+            if 0 <= digit < radices[site]:
+                break
+            directions[site] = -directions[site]
+            site -= 1
+        if site < 0:
+            break
+
+        digits[site] = digit
+        old_color = coloring_view[site]
+        new_color = site_colors[site, digit]
+        coloring_view[site] = new_color
+        with nogil:
+            for g in range(num_permutations):
+                i = inverse_permutations[g, site]
+                idx = g * num_color_permutations
+                for e in range(num_color_permutations):
+                    old_value = rank_digits[i, color_permutations[e, old_color]]
+                    new_value = rank_digits[i, color_permutations[e, new_color]]
+                    if old_value >= 0 and new_value >= 0:
+                        ranks[idx + e] += (new_value - old_value) * rank_weights[i]
+                    else:
+                        if old_value < 0:
+                            num_invalid[idx + e] -= 1
+                        else:
+                            ranks[idx + e] -= old_value * rank_weights[i]
+                        if new_value < 0:
+                            num_invalid[idx + e] += 1
+                        else:
+                            ranks[idx + e] += new_value * rank_weights[i]
+
+    return np.frombuffer(b"".join(results), dtype=np.int8).reshape(-1, num_elements).copy()
@@ -1,6 +1,9 @@
 from abc import ABCMeta, abstractmethod
+from copy import copy
+from multiprocessing import Pool, cpu_count
+import pickle
 from time import time
-from typing import List, Tuple, Union, cast
+from typing import Iterator, List, Optional, Tuple, Union, cast
 from warnings import warn
 
 import numpy as np
@@ -14,8 +17,13 @@ from dsenum.coloring_generator import (
     ColoringGenerator,
     FixedConcentrationColoringGenerator,
     ListBasedColoringGenerator,
+    SublatticeColoringGenerator,
+)
+from dsenum.converter import (
+    DerivativeMultiLatticeHash,
+    convert_base_sublattices,
+    convert_site_constraints,
 )
-from dsenum.converter import convert_site_constraints
 from dsenum.derivative_structure import ColoringToStructure
 from dsenum.permutation_group import DerivativeStructurePermutation
 from dsenum.superlattice import generate_symmetry_distinct_superlattices
@@ -100,6 +108,37 @@ class AbstractStructureEnumerator(metaclass=ABCMeta):
             mapping_color_species = [DummySpecie(str(i)) for i in range(1, self.num_types + 1)]
         self.mapping_color_species = mapping_color_species
 
+        # process pool used in `generate` with n_jobs != 1. It is reused over calls only in a
+        # `with` block, and rebuilt when n_jobs or the state of this enumerator changes
+        self._pool = None
+        self._pool_key = None
+        self._keep_pool = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        state["_pool_key"] = None
+        state["_keep_pool"] = False
+        return state
+
+    def close(self):
+        """
+        terminate process pool used in `generate` and `iter_generate` with n_jobs != 1
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+            self._pool_key = None
+
+    def __enter__(self):
+        self._keep_pool = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._keep_pool = False
+        self.close()
+
     @property
     def num_sites_base(self):
         return self.base_structure.num_sites
@@ -114,6 +153,7 @@ class AbstractStructureEnumerator(metaclass=ABCMeta):
         additional_species=None,
         additional_frac_coords=None,
         output="pymatgen",
+        n_jobs=1,
     ) -> Union[
         List[Union[Structure, str]],
         Tuple[List[Union[Structure, str]], List[np.ndarray], List[List[int]]],
@@ -127,6 +167,10 @@ class AbstractStructureEnumerator(metaclass=ABCMeta):
             species which are nothing to do with ordering
         additional_frac_coords: np.ndarray, optional
             fractional coordinates of species which are nothing to do with ordering
+        output: "pymatgen" or "poscar", optional
+        n_jobs: int, optional
+            the number of processes to distribute HNFs. The order of derivative structures is
+            the same as n_jobs=1. When n_jobs=-1, use all cores.
 
         Returns
         -------
@@ -134,39 +178,21 @@ class AbstractStructureEnumerator(metaclass=ABCMeta):
         list_transformations: list of transformation matrices, optional
         list_colorings: list of colorings, optional
         """
-        assert (output == "pymatgen") or (output == "poscar")
         start = time()
 
-        displacement_set = self.base_structure.frac_coords
         list_ds = []
         list_transformations = []
         list_colorings = []
-        for hnf in tqdm(self.list_reduced_HNF):
-            ds_permutation = DerivativeStructurePermutation(
-                hnf, displacement_set, self.rotations, self.translations
-            )
-            # enumerate colorings
-            list_colorings_hnf = self._generate_coloring_with_hnf(
-                hnf, ds_permutation, additional_species, additional_frac_coords
-            )
-
-            # convert to Structure object
-            cts = ColoringToStructure(
-                self.base_structure,
-                ds_permutation.dhash,
-                self.mapping_color_species,
-                additional_species=additional_species,
-                additional_frac_coords=additional_frac_coords,
-            )
-            if output == "pymatgen":
-                list_ds_hnf = [cts.convert_to_structure(cl) for cl in list_colorings_hnf]
-            elif output == "poscar":
-                list_ds_hnf = [cts.convert_to_poscar_string(cl) for cl in list_colorings_hnf]
-
-            list_ds.extend(list_ds_hnf)
+        for hnf, coloring, ds in self.iter_generate(
+            additional_species=additional_species,
+            additional_frac_coords=additional_frac_coords,
+            output=output,
+            n_jobs=n_jobs,
+        ):
+            list_ds.append(ds)
             if return_colorings:
-                list_transformations.extend([hnf] * len(list_ds_hnf))
-                list_colorings.extend(list_colorings_hnf)
+                list_transformations.append(hnf)
+                list_colorings.append(coloring)
 
         end = time()
         print("total: {} (Time: {:.4}sec)".format(len(list_ds), end - start))
@@ -176,6 +202,102 @@ class AbstractStructureEnumerator(metaclass=ABCMeta):
         else:
             return list_ds
 
+    def iter_generate(
+        self,
+        additional_species=None,
+        additional_frac_coords=None,
+        output="pymatgen",
+        n_jobs=1,
+    ) -> Iterator[Tuple[np.ndarray, List[int], Union[Structure, str]]]:
+        """
+        Yield derivative structures as soon as colorings of each HNF are enumerated.
+        Only colorings of a single HNF are kept at a time.
+
+        Parameters
+        ----------
+        additional_species: list of pymatgen.core.Species, optional
+            species which are nothing to do with ordering
+        additional_frac_coords: np.ndarray, optional
+            fractional coordinates of species which are nothing to do with ordering
+        output: "pymatgen" or "poscar", optional
+        n_jobs: int, optional
+            the number of processes to distribute HNFs. Derivative structures are yielded in
+            the same order as n_jobs=1. When n_jobs=-1, use all cores.
+            The process pool is terminated when the iteration ends, unless this enumerator is
+            used in a `with` block, where the pool is reused until the block exits.
+
+        Yields
+        ------
+        hnf: transformation matrix
+        coloring: list of int
+        ds: derivative structure in `output` format
+        """
+        assert (output == "pymatgen") or (output == "poscar")
+
+        if n_jobs == 1:
+            for hnf in tqdm(self.list_reduced_HNF):
+                list_colorings_hnf, cts = self._enumerate_with_hnf(
+                    hnf, additional_species, additional_frac_coords
+                )
+                for cl in list_colorings_hnf:
+                    yield hnf, cl, convert_coloring(cts, cl, output)
+        else:
+            pool = self._get_pool(n_jobs)
+            try:
+                tasks = [
+                    (hnf_index, additional_species, additional_frac_coords, output)
+                    for hnf_index in range(len(self.list_reduced_HNF))
+                ]
+                # imap keeps the order of HNFs
+                results = pool.imap(_enumerate_and_convert_in_worker, tasks)
+                for hnf, results_hnf in zip(tqdm(self.list_reduced_HNF), results):
+                    for cl, ds in results_hnf:
+                        yield hnf, cl, ds
+            finally:
+                # also reached when the iteration is abandoned
+                if not self._keep_pool:
+                    self.close()
+
+    def _get_pool(self, n_jobs: int):
+        if n_jobs == -1:
+            n_jobs = cpu_count()
+        worker_copy = self._get_worker_copy()
+        # workers hold a copy of this enumerator made when the pool started
+        key = (n_jobs, pickle.dumps(worker_copy))
+        if self._pool_key != key:
+            self.close()
+            self._pool = Pool(n_jobs, initializer=_initialize_worker, initargs=(worker_copy,))
+            self._pool_key = key
+        return self._pool
+
+    def _get_worker_copy(self):
+        """
+        return copy of this enumerator sent to worker processes once
+        """
+        return copy(self)
+
+    def _enumerate_with_hnf(
+        self, hnf: np.ndarray, additional_species, additional_frac_coords
+    ) -> Tuple[List[List[int]], ColoringToStructure]:
+        displacement_set = self.base_structure.frac_coords
+        ds_permutation = DerivativeStructurePermutation(
+            hnf, displacement_set, self.rotations, self.translations
+        )
+        # enumerate colorings
+        list_colorings_hnf = self._generate_coloring_with_hnf(
+            hnf, ds_permutation, additional_species, additional_frac_coords
+        )
+
+        # convert to Structure object
+        cts = ColoringToStructure(
+            self.base_structure,
+            ds_permutation.dhash,
+            self.mapping_color_species,
+            additional_species=additional_species,
+            additional_frac_coords=additional_frac_coords,
+        )
+        return list_colorings_hnf, cts
+
     @abstractmethod
     def _generate_coloring_with_hnf(
         self,
@@ -204,7 +326,9 @@ class StructureEnumerator(AbstractStructureEnumerator):
         If specified, use these species in derivative structures.
         The length of this list should be equal to `num_types`
     composition_constraints: (Optional) List[int]
-        composition_constraints[i] is the ratio of the i-th species in mapping_color_species
+        composition_constraints[i] is the ratio of the i-th species in mapping_color_species.
+        With `base_sublattices`, composition_constraints[j] is the ratio in the j-th sublattice,
+        or None for free occupation of the sublattice.
     base_site_constraints: (Optional) List[List[int]], (num_elements, num_color)
         e.g. site_constraints[2] = [0, 3, 4] means color of site-2 in base_structure must be 0, 3, or 4.
     color_exchange: (Optional) bool
@@ -213,9 +337,16 @@ class StructureEnumerator(AbstractStructureEnumerator):
         iff true, discard superperiodic coloring
     remove_incomplete: (Optional) bool
     method: (Optional) str
-        "direct" or "lexicographic", so far
+        "direct", "lexicographic", "tree", or "factorized". "tree" and "factorized" do not
+        support `base_sublattices`. "factorized" enumerates sublattices with disjoint allowed
+        colors in `base_site_constraints` one after another.
     n_jobs: (Optional) int
-        core in lexicographic coset enumeration(only used when method='lexicographic')
+        core in direct and lexicographic coset enumeration(only used when method='direct' or
+        'lexicographic')
+    base_sublattices: (Optional) List[List[int]]
+        partition of sites in base_structure, e.g. [[0], [1, 2]] to fix composition of
+        site-0 and that of site-1 and site-2 separately. Each sublattice should be mapped to
+        itself by symmetry operations of base_structure.
 
     Arguments
     ---------
@@ -240,6 +371,7 @@ class StructureEnumerator(AbstractStructureEnumerator):
         remove_incomplete=True,
         method="direct",
         n_jobs=1,
+        base_sublattices=None,
     ):
         super().__init__(
             base_structure,
@@ -262,27 +394,179 @@ class StructureEnumerator(AbstractStructureEnumerator):
         self.rotations = rotations
         self.translations = translations
 
+        # sites allowed only one color never change their colors. They are excluded from the
+        # permutation group and colorings, and their colors are put back before conversion.
+        # If the other sites may take the same color, an operation moving spectators to them
+        # can map a coloring to another one, so all sites are enumerated together.
+        self.spectator_base_sites = []  # type: List[int]
+        if base_site_constraints:
+            self.spectator_base_sites = [
+                i for i, sc in enumerate(base_site_constraints) if len(sc) == 1
+            ]
+            spectator_colors = set(base_site_constraints[i][0] for i in self.spectator_base_sites)
+            shared = any(
+                spectator_colors.intersection(sc)
+                for i, sc in enumerate(base_site_constraints)
+                if i not in self.spectator_base_sites
+            )
+            if len(self.spectator_base_sites) == self.num_sites_base or shared:
+                self.spectator_base_sites = []
+        self.free_base_sites = [
+            i for i in range(self.num_sites_base) if i not in self.spectator_base_sites
+        ]
+        self.spectator_colors = [base_site_constraints[i][0] for i in self.spectator_base_sites]
+        if self.spectator_base_sites:
+            self._free_rotations, self._free_translations = get_spectator_preserving_operations(
+                self.base_structure.frac_coords,
+                self.rotations,
+                self.translations,
+                self.spectator_base_sites,
+                self.spectator_colors,
+            )
+            free_site_constraints = convert_site_constraints(
+                [base_site_constraints[i] for i in self.free_base_sites], self.index
+            )
+        else:
+            free_site_constraints = self.site_constraints
+        num_free_sites = len(self.free_base_sites) * self.index
+        # incomplete colorings are removed after enumeration if spectators use some colors
+        use_all_colors = self.remove_incomplete and not self.spectator_colors
+
         # composition constraints
         # typing.cast causes no runtime effect
-        if composition_constraints is None:
+        if base_sublattices is not None:
             cl_generator = cast(
                 BaseColoringGenerator,
-                ColoringGenerator(
-                    self.num_sites, self.num_types, site_constraints=self.site_constraints
+                self._get_sublattice_coloring_generator(
+                    base_sublattices, composition_constraints, free_site_constraints
                 ),
             )
-        else:
+        elif composition_constraints is None:
             cl_generator = cast(
                 BaseColoringGenerator,
-                FixedConcentrationColoringGenerator(
-                    self.num_sites,
+                ColoringGenerator(
+                    num_free_sites,
                     self.num_types,
-                    composition_constraints,
-                    site_constraints=self.site_constraints,
+                    site_constraints=free_site_constraints,
+                    use_all_colors=use_all_colors,
                 ),
             )
+        else:
+            if self.spectator_base_sites:
+                counts = self._get_free_composition(
+                    list(range(self.num_sites_base)), composition_constraints
+                )
+            else:
+                counts = composition_constraints
+            if counts is None:
+                # no structure has the composition at this index
+                cl_generator = cast(
+                    BaseColoringGenerator, ListBasedColoringGenerator(self.num_types, [])
+                )
+            else:
+                cl_generator = cast(
+                    BaseColoringGenerator,
+                    FixedConcentrationColoringGenerator(
+                        num_free_sites,
+                        self.num_types,
+                        counts,
+                        site_constraints=free_site_constraints,
+                        use_all_colors=use_all_colors,
+                    ),
+                )
         self.cl_generator = cl_generator
 
+    def _get_free_composition(self, base_sites: List[int], ratio) -> Optional[List[int]]:
+        """
+        return the number of free sites of each color in `base_sites`, where the ratio of colors
+        in `base_sites` including spectators is `ratio`. Return None if spectators have more
+        sites of some color than the ratio.
+        """
+        ratio_sum = int(np.around(sum(ratio)))
+        num_sites = len(base_sites) * self.index
+        if num_sites % ratio_sum != 0:
+            raise ValueError("incorrect composition ratio")
+        factor = num_sites // ratio_sum
+        counts = [int(np.around(factor * cr)) for cr in ratio]
+        for i, color in zip(self.spectator_base_sites, self.spectator_colors):
+            if i in base_sites:
+                counts[color] -= self.index
+        if min(counts) < 0:
+            return None
+        return counts
+
+    def _get_sublattice_coloring_generator(
+        self, base_sublattices, composition_constraints, free_site_constraints
+    ) -> BaseColoringGenerator:
+        if composition_constraints is None:
+            composition_constraints = [None for _ in base_sublattices]
+        if len(composition_constraints) != len(base_sublattices):
+            raise ValueError("composition_constraints must be given for each sublattice")
+
+        # sublattices and compositions of free sites
+        free_indices = {base_site: j for j, base_site in enumerate(self.free_base_sites)}
+        free_base_sublattices = []
+        compositions = []
+        for base_sites, ratio in zip(base_sublattices, composition_constraints):
+            if ratio is None:
+                composition = None
+            else:
+                composition = self._get_free_composition(base_sites, ratio)
+                if composition is None:
+                    # no structure has the composition at this index
+                    return ListBasedColoringGenerator(self.num_types, [])
+            free_base_sites = [free_indices[i] for i in base_sites if i in free_indices]
+            if not free_base_sites:
+                if composition is not None and sum(composition) != 0:
+                    return ListBasedColoringGenerator(self.num_types, [])
+                continue
+            free_base_sublattices.append(free_base_sites)
+            compositions.append(composition)
+
+        return SublatticeColoringGenerator(
+            len(self.free_base_sites) * self.index,
+            self.num_types,
+            convert_base_sublattices(free_base_sublattices, self.index),
+            compositions,
+            site_constraints=free_site_constraints,
+            use_all_colors=self.remove_incomplete and not self.spectator_colors,
+        )
+
+    def _enumerate_with_hnf(
+        self, hnf: np.ndarray, additional_species, additional_frac_coords
+    ) -> Tuple[List[List[int]], ColoringToStructure]:
+        if not self.spectator_base_sites:
+            return super()._enumerate_with_hnf(hnf, additional_species, additional_frac_coords)
+
+        frac_coords = self.base_structure.frac_coords
+        cts = ColoringToStructure(
+            self.base_structure,
+            DerivativeMultiLatticeHash(hnf, frac_coords),
+            self.mapping_color_species,
+            additional_species=additional_species,
+            additional_frac_coords=additional_frac_coords,
+        )
+        if self.cl_generator.num_colorings == 0:
+            return [], cts
+
+        ds_permutation = DerivativeStructurePermutation(
+            hnf, frac_coords[self.free_base_sites], self._free_rotations, self._free_translations
+        )
+        free_colorings = self._generate_coloring_with_hnf(
+            hnf, ds_permutation, additional_species, additional_frac_coords
+        )
+        if not free_colorings:
+            return [], cts
+
+        # put colors of spectators back, in the order of sites of the whole structure
+        colorings = np.zeros((len(free_colorings), self.num_sites), dtype=int)
+        colorings[:, convert_base_sublattices([self.free_base_sites], self.index)[0]] = np.array(
+            free_colorings, dtype=int
+        ).reshape(len(free_colorings), -1)
+        for i, color in zip(self.spectator_base_sites, self.spectator_colors):
+            colorings[:, i * self.index : (i + 1) * self.index] = color
+        return colorings.tolist(), cts
+
     def _generate_coloring_with_hnf(
         self,
         hnf: np.ndarray,
@@ -299,11 +583,46 @@ class StructureEnumerator(AbstractStructureEnumerator):
             self.remove_incomplete,
             method=self.method,
             n_jobs=self.n_jobs,
+            fixed_colors=self.spectator_colors,
         )
         colorings = sc_enum.unique_colorings()
 
         return colorings
 
+    def _get_worker_copy(self):
+        # daemonic worker processes cannot have their own process pools
+        worker = copy(self)
+        worker.n_jobs = 1
+        return worker
+
+
+def convert_coloring(cts: ColoringToStructure, coloring: List[int], output: str):
+    if output == "pymatgen":
+        return cts.convert_to_structure(coloring)
+    elif output == "poscar":
+        return cts.convert_to_poscar_string(coloring)
+    else:
+        raise ValueError("Unknown output: ", output)
+
+
+# enumerator in each worker process, which is sent once by `_initialize_worker`
+_worker_enumerator = None
+
+
+def _initialize_worker(enumerator: AbstractStructureEnumerator):
+    global _worker_enumerator
+    _worker_enumerator = enumerator
+
+
+def _enumerate_and_convert_in_worker(args):
+    hnf_index, additional_species, additional_frac_coords, output = args
+    enumerator = cast(AbstractStructureEnumerator, _worker_enumerator)
+    hnf = enumerator.list_reduced_HNF[hnf_index]
+    list_colorings_hnf, cts = enumerator._enumerate_with_hnf(
+        hnf, additional_species, additional_frac_coords
+    )
+    return [(cl, convert_coloring(cts, cl, output)) for cl in list_colorings_hnf]
+
 
 def enumerate_derivative_structures(
     base_structure,
@@ -331,8 +650,9 @@ def enumerate_derivative_structures(
     color_exchange: identify color-exchanging
     leave_superperiodic: do not discard superperiodic coloring
     use_all_colors: bool
-    method: "direct" or "lexicographic", so far
-    n_jobs: core in lexicographic coset enumeration(only used when method='lexicographic')
+    method: "direct", "lexicographic", or "tree"
+    n_jobs: core in direct and lexicographic coset enumeration(only used when method='direct' or
+        'lexicographic')
 
     Returns
     -------
@@ -355,6 +675,39 @@ def enumerate_derivative_structures(
     return se.generate()
 
 
+def get_spectator_preserving_operations(
+    frac_coords: np.ndarray,
+    rotations: np.ndarray,
+    translations: np.ndarray,
+    spectator_sites: List[int],
+    spectator_colors: List[int],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    return symmetry operations which map each spectator site to a spectator site with the same
+    color, and the other sites to the other sites
+
+    Parameters
+    ----------
+    frac_coords: array, (num_sites_base, dim)
+    rotations: array, (# of symmetry operations, dim, dim)
+    translations: array, (# of symmetry operations, dim)
+    spectator_sites: list of int
+    spectator_colors: list of int
+        spectator_colors[j] is the color of spectator_sites[j]
+    """
+    dim = frac_coords.shape[1]
+    # with identity HNF, canonical indices are indices of sites in base structure
+    dhash = DerivativeMultiLatticeHash(np.eye(dim, dtype=int), frac_coords)
+    acted = dhash.hash_frac_coords_batch(
+        np.einsum("oij,nj->oni", rotations, frac_coords) + translations[:, np.newaxis, :]
+    )
+    # -1 for free sites
+    site_colors = -np.ones(len(frac_coords), dtype=int)
+    site_colors[spectator_sites] = spectator_colors
+    preserved = np.all(site_colors[acted] == site_colors, axis=1)
+    return rotations[preserved], translations[preserved]
+
+
 def remove_symmetry_duplicates(
     base_structure,
     hnf,
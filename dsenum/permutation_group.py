@@ -2,8 +2,9 @@ from itertools import product
 
 import numpy as np
 
-from dsenum.site import CanonicalSite
 from dsenum.converter import DerivativeMultiLatticeHash
+from dsenum.stabilizer_chain import StabilizerChain
+from dsenum.translation_group import TranslationGroup
 from dsenum.utils import cast_integer_matrix
 
 
@@ -30,6 +31,10 @@ class DerivativeStructurePermutation:
         # of parent multilattice in super lattice
     num_site: int
         # of sites in unit cell of superlattice
+    prm_t_array: array, (# of translations, num_site)
+        permutations by translations, stored as int16 or int32
+    prm_rigid_array: array, (# of rigid operations, num_site)
+        permutations by rigid operations without translations, stored as int16 or int32
     """
 
     def __init__(
@@ -50,11 +55,9 @@ class DerivativeStructurePermutation:
             rotations, translations
         )
 
-        self.list_dsites = self.dhash.get_distinct_derivative_sites_list()
-        self.list_csites = self.dhash.get_canonical_sites_list()
-
-        self._prm_t = self._get_translation_permutations()
-        self.prm_rigid = self._get_rigid_permutations()
+        dtype = get_permutation_dtype(self.num_sites)
+        self.prm_t_array = np.array(self._get_translation_permutations(), dtype=dtype)
+        self.prm_rigid_array = np.array(self._get_rigid_permutations(), dtype=dtype)
 
     @property
     def dim(self):
@@ -68,9 +71,23 @@ class DerivativeStructurePermutation:
     def num_sites(self):
         return self.dhash.num_sites
 
+    @property
+    def list_dsites(self):
+        return self.dhash.get_distinct_derivative_sites_list()
+
+    @property
+    def list_csites(self):
+        return self.dhash.get_canonical_sites_list()
+
     @property
     def prm_t(self):
-        return self._prm_t
+        # list view for compatibility, use `prm_t_array` instead
+        return self.prm_t_array.tolist()
+
+    @property
+    def prm_rigid(self):
+        # list view for compatibility, use `prm_rigid_array` instead
+        return self.prm_rigid_array.tolist()
 
     def _get_superlattice_invariant_subgroup(
         self, rotations: np.ndarray, translations: np.ndarray
@@ -89,62 +106,110 @@ class DerivativeStructurePermutation:
         return np.array(valid_rotations), np.array(valid_translations)
 
     def _get_translation_permutations(self):
-        list_permutations = []
-        for add_factor in self.dhash.get_all_factors():
-            new_list_csites = []
-            for csite in self.list_csites:
-                new_factor = self.dhash.modulus_factor(
-                    np.array(csite.factor) + np.array(add_factor)
-                )
-                new_csite = CanonicalSite(csite.site_index, new_factor)
-                new_list_csites.append(new_csite)
-
-            # permutation represenation
-            perm = [self.dhash.ravel_canonical_site(csite) for csite in new_list_csites]
-            assert is_permutation(perm)
-            list_permutations.append(perm)
-
-        # assume list_permutations[0] is identity
-        assert is_identity_permutation(list_permutations[0])
-
-        return list_permutations
+        site_indices, factors = self.dhash.get_canonical_sites_array()
+        all_factors = self.dhash.get_all_factors_array()
+        # (index, num_sites), translate each canonical site by each factor
+        permutations = self.dhash.ravel_canonical_sites(
+            site_indices[np.newaxis, :], factors[np.newaxis, :, :] + all_factors[:, np.newaxis, :]
+        )
+        assert is_permutation_array(permutations)
+
+        # assume permutations[0] is identity
+        assert is_identity_permutation(permutations[0])
+
+        return permutations
 
     def _get_rigid_permutations(self):
-        identity = list(range(self.num_sites))
-        list_permutations = [
-            identity,
-        ]
-
-        for R, tau in zip(self.rotations, self.translations):
-            new_list_csites = []
-            for dsite in self.list_dsites:
-                frac_coord = self.displacement_set[dsite.site_index] + np.array(dsite.jimage)
-                acted_frac_coord = np.dot(R, frac_coord) + tau
-                new_csite = self.dhash.hash_frac_coords(acted_frac_coord)
-                assert new_csite is not None
-                new_list_csites.append(new_csite)
-
-            perm = [self.dhash.ravel_canonical_site(csite) for csite in new_list_csites]
-            assert is_permutation(perm)
-            if perm not in list_permutations:
-                list_permutations.append(perm)
+        frac_coords = self.dhash.get_frac_coords_array()
+        # (# of operations, num_sites, dim)
+        acted_frac_coords = (
+            np.einsum("oij,nj->oni", self.rotations, frac_coords)
+            + self.translations[:, np.newaxis, :]
+        )
+        acted = self.dhash.hash_frac_coords_batch(acted_frac_coords)
+        assert np.all(acted != -1)
+        assert is_permutation_array(acted)
+
+        identity = np.arange(self.num_sites)[np.newaxis, :]
+        permutations = unique_permutations(np.concatenate([identity, acted]))
+
+        # two rigid operations may act on sites as the same permutation up to a translation,
+        # e.g. on one sublattice of hcp, which is fixed by a mirror plane. Keep one of them per
+        # coset of translations: translations act freely on sites, so the element of a coset
+        # mapping site-0 to the smallest index is unique.
+        cosets = self.prm_t_array[:, permutations]
+        smallest = np.argmin(cosets[:, :, 0], axis=0)
+        coset_keys = cosets[smallest, np.arange(len(permutations))]
+        _, first_indices = np.unique(
+            np.ascontiguousarray(coset_keys).view(
+                np.dtype((np.void, coset_keys.dtype.itemsize * self.num_sites))
+            )[:, 0],
+            return_index=True,
+        )
+        permutations = permutations[np.sort(first_indices)]
 
         # this set of permutations is not group!
-        return list_permutations
+        return permutations
+
+    def get_translation_generators(self):
+        """
+        return translations by a unit along each axis of `self.dhash.invariant_factors`, which
+        generate `self.prm_t`
+        """
+        generators = []
+        for axis, factor in enumerate(self.dhash.invariant_factors):
+            if factor == 1:
+                continue
+            unit = [0 for _ in self.dhash.invariant_factors]
+            unit[axis] = 1
+            # self.prm_t_array is ordered as self.dhash.get_all_factors()
+            generators.append(
+                self.prm_t_array[int(np.ravel_multi_index(unit, self.dhash.invariant_factors))]
+            )
+        return generators
+
+    def get_translation_group(self) -> TranslationGroup:
+        """
+        return translations acting as cyclic shifts of colorings reshaped to `self.dhash.shape`,
+        equivalent to `self.prm_t_array`
+        """
+        return TranslationGroup(self.dhash.shape)
+
+    def get_stabilizer_chain(self) -> StabilizerChain:
+        """
+        return base and strong generating set of the group returned by
+        `get_symmetry_operation_permutations` without listing its elements
+        """
+        generators = self.get_translation_generators() + list(self.prm_rigid_array)
+        return StabilizerChain(generators, self.num_sites)
+
+    def get_symmetry_operation_permutations_array(self) -> np.ndarray:
+        """
+        return all permutations product_permutations(prm_t[i], prm_rigid[j]) as array
+        (# of translations * # of rigid operations, num_site), ordered by i and then j.
+        The first one is identity.
+        """
+        # product_permutations(p1, p2)[k] = p1[p2[k]]
+        permutations = np.ascontiguousarray(
+            self.prm_t_array[:, self.prm_rigid_array].reshape(-1, self.num_sites)
+        )
+        assert is_identity_permutation(permutations[0])
+        assert len(unique_permutations(permutations)) == len(permutations)
+        return permutations
 
     def get_symmetry_operation_permutations(self):
-        list_permutations = []
-
-        for p1 in self.prm_t:
-            for p2 in self.prm_rigid:
-                perm = product_permutations(p1, p2)
-                assert perm not in list_permutations
-                list_permutations.append(perm)
+        # list view for compatibility, use `get_symmetry_operation_permutations_array` instead
+        return self.get_symmetry_operation_permutations_array().tolist()
 
-        # assume list_permutations[0] is identity
-        assert is_identity_permutation(list_permutations[0])
 
-        return list_permutations
+def get_permutation_dtype(num_elements: int):
+    """
+    return the smallest integer type to store permutations of `num_elements` elements
+    """
+    if num_elements <= np.iinfo(np.int16).max + 1:
+        return np.int16
+    else:
+        return np.int32
 
 
 def is_unimodular(M: np.ndarray) -> bool:
@@ -169,6 +234,27 @@ def is_permutation(perm):
     return len(set(perm)) == len(perm)
 
 
+def is_permutation_array(permutations: np.ndarray) -> bool:
+    """
+    return whether each row of (num, num_elements) array is permutation
+    """
+    num_elements = permutations.shape[-1]
+    return bool(np.all(np.sort(permutations, axis=-1) == np.arange(num_elements)))
+
+
+def unique_permutations(permutations: np.ndarray) -> np.ndarray:
+    """
+    remove duplicated rows of (num, num_elements) array, keeping the first occurrences in order.
+    Each row is compared as a single byte string, so this takes O(num log(num)) comparisons.
+    """
+    permutations = np.ascontiguousarray(permutations)
+    keys = permutations.view(
+        np.dtype((np.void, permutations.dtype.itemsize * permutations.shape[1]))
+    )
+    _, first_indices = np.unique(keys[:, 0], return_index=True)
+    return permutations[np.sort(first_indices)]
+
+
 def is_identity_permutation(perm):
     if all([index == i for i, index in enumerate(perm)]):
         return True
@@ -178,7 +264,8 @@ def is_identity_permutation(perm):
 
 def is_permutation_group(list_permutations):
     list_permutations_tuple = [tuple(perm) for perm in list_permutations]
-    if len(set(list_permutations_tuple)) != len(list_permutations_tuple):
+    set_permutations = set(list_permutations_tuple)
+    if len(set_permutations) != len(list_permutations_tuple):
         print(list_permutations)
         raise ValueError("not unique permutations")
 
@@ -189,7 +276,7 @@ def is_permutation_group(list_permutations):
     # close
     for p1, p2 in product(list_permutations, repeat=2):
         p1p2 = product_permutations(p1, p2)
-        if p1p2 not in list_permutations:
+        if tuple(p1p2) not in set_permutations:
             raise ValueError("not closed in product")
 
     # inverse
@@ -198,7 +285,7 @@ def is_permutation_group(list_permutations):
         for i, idx in enumerate(perm):
             perm_inv[idx] = i
 
-        if perm_inv not in list_permutations:
+        if tuple(perm_inv) not in set_permutations:
             raise ValueError("not contains inverse")
 
     return True
@@ -0,0 +1,222 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from dsenum.core import (  # type: ignore
+    is_champion_with_chain_batch,
+    lexicographic_min_with_chain_batch,
+)
+
+
+class StabilizerChain:
+    """
+    Base and strong generating set of a permutation group built by Schreier-Sims algorithm.
+    A permutation `perm` maps point i to perm[i], and product of permutations is
+    (p1 p2)[i] = p1[p2[i]] as `product_permutations`.
+
+    Base points are taken in increasing order, and points between two consecutive base points
+    are fixed by the latter stabilizer. Thus each group element g is uniquely written as
+    g = u_0 u_1 ... u_{m-1} with u_j in self.transversals[j], and the prefix of a coloring acted
+    by g, coloring[g], up to self.base[j + 1] is determined by u_0, ..., u_j.
+
+    Parameters
+    ----------
+    generators: list of permutation
+    num_elements: int
+
+    Attributes
+    ----------
+    base: list of int
+    strong_generators: list of array
+    orbits: list of array
+        orbits[j] is the orbit of base[j] under the pointwise stabilizer of base[:j]
+    transversals: list of array, (len(orbits[j]), num_elements)
+        transversals[j][l][base[j]] == orbits[j][l], and transversals[j][0] is identity
+    """
+
+    def __init__(self, generators: List[List[int]], num_elements: int):
+        self.num_elements = num_elements
+        identity = np.arange(num_elements)
+        gens = [np.array(g) for g in generators if not np.array_equal(g, identity)]
+
+        # Schreier-Sims with base 0, 1, ..., num_elements - 1. Trivial levels are dropped after
+        levels = [[] for _ in range(num_elements)]  # type: List[List[np.ndarray]]
+        levels[0] = gens
+        for g in gens:
+            for j in range(1, _get_num_fixed_prefix(g) + 1):
+                levels[j].append(g)
+        transversals = [_get_transversal(levels[j], j, num_elements) for j in range(num_elements)]
+
+        i = num_elements - 1
+        while i >= 0:
+            added = False
+            for beta, u_beta in list(transversals[i].items()):
+                for s in levels[i]:
+                    # Schreier generator fixes base points up to i
+                    u_s_beta = transversals[i][s[beta]]
+                    h = _inverse(u_s_beta)[s[u_beta]]
+                    residue, level = _strip(h, transversals, i + 1)
+                    if level < num_elements:
+                        for j in range(i + 1, level + 1):
+                            levels[j].append(residue)
+                            transversals[j] = _get_transversal(levels[j], j, num_elements)
+                        i = level
+                        added = True
+                        break
+                if added:
+                    break
+            if not added:
+                i -= 1
+
+        self.base = []  # type: List[int]
+        self.orbits = []  # type: List[np.ndarray]
+        self.transversals = []  # type: List[np.ndarray]
+        strong_generators = {}
+        for j in range(num_elements):
+            if len(transversals[j]) == 1:
+                continue
+            self.base.append(j)
+            points = sorted(transversals[j].keys())
+            self.orbits.append(np.array(points))
+            self.transversals.append(np.array([transversals[j][p] for p in points]))
+            for s in levels[j]:
+                strong_generators[s.tobytes()] = s
+        self.strong_generators = list(strong_generators.values())
+        self._chain_arrays = None
+
+    def order(self) -> int:
+        order = 1
+        for orbit in self.orbits:
+            order *= len(orbit)
+        return order
+
+    def contains(self, perm: List[int]) -> bool:
+        perm = np.asarray(perm)
+        for b, orbit, transversal in zip(self.base, self.orbits, self.transversals):
+            pos = np.searchsorted(orbit, perm[b])
+            if pos == len(orbit) or orbit[pos] != perm[b]:
+                return False
+            perm = _inverse(transversal[pos])[perm]
+        return bool(np.array_equal(perm, np.arange(self.num_elements)))
+
+    def is_champion_colorings(
+        self, colorings: np.ndarray, color_permutations: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        return whether each coloring is lexicographically smallest among images
+        color_permutations[e][coloring[g]] for all e and g in the group.
+        Products u_0 u_1 ... are searched depth-first and a branch is cut as soon as its
+        determined sites differ from the coloring, so that a branch is not expanded to all of
+        its group elements.
+
+        Parameters
+        ----------
+        colorings: array, (num, num_elements)
+        color_permutations: (Optional) array, (E, num_color)
+            permutations of colors to be identified, including identity
+
+        Returns
+        -------
+        is_champion: bool array, (num, )
+        """
+        return is_champion_with_chain_batch(
+            *self._get_chain_arrays(), *_get_kernel_arguments(colorings, color_permutations)
+        )
+
+    def lexicographic_min_images(
+        self, colorings: np.ndarray, color_permutations: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        return canonical form of each coloring, the lexicographically smallest image among
+        color_permutations[e][coloring[g]]
+
+        Parameters
+        ----------
+        colorings: array, (num, num_elements)
+        color_permutations: (Optional) array, (E, num_color)
+            permutations of colors to be identified. The first one should be identity
+
+        Returns
+        -------
+        min_images: int8 array, (num, num_elements)
+        """
+        return lexicographic_min_with_chain_batch(
+            *self._get_chain_arrays(), *_get_kernel_arguments(colorings, color_permutations)
+        )
+
+    def _get_chain_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        return concatenated transversals, offsets of each level, and bounds of sites determined
+        at each level, [0] + base + [num_elements]
+        """
+        if self._chain_arrays is None:
+            if self.transversals:
+                flat = np.concatenate(self.transversals).astype(np.intp)
+            else:
+                flat = np.zeros((0, self.num_elements), dtype=np.intp)
+            offsets = np.cumsum([0] + [len(orbit) for orbit in self.orbits]).astype(np.intp)
+            bounds = np.array([0] + self.base + [self.num_elements], dtype=np.intp)
+            self._chain_arrays = (np.ascontiguousarray(flat), offsets, bounds)
+        return self._chain_arrays
+
+
+def _get_num_fixed_prefix(perm: np.ndarray) -> int:
+    """
+    return the largest j s.t. perm fixes points 0, ..., j - 1
+    """
+    moved = np.nonzero(perm != np.arange(len(perm)))[0]
+    return int(moved[0]) if len(moved) > 0 else len(perm)
+
+
+def _inverse(perm: np.ndarray) -> np.ndarray:
+    inv = np.empty_like(perm)
+    inv[perm] = np.arange(len(perm))
+    return inv
+
+
+def _get_transversal(generators: List[np.ndarray], point: int, num_elements: int):
+    """
+    return dict from each point beta in the orbit of `point` to permutation u s.t.
+    u[point] == beta, by breadth-first search
+    """
+    transversal = {point: np.arange(num_elements)}
+    queue = [point]
+    while queue:
+        beta = queue.pop(0)
+        for s in generators:
+            gamma = int(s[beta])
+            if gamma not in transversal:
+                transversal[gamma] = s[transversal[beta]]
+                queue.append(gamma)
+    return transversal
+
+
+def _strip(perm: np.ndarray, transversals, start: int) -> Tuple[np.ndarray, int]:
+    """
+    sift `perm` through levels start, start + 1, ...
+    return residue and the level where sifting fails. The level is num_elements if `perm`
+    is sifted to identity.
+    """
+    num_elements = len(perm)
+    level = start
+    while True:
+        # levels fixed by `perm` are passed with identity
+        moved = np.nonzero(perm[level:] != np.arange(level, num_elements))[0]
+        if len(moved) == 0:
+            return perm, num_elements
+        level += int(moved[0])
+        beta = int(perm[level])
+        if beta not in transversals[level]:
+            return perm, level
+        perm = _inverse(transversals[level][beta])[perm]
+        level += 1
+
+
+def _get_kernel_arguments(
+    colorings: np.ndarray, color_permutations: Optional[np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    colorings = np.ascontiguousarray(colorings, dtype=np.int8)
+    if color_permutations is None:
+        num_color = int(colorings.max()) + 1 if colorings.size > 0 else 1
+        color_permutations = np.arange(num_color)[np.newaxis, :]
+    return colorings, np.ascontiguousarray(color_permutations, dtype=np.int8)
@@ -0,0 +1,138 @@
+from itertools import product
+from typing import Tuple
+
+import numpy as np
+
+
+class TranslationGroup:
+    """
+    Translations of a superlattice acting on canonical site indices.
+    A canonical site index is raveled from (site_index, *factor) with
+    `DerivativeMultiLatticeHash.shape`, and translation by `t` maps factor f to
+    f + t modulo invariant factors. Thus a coloring reshaped to `shape` is acted by a
+    cyclic shift along axes 1, 2, ..., and no explicit permutation is needed.
+
+    The action of the k-th translation coincides with that of
+    `DerivativeStructurePermutation.prm_t_array[k]`, coloring[prm_t_array[k]].
+
+    Parameters
+    ----------
+    shape: tuple of int
+        (num_site_base, *invariant_factors)
+
+    Attributes
+    ----------
+    translations: array, (# of translations, dim)
+        in the order of `DerivativeMultiLatticeHash.get_all_factors`
+    """
+
+    def __init__(self, shape: Tuple[int, ...]):
+        self.shape = tuple(shape)
+        self.invariant_factors = self.shape[1:]
+        self.num_elements = int(np.prod(self.shape))
+        self.translations = np.array(
+            list(product(*[range(factor) for factor in self.invariant_factors])), dtype=int
+        ).reshape(-1, len(self.invariant_factors))
+        self._prime_order_translations = _get_prime_order_translations(self.invariant_factors)
+
+    @property
+    def order(self) -> int:
+        return len(self.translations)
+
+    def act(self, colorings: np.ndarray, translation: np.ndarray) -> np.ndarray:
+        """
+        return colorings acted by `translation`, (num, num_elements)
+        """
+        colorings = np.asarray(colorings)
+        reshaped = colorings.reshape((-1,) + self.shape)
+        axes = tuple(range(2, 2 + len(self.invariant_factors)))
+        # image[s, f] = coloring[s, f + translation]
+        rolled = np.roll(reshaped, shift=tuple(-np.asarray(translation)), axis=axes)
+        return rolled.reshape(colorings.shape)
+
+    def lexicographic_min_images(self, colorings: np.ndarray) -> np.ndarray:
+        """
+        return the lexicographically smallest image of each coloring under translations
+        """
+        min_images = np.array(colorings, copy=True)
+        for translation in self.translations[1:]:
+            images = self.act(colorings, translation)
+            smaller = _is_lexicographically_smaller(images, min_images)
+            min_images[smaller] = images[smaller]
+        return min_images
+
+    def is_translation_champions(self, colorings: np.ndarray) -> np.ndarray:
+        """
+        return whether each coloring is lexicographically smallest among its translations.
+        This is a necessary condition for a champion under the whole space group.
+        """
+        colorings = np.asarray(colorings)
+        is_champion = np.ones(len(colorings), dtype=bool)
+        for translation in self.translations[1:]:
+            remained = np.nonzero(is_champion)[0]
+            if len(remained) == 0:
+                break
+            images = self.act(colorings[remained], translation)
+            is_champion[remained[_is_lexicographically_smaller(images, colorings[remained])]] = (
+                False
+            )
+        return is_champion
+
+    def is_superperiodic(self, colorings: np.ndarray) -> np.ndarray:
+        """
+        return whether each coloring is fixed by some nontrivial translation.
+        A nontrivial stabilizer contains a subgroup of prime order, so only one generator of
+        each subgroup of prime order is tested.
+        """
+        colorings = np.asarray(colorings)
+        superperiodic = np.zeros(len(colorings), dtype=bool)
+        for translation in self._prime_order_translations:
+            superperiodic |= np.all(self.act(colorings, translation) == colorings, axis=1)
+        return superperiodic
+
+
+def _is_lexicographically_smaller(lhs: np.ndarray, rhs: np.ndarray) -> np.ndarray:
+    """
+    return lhs[b] < rhs[b] in lexicographic order for each row b
+    """
+    differ = lhs != rhs
+    first = np.argmax(differ, axis=1)
+    rows = np.arange(len(lhs))
+    return np.any(differ, axis=1) & (lhs[rows, first] < rhs[rows, first])
+
+
+def _get_prime_factors(n: int):
+    factors = []
+    p = 2
+    while p * p <= n:
+        if n % p == 0:
+            factors.append(p)
+            while n % p == 0:
+                n //= p
+        p += 1
+    if n > 1:
+        factors.append(n)
+    return factors
+
+
+def _get_prime_order_translations(invariant_factors: Tuple[int, ...]) -> np.ndarray:
+    """
+    return one generator for each subgroup of prime order in Z_{D_1} x ... x Z_{D_d}.
+    For prime p, elements of order p are (D_i / p) * u with u_i in Z_p (u_i = 0 if p does not
+    divide D_i), and the generator is normalized so that the first nonzero u_i is one.
+    """
+    dim = len(invariant_factors)
+    primes = set()
+    for factor in invariant_factors:
+        primes.update(_get_prime_factors(factor))
+
+    translations = []
+    for p in sorted(primes):
+        ranges = [range(p) if factor % p == 0 else range(1) for factor in invariant_factors]
+        units = np.array([factor // p if factor % p == 0 else 0 for factor in invariant_factors])
+        for u in product(*ranges):
+            nonzero = [ui for ui in u if ui != 0]
+            if (not nonzero) or nonzero[0] != 1:
+                continue
+            translations.append(np.array(u) * units)
+    return np.array(translations, dtype=int).reshape(-1, dim)
@@ -0,0 +1,33 @@
+import numpy as np
+
+from dsenum.bitarray import BitArray
+
+
+def test_bitarray():
+    size = 37
+    bits = BitArray(size)
+    assert len(bits) == size
+    assert bits.nbytes == 5
+
+    indices = np.array([0, 3, 3, 8, 36])
+    bits.set(indices)
+    expected = np.zeros(size, dtype=bool)
+    expected[indices] = True
+
+    assert np.array_equal(bits.get(np.arange(size)), expected)
+    assert [bits[i] for i in range(size)] == expected.tolist()
+    assert bits.count() == 4
+
+
+def test_find_unset():
+    size = 37
+    bits = BitArray(size)
+    indices = np.array([0, 1, 2, 5] + list(range(8, 30)) + [36])
+    bits.set(indices)
+    for start in range(size + 1):
+        expected = [i for i in range(start, size) if i not in indices]
+        assert bits.find_unset(start) == (expected[0] if expected else size)
+        assert bits.find_unset(start, block_size=1) == bits.find_unset(start)
+
+    bits.set(np.arange(size))
+    assert bits.find_unset() == size
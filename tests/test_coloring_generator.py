@@ -1,10 +1,23 @@
+from itertools import product
+
+import numpy as np
 import pytest
 
 from dsenum.coloring_generator import (
+    HASH128_DTYPE,
     ColoringGenerator,
+    ColoringHasher,
     FixedConcentrationColoringGenerator,
+    ListBasedColoringGenerator,
+    SublatticeColoringGenerator,
+    get_composition_meeting_permutations,
+    get_composition_preserving_permutations,
+    get_multinomial,
+    rank_multiset_permutations,
     satisfy_site_constraints,
+    unrank_multiset_permutation,
 )
+from dsenum.core import hash_in_all_configuration
 from dsenum.utils import get_lattice
 
 
@@ -108,6 +121,171 @@ def test_fixed_concentration_coloring_generator_with_site_constraints():
     assert set([tuple(e) for e in list_colorings2]) == colorings_expect
 
 
+def test_rank_colorings():
+    num_color = 3
+    site_constraints = [[0], [1, 2], [0, 2], [0, 1, 2]]
+    num_elements = len(site_constraints)
+    for cg in [
+        ColoringGenerator(num_elements, num_color),
+        ColoringGenerator(num_elements, num_color, site_constraints),
+    ]:
+        colorings = np.array(list(cg.yield_coloring()))
+        ranks = cg.rank_colorings(colorings)
+        assert np.array_equal(ranks, np.arange(cg.num_colorings))
+        assert np.array_equal(cg.unrank_colorings(ranks), colorings)
+
+    cg = ColoringGenerator(num_elements, num_color, site_constraints)
+    assert np.array_equal(cg.rank_colorings(np.array([[1, 1, 0, 0], [0, 0, 0, 0]])), [-1, -1])
+
+
+def test_rank_fixed_concentration_colorings():
+    num_elements = 6
+    num_color = 3
+    color_ratio = [1, 2, 3]
+    site_constraints = [[2], [1, 2], [0, 1, 2], [0, 1, 2], [0, 2], [1, 2]]
+    for sc in [None, site_constraints]:
+        fcg = FixedConcentrationColoringGenerator(num_elements, num_color, color_ratio, sc)
+        colorings = np.array(list(fcg.yield_coloring()))
+        assert fcg.num_colorings == len(colorings)
+        assert np.array_equal(fcg.rank_colorings(colorings), np.arange(len(colorings)))
+        for rank, cl in enumerate(colorings):
+            assert fcg.unrank_coloring(rank) == cl.tolist()
+        assert np.array_equal(fcg.unrank_colorings(np.arange(len(colorings))), colorings)
+
+    # out of the coloring space
+    fcg = FixedConcentrationColoringGenerator(
+        num_elements, num_color, color_ratio, site_constraints
+    )
+    assert np.array_equal(
+        fcg.rank_colorings(np.array([[0, 0, 0, 0, 0, 0], [2, 2, 2, 1, 1, 0]])), [-1, -1]
+    )
+
+
+def test_sublattice_coloring_generator():
+    num_elements = 7
+    num_color = 3
+    sublattices = [[0, 2, 4], [1, 3], [5, 6]]
+    compositions = [[1, 0, 2], None, [0, 1, 1]]
+    site_constraints = [[0, 2], [0, 1], [0, 1, 2], [1, 2], [0, 1, 2], [1, 2], [1, 2]]
+    for sc in [None, site_constraints]:
+        slg = SublatticeColoringGenerator(num_elements, num_color, sublattices, compositions, sc)
+
+        expected = []
+        for cl in product(range(num_color), repeat=num_elements):
+            if sc and not satisfy_site_constraints(sc, cl):
+                continue
+            if all(
+                composition is None
+                or [[cl[i] for i in sites].count(c) for c in range(num_color)] == composition
+                for sites, composition in zip(sublattices, compositions)
+            ):
+                expected.append(list(cl))
+
+        colorings = list(slg.yield_coloring())
+        assert sorted(colorings) == expected
+        assert slg.num_colorings == len(expected)
+        assert np.array_equal(slg.rank_colorings(np.array(colorings)), np.arange(len(colorings)))
+        for rank, cl in enumerate(colorings):
+            assert slg.unrank_coloring(rank) == cl
+
+    # out of the coloring space
+    slg = SublatticeColoringGenerator(num_elements, num_color, sublattices, compositions)
+    assert np.array_equal(
+        slg.rank_colorings(np.array([[0, 0, 2, 0, 2, 1, 1], [1, 0, 2, 0, 2, 1, 2]])), [-1, -1]
+    )
+
+
+def test_rank_multiset_permutations():
+    num_elements_each_color = [2, 1, 3]
+    colorings = np.array(
+        [unrank_multiset_permutation(r, num_elements_each_color) for r in range(60)]
+    )
+    assert len(set(map(tuple, colorings))) == get_multinomial(num_elements_each_color)
+    assert np.array_equal(
+        rank_multiset_permutations(colorings, num_elements_each_color), np.arange(60)
+    )
+
+    # rank exceeding int64
+    num_elements_each_color = [30, 30, 30]
+    rank = get_multinomial(num_elements_each_color) - 1
+    coloring = unrank_multiset_permutation(rank, num_elements_each_color)
+    assert coloring == [2] * 30 + [1] * 30 + [0] * 30
+    assert rank_multiset_permutations(np.array([coloring]), num_elements_each_color)[0] == rank
+
+
+def test_minimal_change_coloring():
+    for site_constraints in [None, [[1, 2], [0], [0, 1, 2], [2, 0]]]:
+        cl_generator = ColoringGenerator(4, 3, site_constraints=site_constraints)
+        colorings = []
+        for cl, site in cl_generator.yield_minimal_change_coloring():
+            if colorings:
+                diff = [i for i, (c1, c2) in enumerate(zip(colorings[-1], cl)) if c1 != c2]
+                assert diff == [site]
+            else:
+                assert site == -1
+            colorings.append(cl)
+        assert sorted(colorings) == sorted(cl_generator.yield_coloring())
+
+
+def test_relabeled_coloring():
+    for num_elements, num_color in [(1, 3), (5, 3), (6, 2), (4, 6)]:
+        cl_generator = ColoringGenerator(num_elements, num_color)
+        expected = []
+        for cl in cl_generator.yield_coloring():
+            colors = sorted(set(cl))
+            first_occurrences = [cl.index(c) for c in colors]
+            if colors == list(range(len(colors))) and first_occurrences == sorted(
+                first_occurrences
+            ):
+                expected.append(cl)
+        actual = list(cl_generator.yield_relabeled_coloring_with_rank())
+        assert [cl for cl, _ in actual] == expected
+        assert [rank for _, rank in actual] == cl_generator.rank_colorings(expected).tolist()
+
+        # split by prefixes, which are also relabeled
+        for prefix_length in range(1, num_elements + 1):
+            prefix_generator = ColoringGenerator(prefix_length, num_color)
+            split = []
+            for prefix, _ in prefix_generator.yield_relabeled_coloring_with_rank():
+                split.extend(cl_generator.yield_relabeled_coloring_with_rank(prefix))
+            assert split == actual
+
+
+@pytest.mark.parametrize(
+    "num_elements,num_color,dtype",
+    [(40, 3, np.uint64), (64, 2, np.uint64), (65, 2, HASH128_DTYPE), (129, 2, object)],
+)
+def test_coloring_hasher(num_elements, num_color, dtype):
+    hasher = ColoringHasher(num_elements, num_color)
+    assert hasher.dtype == dtype
+
+    rng = np.random.default_rng(0)
+    colorings = rng.integers(0, num_color, size=(64, num_elements))
+    colorings[0] = num_color - 1
+    colorings[1] = 0
+    expected = [hash_in_all_configuration(cl.tolist(), num_color) for cl in colorings]
+
+    hashes = hasher.hash_colorings(colorings)
+    assert hashes.dtype == dtype
+    if dtype == HASH128_DTYPE:
+        low_base = num_color**hasher._num_low
+        actual = [int(h["high"]) * low_base + int(h["low"]) for h in hashes]
+    else:
+        actual = [int(h) for h in hashes]
+    assert actual == expected
+    # order of hashes is that of the integer hashes
+    assert np.argsort(hashes, kind="stable").tolist() == sorted(
+        range(len(expected)), key=lambda i: expected[i]
+    )
+
+
+def test_rank_list_based_colorings():
+    list_colorings = [[0, 1, 1], [1, 0, 1], [0, 1, 1], [2, 2, 0]]
+    cl_generator = ListBasedColoringGenerator(3, list_colorings)
+    ranks = cl_generator.rank_colorings(np.array([[2, 2, 0], [0, 1, 1], [0, 0, 0]]))
+    assert ranks.tolist() == [3, 0, -1]
+
+
 def test_satisfy_site_constraints():
     site_constraints = [
         [0],
@@ -119,3 +297,58 @@ def test_satisfy_site_constraints():
     coloring2 = [1, 1, 1, 1]
     assert satisfy_site_constraints(site_constraints, coloring1)
     assert not satisfy_site_constraints(site_constraints, coloring2)
+
+
+def test_composition_preserving_permutations():
+    identity = [[0, 1, 2]]
+    assert get_composition_preserving_permutations(np.array([[1, 2, 3]])).tolist() == identity
+    assert get_composition_preserving_permutations(np.array([[2, 1, 2]])).tolist() == [
+        [0, 1, 2],
+        [2, 1, 0],
+    ]
+    assert len(get_composition_preserving_permutations(np.array([[2, 2, 2]]))) == 6
+    # set of compositions exchanged by swapping colors 0 and 1
+    compositions = np.array([[1, 2, 3], [2, 1, 3]])
+    assert get_composition_preserving_permutations(compositions).tolist() == [
+        [0, 1, 2],
+        [1, 0, 2],
+    ]
+
+    # swapping colors 0 and 2 maps only the first composition to one of them
+    compositions = np.array([[1, 2, 1], [0, 1, 3]])
+    assert get_composition_preserving_permutations(compositions).tolist() == identity
+    assert get_composition_meeting_permutations(compositions).tolist() == [
+        [0, 1, 2],
+        [2, 1, 0],
+    ]
+
+
+def test_use_all_colors():
+    for site_constraints in [None, [[0, 1], [1, 2], [0, 1, 2], [0, 2], [2]]]:
+        cl_generator = ColoringGenerator(5, 3, site_constraints=site_constraints)
+        cl_generator_all = ColoringGenerator(
+            5, 3, site_constraints=site_constraints, use_all_colors=True
+        )
+        expected = [
+            (cl, rank) for cl, rank in cl_generator.yield_coloring_with_rank() if len(set(cl)) == 3
+        ]
+        assert list(cl_generator_all.yield_coloring_with_rank()) == expected
+        assert list(cl_generator_all.yield_coloring()) == [cl for cl, _ in expected]
+
+    cl_generator = ColoringGenerator(5, 3)
+    cl_generator_all = ColoringGenerator(5, 3, use_all_colors=True)
+    assert list(cl_generator_all.yield_relabeled_coloring_with_rank()) == [
+        (cl, rank)
+        for cl, rank in cl_generator.yield_relabeled_coloring_with_rank()
+        if len(set(cl)) == 3
+    ]
+
+    assert len(list(FixedConcentrationColoringGenerator(6, 3, [1, 2, 3]).yield_coloring())) > 0
+    assert (
+        list(
+            FixedConcentrationColoringGenerator(
+                6, 3, [1, 0, 1], use_all_colors=True
+            ).yield_coloring()
+        )
+        == []
+    )
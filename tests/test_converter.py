@@ -42,3 +42,21 @@ def test_converter():
                 ind = converter.ravel_canonical_site(csite)
                 csite2 = converter.unravel_to_canonical_site(ind)
                 assert csite2 == csite
+
+            # vectorized conversions
+            site_indices, factors = converter.get_canonical_sites_array()
+            assert [(int(s), tuple(f)) for s, f in zip(site_indices, factors.tolist())] == [
+                (csite.site_index, tuple(csite.factor)) for csite in all_periodic_sites
+            ]
+            assert converter.get_all_factors_array().tolist() == [list(f) for f in all_factors]
+
+            frac_coords_array = converter.get_frac_coords_array()
+            assert np.allclose(
+                frac_coords_array, [converter.get_frac_coords(dsite) for dsite in all_dsites]
+            )
+            shifted = frac_coords_array + np.array([1, -2, 3])
+            expected = [
+                converter.ravel_canonical_site(converter.hash_frac_coords(fc)) for fc in shifted
+            ]
+            assert converter.hash_frac_coords_batch(shifted).tolist() == expected
+            assert np.all(converter.hash_frac_coords_batch(shifted + 0.25) == -1)
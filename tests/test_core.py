@@ -0,0 +1,67 @@
+from itertools import permutations
+
+import numpy as np
+
+from dsenum.core import (
+    act_permutation,
+    act_permutations_batch,
+    get_composition,
+    get_composition_batch,
+    hash_in_all_configuration,
+    hash_colorings_batch,
+    is_champion_batch,
+    is_champion_relabeled_batch,
+    lexicographic_min_batch,
+    lexicographic_min_relabeled_batch,
+    relabel_colorings_batch,
+)
+
+
+def test_batch_kernels():
+    rng = np.random.default_rng(0)
+    num_elements = 6
+    num_color = 3
+    permutation_array = np.array(
+        [rng.permutation(num_elements) for _ in range(5)] + [np.arange(num_elements)]
+    )
+    colorings = rng.integers(num_color, size=(20, num_elements)).astype(np.int8)
+    color_permutations = np.array(list(permutations(range(num_color))), dtype=np.int8)
+
+    for dtype in [np.int16, np.int32, np.int64]:
+        prm = permutation_array.astype(dtype)
+        acted = act_permutations_batch(prm, colorings)
+        for b, cl in enumerate(colorings.tolist()):
+            for g, perm in enumerate(permutation_array.tolist()):
+                assert acted[b, g].tolist() == act_permutation(perm, cl)
+
+        for cl_prms in [color_permutations[:1], color_permutations]:
+            is_champion = is_champion_batch(prm, colorings, cl_prms)
+            min_images = lexicographic_min_batch(prm, colorings, cl_prms)
+            for b, cl in enumerate(colorings.tolist()):
+                images = [
+                    [cp[c] for c in act_permutation(perm, cl)]
+                    for cp in cl_prms.tolist()
+                    for perm in permutation_array.tolist()
+                ]
+                assert is_champion[b] == (min(images) == cl)
+                assert min_images[b].tolist() == min(images)
+
+        # relabeling is equivalent to all permutations of colors
+        assert np.array_equal(
+            is_champion_relabeled_batch(prm, colorings, num_color),
+            is_champion_batch(prm, colorings, color_permutations),
+        )
+        assert np.array_equal(
+            lexicographic_min_relabeled_batch(prm, colorings, num_color),
+            lexicographic_min_batch(prm, colorings, color_permutations),
+        )
+
+    relabeled = relabel_colorings_batch(colorings, num_color)
+    for b, cl in enumerate(colorings.tolist()):
+        assert relabeled[b].tolist() == min([[cp[c] for c in cl] for cp in color_permutations])
+
+    hashes = hash_colorings_batch(colorings, num_color)
+    composition = get_composition_batch(colorings, num_color)
+    for b, cl in enumerate(colorings.tolist()):
+        assert hashes[b] == hash_in_all_configuration(cl, num_color)
+        assert composition[b].tolist() == get_composition(cl, num_color)
@@ -1,13 +1,31 @@
+from itertools import permutations
+
+import numpy as np
 from tqdm import tqdm
 import pytest
+from pymatgen.core import Structure
 
 from dsenum.enumerate import StructureEnumerator
-from dsenum.coloring_generator import ColoringGenerator, FixedConcentrationColoringGenerator
+from dsenum.coloring_generator import (
+    ColoringGenerator,
+    FixedConcentrationColoringGenerator,
+    ListBasedColoringGenerator,
+    SublatticeColoringGenerator,
+)
 from dsenum.permutation_group import DerivativeStructurePermutation
 from dsenum.utils import get_lattice
 from dsenum.polya import polya_counting, polya_fixed_degrees_counting
 from dsenum.superlattice import generate_symmetry_distinct_superlattices
-from dsenum.coloring import SiteColoringEnumerator
+from dsenum.coloring import (
+    DirectColoringEnumerator,
+    FactorizedColoringEnumerator,
+    LexicographicColoringEnumerator,
+    SiteColoringEnumerator,
+    TreeColoringEnumerator,
+    get_colorings_in_rank_range,
+    get_independent_factors,
+    get_valid_coloring_mask,
+)
 
 
 obj = {
@@ -74,7 +92,7 @@ def reproduce_results(max_index=None):
         for index, expected in zip(dct["indices"], dct["num_expected"]):
             if (max_index is not None) and (index > max_index):
                 continue
-            for method in ["direct", "lexicographic"]:
+            for method in ["direct", "lexicographic", "tree"]:
                 se = StructureEnumerator(
                     structure,
                     index,
@@ -168,3 +186,889 @@ def test_fixed_colorings_with_polya():
                     sc_enum.permutation_group, num_type, color_ratio
                 )
                 assert len(colorings) == cnt_polya
+
+
+def test_direct_vectorized():
+    for name, dct in obj.items():
+        structure = dct["structure"]
+        displacement_set = structure.frac_coords
+        num_type = dct["num_type"]
+        num_sites_base = structure.num_sites
+
+        for index in dct["indices"]:
+            if index >= 5:
+                continue
+
+            list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+                index, structure, return_symops=True
+            )
+            cl_generator = ColoringGenerator(num_sites_base * index, num_type)
+
+            for hnf in list_reduced_HNF:
+                ds_permutation = DerivativeStructurePermutation(
+                    hnf, displacement_set, rotations, translations
+                )
+                permutation_group = ds_permutation.get_symmetry_operation_permutations()
+                for color_exchange in [True, False]:
+                    expected = DirectColoringEnumerator(
+                        permutation_group,
+                        num_type,
+                        cl_generator,
+                        color_exchange=color_exchange,
+                        vectorize=False,
+                    ).coset_enumerate()
+                    actual = DirectColoringEnumerator(
+                        permutation_group,
+                        num_type,
+                        cl_generator,
+                        color_exchange=color_exchange,
+                        vectorize=True,
+                    ).coset_enumerate()
+                    assert [list(cl) for cl in actual] == [list(cl) for cl in expected]
+
+
+def test_direct_gray_code():
+    structure = get_lattice("hcp")
+    num_type = 3
+    index = 2
+    num_sites = structure.num_sites * index
+    list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+        index, structure, return_symops=True
+    )
+    list_cl_generators = [
+        ColoringGenerator(num_sites, num_type),
+        ColoringGenerator(num_sites, num_type, site_constraints=[[2, 0], [0, 1, 2]] * index),
+        ColoringGenerator(num_sites, num_type, use_all_colors=True),
+    ]
+    for hnf in list_reduced_HNF:
+        ds_permutation = DerivativeStructurePermutation(
+            hnf, structure.frac_coords, rotations, translations
+        )
+        permutation_group = ds_permutation.get_symmetry_operation_permutations()
+        for cl_generator in list_cl_generators:
+            for color_exchange in [True, False]:
+                clenum = DirectColoringEnumerator(
+                    permutation_group,
+                    num_type,
+                    cl_generator,
+                    color_exchange=color_exchange,
+                    gray_code=True,
+                )
+
+                # first visited coloring of each orbit in Gray code order
+                expected = []
+                visited = set()
+                for cl, _ in cl_generator.yield_minimal_change_coloring():
+                    if cl_generator.rank_colorings(np.array([cl]))[0] in visited:
+                        continue
+                    if cl_generator.use_all_colors and len(set(cl)) < num_type:
+                        continue
+                    expected.append(cl)
+                    ranks = cl_generator.rank_colorings(clenum._get_orbit(np.array(cl)))
+                    visited.update(ranks[ranks != -1].tolist())
+
+                assert clenum.coset_enumerate() == expected
+
+                # representatives differ from those in the other order, but orbits do not
+                assert len(expected) == len(
+                    DirectColoringEnumerator(
+                        permutation_group, num_type, cl_generator, color_exchange=color_exchange
+                    ).coset_enumerate()
+                )
+
+
+def test_iter_generate():
+    se = StructureEnumerator(get_lattice("fcc"), 4, 2, method="direct")
+    list_ds, list_hnf, list_colorings = se.generate(return_colorings=True, output="poscar")
+
+    iterated = list(se.iter_generate(output="poscar"))
+    assert len(iterated) == len(list_ds)
+    for (hnf, coloring, ds), hnf_expect, coloring_expect, ds_expect in zip(
+        iterated, list_hnf, list_colorings, list_ds
+    ):
+        assert np.array_equal(hnf, hnf_expect)
+        assert list(coloring) == list(coloring_expect)
+        assert ds == ds_expect
+
+
+def test_generate_parallel():
+    for method in ["direct", "lexicographic"]:
+        with StructureEnumerator(get_lattice("hcp"), 4, 2, method=method) as se:
+            expected = se.generate(return_colorings=True, output="poscar")
+            pools = []
+            for _ in range(2):
+                # reuse process pool
+                actual = se.generate(return_colorings=True, output="poscar", n_jobs=2)
+                assert actual[0] == expected[0]
+                assert all(np.array_equal(h1, h2) for h1, h2 in zip(actual[1], expected[1]))
+                assert [list(cl) for cl in actual[2]] == [list(cl) for cl in expected[2]]
+                pools.append(se._pool)
+            assert pools[0] is pools[1]
+
+            # workers are restarted with the changed state
+            se.color_exchange = False
+            expected = se.generate(output="poscar")
+            assert se.generate(output="poscar", n_jobs=2) == expected
+            assert se._pool is not pools[0]
+        assert se._pool is None
+
+    # without `with` block, the pool is terminated after each call
+    se = StructureEnumerator(get_lattice("hcp"), 3, 2)
+    expected = se.generate(output="poscar")
+    assert se.generate(output="poscar", n_jobs=2) == expected
+    assert se._pool is None
+
+    iterated = se.iter_generate(output="poscar", n_jobs=2)
+    next(iterated)
+    iterated.close()
+    assert se._pool is None
+
+
+def test_lexicographic_parallel():
+    structure = get_lattice("fcc")
+    num_type = 3
+    index = 4
+    list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+        index, structure, return_symops=True
+    )
+    cl_generator = ColoringGenerator(index, num_type)
+    for hnf in list_reduced_HNF:
+        ds_permutation = DerivativeStructurePermutation(
+            hnf, structure.frac_coords, rotations, translations
+        )
+        permutation_group = ds_permutation.get_symmetry_operation_permutations()
+        for color_exchange in [True, False]:
+            clenum = LexicographicColoringEnumerator(
+                permutation_group, num_type, cl_generator, color_exchange=color_exchange
+            )
+            expected = [
+                cl for cl in cl_generator.yield_coloring() if clenum._is_champion_coloring(cl)
+            ]
+            assert clenum.coset_enumerate() == expected
+
+            clenum_parallel = LexicographicColoringEnumerator(
+                permutation_group,
+                num_type,
+                cl_generator,
+                color_exchange=color_exchange,
+                n_jobs=2,
+                chunk_size=7,
+            )
+            assert clenum_parallel.coset_enumerate() == expected
+
+            clenum_chain = LexicographicColoringEnumerator(
+                permutation_group,
+                num_type,
+                cl_generator,
+                color_exchange=color_exchange,
+                stabilizer_chain=ds_permutation.get_stabilizer_chain(),
+            )
+            assert clenum_chain.coset_enumerate() == expected
+
+            clenum_translation = LexicographicColoringEnumerator(
+                permutation_group,
+                num_type,
+                cl_generator,
+                color_exchange=color_exchange,
+                n_jobs=2,
+                translation_group=ds_permutation.get_translation_group(),
+            )
+            assert clenum_translation.coset_enumerate() == expected
+
+
+def test_lexicographic_site_constraints():
+    # images of valid colorings may be out of the coloring space
+    structure = get_lattice("hcp")
+    num_type = 3
+    index = 3
+    num_sites = structure.num_sites * index
+    list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+        index, structure, return_symops=True
+    )
+    site_constraints = [[0, 1]] * index + [[1, 2]] * index
+    list_cl_generators = [
+        ColoringGenerator(num_sites, num_type, site_constraints=site_constraints),
+        FixedConcentrationColoringGenerator(
+            num_sites, num_type, [2, 2, 2], site_constraints=site_constraints
+        ),
+        # not kept by translations
+        ColoringGenerator(num_sites, num_type, site_constraints=[[0, 1], [1, 2]] * index),
+    ]
+    for hnf in list_reduced_HNF:
+        ds_permutation = DerivativeStructurePermutation(
+            hnf, structure.frac_coords, rotations, translations
+        )
+        permutation_group = ds_permutation.get_symmetry_operation_permutations()
+        for cl_generator in list_cl_generators:
+            for color_exchange in [True, False]:
+                expected = DirectColoringEnumerator(
+                    permutation_group, num_type, cl_generator, color_exchange=color_exchange
+                ).coset_enumerate()
+                clenum = LexicographicColoringEnumerator(
+                    permutation_group, num_type, cl_generator, color_exchange=color_exchange
+                )
+                assert not clenum.relabel_colors
+                assert sorted(clenum.coset_enumerate()) == sorted(expected)
+                assert [
+                    cl for cl in cl_generator.yield_coloring() if clenum._is_champion_coloring(cl)
+                ] == clenum.coset_enumerate()
+
+                clenum_parallel = LexicographicColoringEnumerator(
+                    permutation_group,
+                    num_type,
+                    cl_generator,
+                    color_exchange=color_exchange,
+                    n_jobs=2,
+                    chunk_size=7,
+                    stabilizer_chain=ds_permutation.get_stabilizer_chain(),
+                    translation_group=ds_permutation.get_translation_group(),
+                )
+                assert sorted(clenum_parallel.coset_enumerate()) == sorted(expected)
+
+
+def test_direct_parallel():
+    structure = get_lattice("hcp")
+    num_type = 3
+    index = 2
+    list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+        index, structure, return_symops=True
+    )
+    num_elements = structure.num_sites * index
+    site_constraints = [[0, 1]] * index + [[0, 1, 2]] * index
+    for sc in [None, site_constraints]:
+        cl_generator = ColoringGenerator(num_elements, num_type, site_constraints=sc)
+        for hnf in list_reduced_HNF:
+            ds_permutation = DerivativeStructurePermutation(
+                hnf, structure.frac_coords, rotations, translations
+            )
+            permutation_group = ds_permutation.get_symmetry_operation_permutations()
+            for color_exchange in [True, False]:
+                expected = DirectColoringEnumerator(
+                    permutation_group, num_type, cl_generator, color_exchange=color_exchange
+                ).coset_enumerate()
+                actual = DirectColoringEnumerator(
+                    permutation_group,
+                    num_type,
+                    cl_generator,
+                    color_exchange=color_exchange,
+                    n_jobs=2,
+                ).coset_enumerate()
+                assert actual == expected
+
+
+def test_colorings_in_rank_range():
+    num_color = 3
+    site_constraints = [[0, 1], [0, 1, 2], [1, 2], [0, 1, 2], [0, 1, 2], [0, 2]]
+    num_elements = len(site_constraints)
+    cl_generators = [
+        ColoringGenerator(num_elements, num_color),
+        ColoringGenerator(num_elements, num_color, site_constraints, use_all_colors=True),
+        FixedConcentrationColoringGenerator(num_elements, num_color, [1, 2, 3], site_constraints),
+        SublatticeColoringGenerator(
+            num_elements, num_color, [[0, 1, 2], [3, 4, 5]], [[1, 1, 1], None]
+        ),
+    ]
+    for cl_generator in cl_generators:
+        expected = [list(cl) for cl in cl_generator.yield_coloring()]
+        bounds = list(range(0, cl_generator.num_colorings, 17)) + [cl_generator.num_colorings]
+        actual = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            actual.extend(get_colorings_in_rank_range(cl_generator, start, stop))
+        assert actual == expected
+
+    # ranks beyond int64
+    cl_generator = ColoringGenerator(41, num_color)
+    stop = cl_generator.num_colorings
+    assert stop > np.iinfo(np.int64).max
+    actual = get_colorings_in_rank_range(cl_generator, stop - 3, stop)
+    assert actual == [cl_generator.unrank_coloring(rank) for rank in range(stop - 3, stop)]
+
+
+def test_tree_method():
+    structure = get_lattice("hcp")
+    num_type = 3
+    index = 3
+    num_sites = structure.num_sites * index
+    list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+        index, structure, return_symops=True
+    )
+    site_constraints = [[0, 1], [0, 1, 2]] * index
+    # images of valid colorings may be out of the coloring space
+    unequal_site_constraints = [[0, 1]] * index + [[1, 2]] * index
+    list_cl_generators = [
+        ColoringGenerator(num_sites, num_type),
+        ColoringGenerator(num_sites, num_type, site_constraints=site_constraints),
+        FixedConcentrationColoringGenerator(num_sites, num_type, [1, 2, 3]),
+        FixedConcentrationColoringGenerator(
+            num_sites, num_type, [1, 2, 3], site_constraints=site_constraints
+        ),
+        ColoringGenerator(num_sites, num_type, site_constraints=unequal_site_constraints),
+        FixedConcentrationColoringGenerator(
+            num_sites, num_type, [2, 2, 2], site_constraints=unequal_site_constraints
+        ),
+    ]
+    for hnf in list_reduced_HNF:
+        ds_permutation = DerivativeStructurePermutation(
+            hnf, structure.frac_coords, rotations, translations
+        )
+        permutation_group = ds_permutation.get_symmetry_operation_permutations()
+        for cl_generator in list_cl_generators:
+            for color_exchange in [True, False]:
+                expected = LexicographicColoringEnumerator(
+                    permutation_group, num_type, cl_generator, color_exchange=color_exchange
+                ).coset_enumerate()
+                actual = TreeColoringEnumerator(
+                    permutation_group, num_type, cl_generator, color_exchange=color_exchange
+                ).coset_enumerate()
+                assert actual == [list(cl) for cl in expected]
+
+                expected_direct = DirectColoringEnumerator(
+                    permutation_group, num_type, cl_generator, color_exchange=color_exchange
+                ).coset_enumerate()
+                assert actual == sorted(expected_direct)
+
+
+def test_composition_color_exchange():
+    structure = get_lattice("hcp")
+    num_type = 3
+    index = 3
+    num_sites = structure.num_sites * index
+    list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+        index, structure, return_symops=True
+    )
+    for ratio in [[1, 2, 3], [1, 1, 1], [1, 1, 4]]:
+        cl_generator = FixedConcentrationColoringGenerator(num_sites, num_type, ratio)
+        for hnf in list_reduced_HNF:
+            ds_permutation = DerivativeStructurePermutation(
+                hnf, structure.frac_coords, rotations, translations
+            )
+            permutation_group = ds_permutation.get_symmetry_operation_permutations()
+            expected = DirectColoringEnumerator(
+                permutation_group, num_type, cl_generator, color_exchange=True
+            ).coset_enumerate()
+            for clenum in [
+                LexicographicColoringEnumerator(permutation_group, num_type, cl_generator),
+                TreeColoringEnumerator(permutation_group, num_type, cl_generator),
+            ]:
+                assert clenum.coset_enumerate() == expected
+
+
+def test_list_based_color_exchange():
+    # listed colorings have compositions which are not related by permutations of colors
+    structure = get_lattice("fcc")
+    num_type = 3
+    index = 4
+    list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+        index, structure, return_symops=True
+    )
+    all_color_permutations = np.array(list(permutations(range(num_type))))
+    rng = np.random.default_rng(0)
+    list_list_colorings = [
+        [[1, 2, 2, 2], [0, 0, 1, 2], [1, 0, 2, 0], [2, 1, 0, 2], [2, 0, 2, 2]],
+    ]
+    for _ in range(3):
+        colorings = np.unique(rng.integers(num_type, size=(8, index)), axis=0)
+        list_list_colorings.append(colorings.tolist())
+
+    for hnf in list_reduced_HNF:
+        ds_permutation = DerivativeStructurePermutation(
+            hnf, structure.frac_coords, rotations, translations
+        )
+        permutation_group = np.array(ds_permutation.get_symmetry_operation_permutations())
+        for list_colorings in list_list_colorings:
+            # orbits counted by brute force over all images
+            canonical = set()
+            for cl in np.array(list_colorings):
+                images = all_color_permutations[:, cl[permutation_group]].reshape(-1, index)
+                canonical.add(min(map(tuple, images.tolist())))
+
+            for method in ["direct", "lexicographic"]:
+                actual = SiteColoringEnumerator(
+                    num_type,
+                    ds_permutation,
+                    ListBasedColoringGenerator(num_type, list_colorings),
+                    color_exchange=True,
+                    remove_superperiodic=False,
+                    remove_incomplete=False,
+                    method=method,
+                ).unique_colorings()
+                assert len(actual) == len(canonical)
+                assert all(cl in list_colorings for cl in actual)
+
+
+def test_valid_coloring_mask():
+    structure = get_lattice("fcc")
+    num_type = 3
+    index = 6
+    list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+        index, structure, return_symops=True
+    )
+    rng = np.random.default_rng(0)
+    for hnf in list_reduced_HNF:
+        ds_permutation = DerivativeStructurePermutation(
+            hnf, structure.frac_coords, rotations, translations
+        )
+        colorings = rng.integers(0, num_type, size=(256, index)).astype(np.int8)
+        translation_group = ds_permutation.get_translation_group()
+        for remove_superperiodic in [True, False]:
+            for remove_incomplete in [True, False]:
+                expected = []
+                for cl in colorings.tolist():
+                    incomplete = len(set(cl)) != num_type
+                    superperiodic = any(
+                        [cl == [cl[i] for i in prm] for prm in ds_permutation.prm_t[1:]]
+                    )
+                    expected.append(
+                        not (remove_incomplete and incomplete)
+                        and not (remove_superperiodic and superperiodic)
+                    )
+                actual = get_valid_coloring_mask(
+                    colorings,
+                    num_type,
+                    translation_group if remove_superperiodic else None,
+                    remove_incomplete,
+                )
+                assert actual.tolist() == expected
+
+
+def test_remove_superperiodic_in_search():
+    structure = get_lattice("hcp")
+    num_type = 3
+    index = 4
+    num_sites = structure.num_sites * index
+    list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+        index, structure, return_symops=True
+    )
+    site_constraints = [[0, 1], [0, 1, 2]] * index
+    for hnf in list_reduced_HNF:
+        ds_permutation = DerivativeStructurePermutation(
+            hnf, structure.frac_coords, rotations, translations
+        )
+        permutation_group = ds_permutation.get_symmetry_operation_permutations_array()
+        translation_group = ds_permutation.get_translation_group()
+        translation_indices = np.arange(1, translation_group.order) * len(
+            ds_permutation.prm_rigid_array
+        )
+        for use_all_colors in [True, False]:
+            for cl_generator in [
+                ColoringGenerator(num_sites, num_type, use_all_colors=use_all_colors),
+                ColoringGenerator(
+                    num_sites,
+                    num_type,
+                    site_constraints=site_constraints,
+                    use_all_colors=use_all_colors,
+                ),
+            ]:
+                for color_exchange in [True, False]:
+                    for enumerator_class in [DirectColoringEnumerator, TreeColoringEnumerator]:
+                        expected = [
+                            cl
+                            for cl in enumerator_class(
+                                permutation_group,
+                                num_type,
+                                ColoringGenerator(
+                                    num_sites,
+                                    num_type,
+                                    site_constraints=cl_generator.site_constraints,
+                                ),
+                                color_exchange=color_exchange,
+                            ).coset_enumerate()
+                            if not translation_group.is_superperiodic(np.array([cl]))[0]
+                            and (not use_all_colors or len(set(cl)) == num_type)
+                        ]
+                        actual = enumerator_class(
+                            permutation_group,
+                            num_type,
+                            cl_generator,
+                            color_exchange=color_exchange,
+                            translation_indices=translation_indices,
+                        ).coset_enumerate()
+                        assert [list(cl) for cl in actual] == [list(cl) for cl in expected]
+
+
+def test_sublattice_composition():
+    # rocksalt with cations 0, 1 and anions 2, 3
+    fcc = get_lattice("fcc")
+    structure = Structure(fcc.lattice, ["Na", "Cl"], [[0, 0, 0], [0.5, 0.5, 0.5]])
+    num_type = 4
+    index = 4
+    num_sites = structure.num_sites * index
+    base_site_constraints = [[0, 1], [2, 3]]
+    site_constraints = [[0, 1]] * index + [[2, 3]] * index
+    sublattices = [list(range(index)), list(range(index, 2 * index))]
+    anion_composition = [0, 0, 3, 1]
+
+    cl_generator = SublatticeColoringGenerator(
+        num_sites, num_type, sublattices, [None, anion_composition], site_constraints
+    )
+    cl_generator_all = ColoringGenerator(num_sites, num_type, site_constraints=site_constraints)
+
+    list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+        index, structure, return_symops=True
+    )
+    num_expected = 0
+    for hnf in list_reduced_HNF:
+        ds_permutation = DerivativeStructurePermutation(
+            hnf, structure.frac_coords, rotations, translations
+        )
+        expected = [
+            cl
+            for cl in SiteColoringEnumerator(
+                num_type, ds_permutation, cl_generator_all, color_exchange=False
+            ).unique_colorings()
+            if [cl[index:].count(c) for c in range(num_type)] == anion_composition
+        ]
+        num_expected += len(expected)
+        for method in ["direct", "lexicographic"]:
+            actual = SiteColoringEnumerator(
+                num_type, ds_permutation, cl_generator, color_exchange=False, method=method
+            ).unique_colorings()
+            assert sorted(actual) == sorted(expected)
+
+    se = StructureEnumerator(
+        structure,
+        index,
+        num_type,
+        composition_constraints=[None, [0, 0, 3, 1]],
+        base_site_constraints=base_site_constraints,
+        color_exchange=False,
+        base_sublattices=[[0], [1]],
+    )
+    assert len(se.generate()) == num_expected
+
+    # operations of hcp exchange the two sublattices, whose compositions differ
+    structure = get_lattice("hcp")
+    index = 2
+    num_sites = structure.num_sites * index
+    cl_generator = SublatticeColoringGenerator(
+        num_sites, 2, [list(range(index)), list(range(index, num_sites))], [[1, 1], [2, 0]]
+    )
+    list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+        index, structure, return_symops=True
+    )
+    for hnf in list_reduced_HNF:
+        ds_permutation = DerivativeStructurePermutation(
+            hnf, structure.frac_coords, rotations, translations
+        )
+        list_colorings = []
+        for method in ["direct", "lexicographic"]:
+            se = SiteColoringEnumerator(
+                2,
+                ds_permutation,
+                cl_generator,
+                color_exchange=False,
+                remove_superperiodic=False,
+                remove_incomplete=False,
+                method=method,
+            )
+            list_colorings.append(sorted(se.unique_colorings()))
+        assert list_colorings[0] == list_colorings[1] != []
+
+
+def test_sublattice_color_exchange():
+    # operations of hcp exchange the two sublattices
+    structure = get_lattice("hcp")
+    num_type = 3
+    all_color_permutations = np.array(list(permutations(range(num_type))))
+    # index, base_site_constraints, compositions, and the number of structures
+    settings = [
+        (2, [[0, 1], [1, 2]], [None, None], 16),
+        (4, None, [[2, 1, 1], [1, 2, 1]], 144),
+        (2, [[0, 1], [1, 2]], [[1, 1, 0], None], 10),
+    ]
+    for index, base_site_constraints, compositions, num_expected in settings:
+        num_sites = structure.num_sites * index
+        if base_site_constraints is None:
+            site_constraints = None
+        else:
+            site_constraints = [sc for sc in base_site_constraints for _ in range(index)]
+        cl_generator = SublatticeColoringGenerator(
+            num_sites,
+            num_type,
+            [list(range(index)), list(range(index, num_sites))],
+            compositions,
+            site_constraints,
+        )
+        list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+            index, structure, return_symops=True
+        )
+        for hnf in list_reduced_HNF:
+            ds_permutation = DerivativeStructurePermutation(
+                hnf, structure.frac_coords, rotations, translations
+            )
+            permutation_group = np.array(ds_permutation.get_symmetry_operation_permutations())
+            # orbits counted by brute force over all images
+            canonical = set()
+            for cl in np.array(list(cl_generator.yield_coloring())):
+                images = all_color_permutations[:, cl[permutation_group]].reshape(-1, num_sites)
+                canonical.add(min(map(tuple, images.tolist())))
+
+            for method in ["direct", "lexicographic"]:
+                actual = SiteColoringEnumerator(
+                    num_type,
+                    ds_permutation,
+                    cl_generator,
+                    remove_superperiodic=False,
+                    remove_incomplete=False,
+                    method=method,
+                ).unique_colorings()
+                assert len(actual) == len(canonical)
+
+        se = StructureEnumerator(
+            structure,
+            index,
+            num_type,
+            composition_constraints=compositions,
+            base_site_constraints=base_site_constraints,
+            base_sublattices=[[0], [1]],
+            remove_superperiodic=False,
+            remove_incomplete=False,
+        )
+        assert len(se.generate()) == num_expected
+
+
+def test_spectator_sites():
+    # rocksalt with cations 0, 1 and anion 2 fixed
+    fcc = get_lattice("fcc")
+    structure = Structure(fcc.lattice, ["Na", "Cl"], [[0, 0, 0], [0.5, 0.5, 0.5]])
+    num_type = 3
+    index = 4
+    base_site_constraints = [[0, 1], [2]]
+    site_constraints = [[0, 1]] * index + [[2]] * index
+
+    list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+        index, structure, return_symops=True
+    )
+    for method in ["direct", "lexicographic", "tree"]:
+        for color_exchange in [True, False]:
+            se = StructureEnumerator(
+                structure,
+                index,
+                num_type,
+                base_site_constraints=base_site_constraints,
+                color_exchange=color_exchange,
+                method=method,
+            )
+            assert se.spectator_base_sites == [1]
+            assert se.cl_generator.num_elements == index
+
+            for hnf in list_reduced_HNF:
+                ds_permutation = DerivativeStructurePermutation(
+                    hnf, structure.frac_coords, rotations, translations
+                )
+                expected = SiteColoringEnumerator(
+                    num_type,
+                    ds_permutation,
+                    ColoringGenerator(
+                        structure.num_sites * index, num_type, site_constraints=site_constraints
+                    ),
+                    color_exchange=color_exchange,
+                    method="direct",
+                ).unique_colorings()
+                actual, _ = se._enumerate_with_hnf(hnf, None, None)
+                assert sorted(actual) == sorted(expected)
+
+    # some HNFs have no colorings with the composition
+    se = StructureEnumerator(
+        structure,
+        index,
+        num_type,
+        composition_constraints=[1, 1, 2],
+        base_site_constraints=base_site_constraints,
+    )
+    list_num_colorings = []
+    for hnf in list_reduced_HNF:
+        ds_permutation = DerivativeStructurePermutation(
+            hnf, structure.frac_coords, rotations, translations
+        )
+        expected = SiteColoringEnumerator(
+            num_type,
+            ds_permutation,
+            FixedConcentrationColoringGenerator(
+                structure.num_sites * index, num_type, [2, 2, 4], site_constraints=site_constraints
+            ),
+        ).unique_colorings()
+        actual, _ = se._enumerate_with_hnf(hnf, None, None)
+        assert sorted(actual) == sorted(expected)
+        list_num_colorings.append(len(actual))
+    assert 0 in list_num_colorings
+
+    # spectators of hcp, whose color is exclusive or shared with the other sites
+    structure = get_lattice("hcp")
+    for base_site_constraints in [[[2], [0, 1]], [[0], [0, 1]]]:
+        for index in range(1, 3 + 1):
+            site_constraints = [sc for sc in base_site_constraints for _ in range(index)]
+            list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+                index, structure, return_symops=True
+            )
+            se = StructureEnumerator(
+                structure, index, num_type, base_site_constraints=base_site_constraints
+            )
+            assert se.spectator_base_sites == ([0] if base_site_constraints[0] == [2] else [])
+            for hnf in list_reduced_HNF:
+                ds_permutation = DerivativeStructurePermutation(
+                    hnf, structure.frac_coords, rotations, translations
+                )
+                expected = SiteColoringEnumerator(
+                    num_type,
+                    ds_permutation,
+                    ColoringGenerator(
+                        structure.num_sites * index, num_type, site_constraints=site_constraints
+                    ),
+                ).unique_colorings()
+                actual, _ = se._enumerate_with_hnf(hnf, None, None)
+                assert sorted(actual) == sorted(expected)
+
+    # spectators have more sites of color 2 than the composition
+    for method in ["direct", "tree"]:
+        for base_sublattices, composition_constraints in [
+            (None, [2, 1, 1]),
+            ([[0, 1]], [[2, 1, 1]]),
+        ]:
+            se = StructureEnumerator(
+                structure,
+                2,
+                num_type,
+                composition_constraints=composition_constraints,
+                base_site_constraints=[[2], [0, 1]],
+                base_sublattices=base_sublattices,
+                method=method,
+            )
+            assert se.generate() == []
+
+
+def test_site_constraints_moved_by_operations():
+    # two sites of hcp are equivalent, but allowed colors are different. Operations exchanging
+    # them still map some colorings to other ones
+    structure = get_lattice("hcp")
+    num_type = 3
+    index = 4
+    num_sites = structure.num_sites * index
+    site_constraints = [[0, 1]] * index + [[0, 1, 2]] * index
+    list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+        index, structure, return_symops=True
+    )
+    cl_generator = ColoringGenerator(num_sites, num_type, site_constraints=site_constraints)
+    for hnf in list_reduced_HNF:
+        ds_permutation = DerivativeStructurePermutation(
+            hnf, structure.frac_coords, rotations, translations
+        )
+        full_group = ds_permutation.get_symmetry_operation_permutations_array()
+        for color_exchange in [True, False]:
+            expected = sorted(
+                DirectColoringEnumerator(
+                    full_group, num_type, cl_generator, color_exchange=color_exchange
+                ).coset_enumerate()
+            )
+            for method in ["direct", "lexicographic", "tree"]:
+                se = SiteColoringEnumerator(
+                    num_type,
+                    ds_permutation,
+                    cl_generator,
+                    color_exchange=color_exchange,
+                    remove_superperiodic=False,
+                    remove_incomplete=False,
+                    method=method,
+                    use_stabilizer_chain=(method == "lexicographic"),
+                )
+                assert len(se.permutation_group) == len(full_group)
+                assert sorted(se.unique_colorings()) == expected
+
+    # counted by brute force over all colorings
+    for color_exchange, num_expected in [(False, 33), (True, 14)]:
+        for method in ["direct", "lexicographic", "tree"]:
+            se = StructureEnumerator(
+                structure,
+                2,
+                num_type,
+                base_site_constraints=[[0, 1], [0, 1, 2]],
+                color_exchange=color_exchange,
+                remove_incomplete=False,
+                method=method,
+            )
+            assert len(se.generate()) == num_expected
+
+
+def test_factorized_method():
+    # rocksalt with cations 0, 1 and anions 2, 3
+    fcc = get_lattice("fcc")
+    structure = Structure(fcc.lattice, ["Na", "Cl"], [[0, 0, 0], [0.5, 0.5, 0.5]])
+    num_type = 4
+    index = 4
+    num_sites = structure.num_sites * index
+    site_constraints = [[0, 1]] * index + [[2, 3]] * index
+    assert get_independent_factors(site_constraints, num_type) == [
+        (list(range(index)), [0, 1]),
+        (list(range(index, num_sites)), [2, 3]),
+    ]
+
+    list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+        index, structure, return_symops=True
+    )
+    list_cl_generators = [
+        ColoringGenerator(num_sites, num_type, site_constraints=site_constraints),
+        FixedConcentrationColoringGenerator(
+            num_sites, num_type, [1, 3, 2, 2], site_constraints=site_constraints
+        ),
+    ]
+    for hnf in list_reduced_HNF:
+        ds_permutation = DerivativeStructurePermutation(
+            hnf, structure.frac_coords, rotations, translations
+        )
+        for cl_generator in list_cl_generators:
+            for color_exchange in [True, False]:
+                expected = SiteColoringEnumerator(
+                    num_type, ds_permutation, cl_generator, color_exchange=color_exchange
+                ).unique_colorings()
+                sc_enum = SiteColoringEnumerator(
+                    num_type,
+                    ds_permutation,
+                    cl_generator,
+                    color_exchange=color_exchange,
+                    method="factorized",
+                )
+                actual = sc_enum.unique_colorings()
+                assert len(actual) == len(expected)
+
+                # representatives are not equivalent to each other
+                clenum = sc_enum.clenum
+                canonical = set()
+                for cl in np.array(actual):
+                    images = clenum.color_permutations[:, cl[sc_enum.permutation_group]]
+                    canonical.add(min(map(tuple, images.reshape(-1, num_sites).tolist())))
+                assert len(canonical) == len(actual)
+
+
+def test_factorized_method_with_moved_constraints():
+    # allowed colors are shared or exchanged by operations between equivalent sites of hcp
+    structure = get_lattice("hcp")
+    index = 3
+    num_sites = structure.num_sites * index
+    list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+        index, structure, return_symops=True
+    )
+    list_site_constraints = [
+        [[0, 1]] * index + [[1, 2]] * index,
+        [[0, 1]] * index + [[0, 1, 2]] * index,
+        [[0, 1]] * index + [[2, 3]] * index,
+    ]
+    for site_constraints in list_site_constraints:
+        num_type = max(max(sc) for sc in site_constraints) + 1
+        cl_generator = ColoringGenerator(num_sites, num_type, site_constraints=site_constraints)
+        for hnf in list_reduced_HNF:
+            ds_permutation = DerivativeStructurePermutation(
+                hnf, structure.frac_coords, rotations, translations
+            )
+            permutation_group = ds_permutation.get_symmetry_operation_permutations_array()
+            for color_exchange in [True, False]:
+                expected = DirectColoringEnumerator(
+                    permutation_group, num_type, cl_generator, color_exchange=color_exchange
+                ).coset_enumerate()
+                clenum = FactorizedColoringEnumerator(
+                    permutation_group, num_type, cl_generator, color_exchange=color_exchange
+                )
+                actual = clenum.coset_enumerate()
+                # representatives of the direct method have the smallest ranks in their orbits
+                assert sorted(clenum._get_orbit_key(cl) for cl in actual) == sorted(
+                    cl_generator.rank_colorings(np.array(expected)).tolist()
+                )
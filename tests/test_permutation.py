@@ -1,7 +1,14 @@
+import numpy as np
+
+from dsenum.enumerate import get_spectator_preserving_operations
 from dsenum.superlattice import generate_symmetry_distinct_superlattices
 from dsenum.utils import get_lattice
 
-from dsenum.permutation_group import DerivativeStructurePermutation, is_permutation_group
+from dsenum.permutation_group import (
+    DerivativeStructurePermutation,
+    is_permutation_group,
+    product_permutations,
+)
 
 
 def test_permutations():
@@ -26,3 +33,30 @@ def test_permutations():
                 assert is_permutation_group(dsperm.prm_t)
                 prm_all = dsperm.get_symmetry_operation_permutations()
                 assert is_permutation_group(prm_all)
+
+                prm_all_array = dsperm.get_symmetry_operation_permutations_array()
+                assert prm_all_array.dtype == np.int16
+                assert prm_all_array.flags.c_contiguous
+                assert prm_all_array.tolist() == [
+                    product_permutations(p1, p2) for p1 in dsperm.prm_t for p2 in dsperm.prm_rigid
+                ]
+
+
+def test_permutations_of_sublattice():
+    # a mirror plane fixes every site of one sublattice of hcp, and operations with and without
+    # it act in the same way on the sublattice
+    structure = get_lattice("hcp")
+    frac_coords = structure.frac_coords
+    for index in range(1, 4 + 1):
+        list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+            index, structure, return_symops=True
+        )
+        free_rotations, free_translations = get_spectator_preserving_operations(
+            frac_coords, rotations, translations, [0], [0]
+        )
+        for hnf in list_reduced_HNF:
+            dsperm = DerivativeStructurePermutation(
+                hnf, frac_coords[[1]], free_rotations, free_translations
+            )
+            prm_all_array = dsperm.get_symmetry_operation_permutations_array()
+            assert is_permutation_group(prm_all_array.tolist())
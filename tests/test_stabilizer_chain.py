@@ -0,0 +1,43 @@
+from itertools import permutations
+
+import numpy as np
+
+from dsenum.core import is_champion_batch, lexicographic_min_batch
+from dsenum.permutation_group import DerivativeStructurePermutation
+from dsenum.superlattice import generate_symmetry_distinct_superlattices
+from dsenum.utils import get_lattice
+
+
+def test_stabilizer_chain():
+    rng = np.random.default_rng(0)
+    for name, index, num_type in [("fcc", 8, 2), ("hcp", 4, 3), ("sc", 4, 2)]:
+        structure = get_lattice(name)
+        list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+            index, structure, return_symops=True
+        )
+        for hnf in list_reduced_HNF:
+            dsperm = DerivativeStructurePermutation(
+                hnf, structure.frac_coords, rotations, translations
+            )
+            chain = dsperm.get_stabilizer_chain()
+            prm_all = dsperm.get_symmetry_operation_permutations()
+            assert chain.order() == len(prm_all)
+            assert all(chain.contains(perm) for perm in prm_all)
+            assert list(chain.base) == sorted(chain.base)
+
+            num_sites = dsperm.num_sites
+            colorings = rng.integers(0, num_type, size=(64, num_sites)).astype(np.int8)
+            colorings = np.concatenate([colorings, np.sort(colorings, axis=1)])
+            permutation_array = np.array(prm_all, dtype=np.intp)
+            for color_permutations in [
+                np.arange(num_type, dtype=np.int8)[np.newaxis, :],
+                np.array(list(permutations(range(num_type))), dtype=np.int8),
+            ]:
+                assert np.array_equal(
+                    chain.is_champion_colorings(colorings, color_permutations),
+                    is_champion_batch(permutation_array, colorings, color_permutations),
+                )
+                assert np.array_equal(
+                    chain.lexicographic_min_images(colorings, color_permutations),
+                    lexicographic_min_batch(permutation_array, colorings, color_permutations),
+                )
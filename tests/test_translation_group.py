@@ -0,0 +1,45 @@
+import numpy as np
+
+from dsenum.core import is_champion_batch, lexicographic_min_batch
+from dsenum.permutation_group import DerivativeStructurePermutation
+from dsenum.superlattice import generate_symmetry_distinct_superlattices
+from dsenum.utils import get_lattice
+
+
+def test_translation_group():
+    rng = np.random.default_rng(0)
+    for name, index, num_type in [("fcc", 8, 2), ("hcp", 4, 3), ("sc", 6, 2)]:
+        structure = get_lattice(name)
+        list_reduced_HNF, rotations, translations = generate_symmetry_distinct_superlattices(
+            index, structure, return_symops=True
+        )
+        for hnf in list_reduced_HNF:
+            dsperm = DerivativeStructurePermutation(
+                hnf, structure.frac_coords, rotations, translations
+            )
+            tgroup = dsperm.get_translation_group()
+            prm_t = dsperm.prm_t_array
+            assert tgroup.order == len(prm_t)
+
+            colorings = rng.integers(0, num_type, size=(64, dsperm.num_sites)).astype(np.int8)
+            # periodic colorings along each site of parent lattice
+            colorings = np.concatenate(
+                [colorings, np.repeat(colorings[:8, : dsperm.num_sites_base], index, axis=1)]
+            )
+            for translation, perm in zip(tgroup.translations, prm_t):
+                assert np.array_equal(tgroup.act(colorings, translation), colorings[:, perm])
+
+            superperiodic = [
+                any(np.array_equal(cl[perm], cl) for perm in prm_t[1:]) for cl in colorings
+            ]
+            assert np.array_equal(tgroup.is_superperiodic(colorings), superperiodic)
+
+            identity = np.arange(num_type, dtype=np.int8)[np.newaxis, :]
+            assert np.array_equal(
+                tgroup.is_translation_champions(colorings),
+                is_champion_batch(np.array(prm_t, dtype=np.intp), colorings, identity),
+            )
+            assert np.array_equal(
+                tgroup.lexicographic_min_images(colorings),
+                lexicographic_min_batch(np.array(prm_t, dtype=np.intp), colorings, identity),
+            )